@@ -1,17 +1,26 @@
+import io
 import os
 import logging
 import queue
 import secrets
+import time
+from typing import Optional
 from flask import Flask, request, jsonify
 from dispatcher.constant import Language
 from dispatcher.dispatcher import Dispatcher
 from dispatcher import file_manager
+from dispatcher.fetcher import PendingSubmission, TestdataFetcher
+from dispatcher.meta import Meta
 from dispatcher.testdata import (
-    ensure_testdata,
+    TESTDATA_STORE,
+    TestdataNotFound,
     get_problem_meta,
-    get_problem_root,
+    is_testdata_fresh,
+    pin_testdata,
 )
 from dispatcher.config import (SANDBOX_TOKEN, SUBMISSION_DIR)
+from executor.pool import pool_stats, warm_up_pools
+from telemetry import arrivals, metrics, tracing
 
 logging.basicConfig(filename='logs/sandbox.log')
 app = Flask(__name__)
@@ -28,47 +37,243 @@ DISPATCHER_CONFIG = os.getenv(
     'DISPATCHER_CONFIG',
     '.config/dispatcher.json.example',
 )
-DISPATCHER = Dispatcher(DISPATCHER_CONFIG)
+SUBMISSION_CONFIG = os.getenv(
+    'SUBMISSION_CONFIG',
+    '.config/submission.json',
+)
+DISPATCHER = Dispatcher(DISPATCHER_CONFIG, SUBMISSION_CONFIG)
 DISPATCHER.start()
+warm_up_pools(SUBMISSION_CONFIG)
+
+QUEUE_FULL_RESPONSE = {
+    'status': 'err',
+    'msg': 'task queue is full now.\n'
+    'please wait a moment and re-send the submission.',
+    'data': None,
+}
+OK_RESPONSE = {
+    'status': 'ok',
+    'msg': 'ok',
+    'data': 'ok',
+}
+# a parked submission the queue has no room for waits again until it can
+# be queued, `RETRY_DELAY` seconds doubled on each retry up to
+# `MAX_RETRY_DELAY`
+RETRY_DELAY = float(os.getenv('PENDING_RETRY_DELAY', 1))
+MAX_RETRY_DELAY = float(os.getenv('PENDING_MAX_RETRY_DELAY', 30))
+# submissions parked at most, more are turned away like a full queue
+MAX_PENDING = int(os.getenv('MAX_PENDING', 256))
+
+
+def accept(
+    submission_id: str,
+    problem_id: int,
+    language: Language,
+    source,
+) -> Meta:
+    '''
+    extract a submission whose testdata is up to date and queue it,
+    return the meta it was extracted with
+    '''
+    with pin_testdata(problem_id) as testdata, tracing.span('extract'):
+        meta = get_problem_meta(problem_id, language, testdata)
+        file_manager.extract(
+            root_dir=SUBMISSION_DIR,
+            job_id=submission_id,
+            meta=meta,
+            source=source,
+            testdata=testdata.root,
+            digest=testdata.digest,
+        )
+    logger.debug(f'send submission {submission_id} to dispatcher')
+    with tracing.span('dispatcher.handle'):
+        DISPATCHER.handle(
+            job_id=submission_id,
+            submission_id=submission_id,
+            meta=meta,
+        )
+    return meta
+
+
+def release_pending(pending: PendingSubmission):
+    with tracing.activate(pending.trace):
+        try:
+            accept(
+                pending.submission_id,
+                pending.problem_id,
+                pending.language,
+                io.BytesIO(pending.source),
+            )
+        except TestdataNotFound:
+            # evicted since it was synced, sync it again
+            retry_pending(pending, 0)
+        except queue.Full:
+            # extracted again on the next try
+            clean_pending(pending)
+            retry_pending(pending, retry_delay(pending.retries))
+        except Exception as e:
+            reject_pending(pending, e)
+
+
+def retry_delay(retries: int) -> float:
+    # the exponent is bounded so it never overflows
+    return min(RETRY_DELAY * 2**min(retries, 32), MAX_RETRY_DELAY)
+
+
+def retry_pending(pending: PendingSubmission, delay: float):
+    logger.info(f'submission {pending.submission_id} waits again '
+                f'[retries={pending.retries}, delay={delay}]')
+    pending.retries += 1
+    FETCHER.wait_for(pending, delay)
+
+
+def clean_pending(pending: PendingSubmission):
+    try:
+        file_manager.clean_data(pending.submission_id)
+    except FileNotFoundError:
+        pass
+
+
+def reject_pending(pending: PendingSubmission, error: Exception):
+    '''
+    the submission was answered when it was parked, report it as JE so
+    backend does not wait for it forever
+    '''
+    logger.error(f'reject submission {pending.submission_id} '
+                 f'[problem_id={pending.problem_id}]: {error!r}')
+    try:
+        tasks = get_problem_meta(pending.problem_id, pending.language).tasks
+    except Exception as e:
+        logger.warning(f'report submission {pending.submission_id} '
+                       f'without cases: {e!r}')
+        tasks = []
+    DISPATCHER.reject(
+        job_id=pending.submission_id,
+        submission_id=pending.submission_id,
+        tasks=tasks,
+        trace=pending.trace,
+    )
+
+
+def record_arrival(
+    problem_id: int,
+    language: Language,
+    source,
+    received_at: float,
+    outcome: str,
+    meta: Optional[Meta] = None,
+):
+    '''
+    log what was done with an arriving submission, the case counts are
+    taken from the testdata on disk if `meta` is not given
+    '''
+    if not arrivals.enabled():
+        return
+    if meta is None:
+        try:
+            with pin_testdata(problem_id) as testdata:
+                meta = get_problem_meta(problem_id, language, testdata)
+        except (OSError, ValueError):
+            # never synced, evicted or a broken meta
+            pass
+    case_counts = None
+    if meta is not None:
+        case_counts = [task.caseCount for task in meta.tasks]
+    source.seek(0, io.SEEK_END)
+    arrivals.record(
+        problem_id=problem_id,
+        language=language,
+        case_counts=case_counts,
+        source_size=source.tell(),
+        outcome=outcome,
+        received_at=received_at,
+    )
+
+
+# sync stale testdata without holding a request thread
+FETCHER = TestdataFetcher(on_ready=release_pending, on_failed=reject_pending)
 
 
 @app.post('/submit/<submission_id>')
 def submit(submission_id: str):
+    # the root span of the submission's trace
+    with tracing.span('submit', submission_id=submission_id):
+        return receive(submission_id)
+
+
+def receive(submission_id: str):
+    received_at = time.time()
     token = request.values.get('token', '')
     if not secrets.compare_digest(token, SANDBOX_TOKEN):
         logger.debug(f'get invalid token: {token}')
         return 'invalid token', 403
-    # Ensure the testdata is up to data
     problem_id = request.form.get('problem_id', type=int)
     if problem_id is None:
         return 'missing problen id', 400
-    ensure_testdata(problem_id)
     language = Language(request.form.get('language', type=int))
+    source = request.files['src']
+    outcome, meta, response = admit(
+        submission_id,
+        problem_id,
+        language,
+        source,
+    )
+    record_arrival(problem_id, language, source, received_at, outcome, meta)
+    return response
+
+
+def admit(
+    submission_id: str,
+    problem_id: int,
+    language: Language,
+    source,
+):
+    '''
+    queue a submission, or park it if its testdata may be stale. return
+    the outcome logged to `arrivals`, the meta if it was queued and the
+    response
+    '''
     try:
-        file_manager.extract(
-            root_dir=SUBMISSION_DIR,
-            job_id=submission_id,
-            meta=get_problem_meta(problem_id, language),
-            source=request.files['src'],
-            testdata=get_problem_root(problem_id),
-        )
+        file_manager.check_source(source, language)
     except ValueError as e:
-        return str(e), 400
-    logger.debug(f'send submission {submission_id} to dispatcher')
-    try:
-        DISPATCHER.handle(job_id=submission_id, submission_id=submission_id)
-    except queue.Full:
-        return jsonify({
-            'status': 'err',
-            'msg': 'task queue is full now.\n'
-            'please wait a moment and re-send the submission.',
-            'data': None,
-        }), 500
-    return jsonify({
-        'status': 'ok',
-        'msg': 'ok',
-        'data': 'ok',
-    })
+        return arrivals.REJECTED, None, (str(e), 400)
+    if is_testdata_fresh(problem_id):
+        try:
+            meta = accept(
+                submission_id,
+                problem_id,
+                language,
+                source,
+            )
+        except TestdataNotFound:
+            # evicted since it was checked
+            pass
+        except ValueError as e:
+            return arrivals.REJECTED, None, (str(e), 400)
+        except queue.Full:
+            return arrivals.QUEUE_FULL, None, (
+                jsonify(QUEUE_FULL_RESPONSE),
+                500,
+            )
+        else:
+            return arrivals.ACCEPTED, meta, jsonify(OK_RESPONSE)
+    # the testdata may be stale, wait for it in background
+    if DISPATCHER.queue.full() or FETCHER.waiting_count() >= MAX_PENDING:
+        return arrivals.QUEUE_FULL, None, (
+            jsonify(QUEUE_FULL_RESPONSE),
+            500,
+        )
+    logger.debug(f'submission {submission_id} waits for testdata')
+    source.seek(0)
+    FETCHER.wait_for(
+        PendingSubmission(
+            submission_id=submission_id,
+            problem_id=problem_id,
+            language=language,
+            source=source.read(),
+            trace=tracing.current(),
+        ))
+    return arrivals.PARKED, None, jsonify(OK_RESPONSE)
 
 
 @app.get('/status')
@@ -85,5 +290,16 @@ def status():
             'maxContainerCount': DISPATCHER.MAX_TASK_COUNT,
             'submissions': [*DISPATCHER.result.keys()],
             'running': DISPATCHER.do_run,
+            'containerPool': pool_stats(),
+            'compileCache': DISPATCHER.compile_cache.stats(),
+            'waitingForTestdata': FETCHER.waiting_count(),
+            'testdataStore': TESTDATA_STORE.stats(),
         })
     return jsonify(ret), 200
+
+
+@app.get('/metrics')
+def export_metrics():
+    return metrics.REGISTRY.render(), 200, {
+        'Content-Type': metrics.CONTENT_TYPE,
+    }
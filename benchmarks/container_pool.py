@@ -0,0 +1,87 @@
+'''
+Measure what a pooled container saves per case, and what its reset costs.
+
+"fresh" creates, starts, waits for and removes a container running `true`,
+what every case pays without the pool. "pooled" execs `true` in a started
+container, "reset" runs `RESET_SCRIPT` in it, and "full walk" is the
+`find / -xdev -user <sandbox uid>` the reset used to end with, shown for
+comparison. The pool only pays off while pooled + reset stays well under
+fresh. Needs the docker daemon and the sandbox image.
+
+    python -m benchmarks.container_pool --image noj-c-cpp --cases 50
+'''
+import argparse
+import statistics
+import time
+
+from executor.client import get_client
+from executor.config import DEFAULT_PATH, load_config
+from executor.pool import RESET_TIMEOUT, SANDBOX_UID, ContainerPool
+
+FULL_WALK = f'find / -xdev -user {SANDBOX_UID} -delete'
+
+
+def measure(run, cases: int):
+    costs = []
+    for _ in range(cases):
+        start = time.perf_counter()
+        run()
+        costs.append((time.perf_counter() - start) * 1e3)
+    return costs
+
+
+def report(name: str, costs):
+    print(f'{name:<10} p50 {statistics.median(costs):8.1f} ms   '
+          f'mean {statistics.mean(costs):8.1f} ms')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--image', default='noj-c-cpp')
+    parser.add_argument('--cases', type=int, default=50)
+    parser.add_argument('--config', default=DEFAULT_PATH)
+    args = parser.parse_args()
+
+    try:
+        client = get_client(load_config(args.config).docker_url)
+        client.inspect_image(args.image)
+    except Exception as e:
+        print(f'skip: {e}')
+        return
+
+    def fresh():
+        container = client.create_container(
+            image=args.image,
+            command='true',
+            network_disabled=True,
+        )
+        client.start(container)
+        client.wait(container)
+        client.remove_container(container, v=True, force=True)
+
+    report('fresh', measure(fresh, args.cases))
+    pool = ContainerPool(client, args.image, size=1, max_uses=args.cases)
+    container = pool.create()
+    try:
+        report(
+            'pooled',
+            measure(
+                lambda: pool.exec(container, 'true', RESET_TIMEOUT),
+                args.cases,
+            ),
+        )
+        report('reset', measure(lambda: pool.reset(container), args.cases))
+        report(
+            'full walk',
+            measure(
+                lambda: pool.exec(container, FULL_WALK, RESET_TIMEOUT),
+                args.cases,
+            ),
+        )
+    finally:
+        pool.destroy(container)
+        pool.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,133 @@
+'''
+Measure how long the dispatcher takes to hand a ready case to an executor.
+
+The executor is replaced by a fake one which only sleeps, so this runs
+without docker. Each case's dispatch latency is the time between the moment
+it became runnable (its job was handled, or the single container slot was
+freed by the previous case) and the moment its executor started.
+
+    python -m benchmarks.dispatch_latency --jobs 20 --cases 10
+'''
+import argparse
+import json
+import shutil
+import statistics
+import tempfile
+import threading
+import time
+from pathlib import Path
+from unittest import mock
+
+from dispatcher.constant import Language
+from dispatcher.dispatcher import Dispatcher
+
+
+class Timeline:
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        # List[Tuple[start, end]]
+        self.runs = []
+
+
+def make_executor(timeline: Timeline, run_duration: float):
+
+    class TimedExecutor:
+
+        def __init__(self, job_id, *args, **kwargs):
+            self.job_id = job_id
+
+        def compile(self):
+            return {'Status': 'AC'}
+
+        def run(self):
+            start = time.perf_counter()
+            time.sleep(run_duration)
+            end = time.perf_counter()
+            with timeline.lock:
+                timeline.runs.append((start, end))
+            return {'Status': 'AC'}
+
+    return TimedExecutor
+
+
+def write_job(root: Path, job_id: str, case_count: int):
+    job_dir = root / job_id
+    (job_dir / 'src').mkdir(parents=True)
+    (job_dir / 'testcase').mkdir()
+    task = {
+        'taskScore': 100,
+        'memoryLimit': 65536,
+        'timeLimit': 1000,
+        'caseCount': case_count,
+    }
+    meta = {'language': int(Language.PY), 'tasks': [task]}
+    (job_dir / 'meta.json').write_text(json.dumps(meta))
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--jobs', type=int, default=20)
+    parser.add_argument('--cases', type=int, default=10)
+    parser.add_argument(
+        '--run-ms',
+        type=float,
+        default=1,
+        help='time spent by the fake executor per case',
+    )
+    args = parser.parse_args()
+
+    timeline = Timeline()
+    root = Path(tempfile.mkdtemp())
+    try:
+        with mock.patch(
+                'dispatcher.dispatcher.SubmissionExecutor',
+                make_executor(timeline, args.run_ms / 1000),
+        ):
+            d = Dispatcher()
+            d.testing = True
+            d.SUBMISSION_DIR = root
+            # a single slot makes "the slot was freed" well defined
+            d.MAX_CONTAINER_SIZE = 1
+            d.container_slots = threading.BoundedSemaphore(1)
+            d.queue.maxsize = args.jobs * args.cases
+            d.start()
+            # let the loop go idle before the first job arrives
+            time.sleep(0.1)
+            total = args.jobs * args.cases
+            handled_at = []
+            for i in range(args.jobs):
+                job_id = f'bench-{i}'
+                write_job(root, job_id, args.cases)
+                handled_at.append(time.perf_counter())
+                d.handle(job_id=job_id, submission_id=job_id)
+            while True:
+                with timeline.lock:
+                    if len(timeline.runs) == total:
+                        break
+                time.sleep(0.001)
+            d.stop()
+    finally:
+        shutil.rmtree(root)
+
+    runs = sorted(timeline.runs)
+    # cases are dispatched in submission order
+    latencies = []
+    prev_end = 0
+    for i, (start, end) in enumerate(runs):
+        ready = max(handled_at[i // args.cases], prev_end)
+        latencies.append((start - ready) * 1e6)
+        prev_end = end
+    print(f'cases:  {total}')
+    print(f'p50:    {statistics.median(latencies):.1f} us')
+    print(f'p99:    {percentile(latencies, 0.99):.1f} us')
+    print(f'max:    {max(latencies):.1f} us')
+
+
+if __name__ == '__main__':
+    main()
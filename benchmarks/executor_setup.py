@@ -0,0 +1,72 @@
+'''
+Measure the per-case cost of setting up an executor.
+
+"before" is what every case used to pay: read and parse
+`.config/submission.json` and open a new docker client, which connects to
+the daemon and asks for its API version. "after" takes the cached config
+and the shared client. Both then make one cheap API call, so connection
+reuse is part of the measurement. The client part is skipped if the docker
+daemon can not be reached.
+
+    python -m benchmarks.executor_setup --cases 200
+'''
+import argparse
+import json
+import statistics
+import time
+
+import docker
+
+from executor.client import get_client
+from executor.config import DEFAULT_PATH, load_config
+
+
+def measure(setup, cases: int):
+    costs = []
+    for _ in range(cases):
+        start = time.perf_counter()
+        setup()
+        costs.append((time.perf_counter() - start) * 1e6)
+    return costs
+
+
+def report(name: str, costs):
+    print(f'{name:<16} p50 {statistics.median(costs):9.1f} us   '
+          f'mean {statistics.mean(costs):9.1f} us')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--cases', type=int, default=200)
+    parser.add_argument('--config', default=DEFAULT_PATH)
+    args = parser.parse_args()
+
+    def read_config():
+        with open(args.config) as f:
+            return json.load(f)
+
+    report('config before', measure(read_config, args.cases))
+    report('config after', measure(lambda: load_config(args.config),
+                                   args.cases))
+
+    docker_url = load_config(args.config).docker_url
+    try:
+        get_client(docker_url).ping()
+    except Exception as e:
+        print(f'skip docker client: {e}')
+        return
+
+    def new_client():
+        client = docker.APIClient(base_url=read_config()['docker_url'])
+        client.ping()
+        client.close()
+
+    def shared_client():
+        get_client(load_config(args.config).docker_url).ping()
+
+    report('client before', measure(new_client, args.cases))
+    report('client after', measure(shared_client, args.cases))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,108 @@
+'''
+Measure how long creating a job directory takes for each testdata
+workspace mode, and how much data it writes.
+
+A problem with `--cases` cases of `--size` bytes each is generated in a
+temporary directory (put it on the filesystem under test with `--dir`),
+then `file_manager.extract` runs `--rounds` times per mode. Written bytes
+come from `/proc/self/io` and are only reported on Linux. A reflink falls
+back to a copy where the filesystem can not clone files.
+
+    python -m benchmarks.extract_testdata --cases 50 --size 4M
+'''
+import argparse
+import io
+import os
+import shutil
+import statistics
+import tempfile
+import time
+from pathlib import Path
+from zipfile import ZipFile
+
+from benchmarks.result_archive import parse_size
+from dispatcher import file_manager
+from dispatcher.constant import Language
+from dispatcher.meta import Meta
+
+
+def written_bytes() -> int:
+    try:
+        with open('/proc/self/io') as f:
+            for line in f:
+                key, value = line.split(':')
+                if key == 'write_bytes':
+                    return int(value)
+    except OSError:
+        pass
+    return 0
+
+
+def make_problem(root: Path, cases: int, size: int):
+    root.mkdir()
+    for i in range(cases):
+        data = os.urandom(size)
+        (root / f'00{i:02d}.in').write_bytes(data)
+        (root / f'00{i:02d}.out').write_bytes(data)
+
+
+def make_source() -> io.BytesIO:
+    buf = io.BytesIO()
+    with ZipFile(buf, 'w') as zf:
+        zf.writestr('main.c', 'int main() {}')
+    buf.seek(0)
+    return buf
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--cases', type=int, default=50)
+    parser.add_argument('--size', type=parse_size, default=4 << 20)
+    parser.add_argument('--rounds', type=int, default=5)
+    parser.add_argument('--dir', default=None)
+    args = parser.parse_args()
+
+    meta = Meta(
+        language=Language.C,
+        tasks=[{
+            'taskScore': 100,
+            'memoryLimit': 65536,
+            'timeLimit': 1000,
+            'caseCount': args.cases,
+        }],
+    )
+    work = Path(tempfile.mkdtemp(dir=args.dir))
+    try:
+        problem = work / 'problem'
+        make_problem(problem, args.cases, args.size)
+        submissions = work / 'submissions'
+        submissions.mkdir()
+        total = 2 * args.cases * args.size
+        print(f'testdata: {total / (1 << 20):.1f} MiB')
+        for mode in file_manager.WORKSPACE_MODES:
+            costs = []
+            writes = []
+            for i in range(args.rounds):
+                job_id = f'{mode}-{i}'
+                before = written_bytes()
+                start = time.perf_counter()
+                file_manager.extract(
+                    root_dir=submissions,
+                    job_id=job_id,
+                    meta=meta,
+                    source=make_source(),
+                    testdata=problem,
+                    mode=mode,
+                )
+                os.sync()
+                costs.append((time.perf_counter() - start) * 1e3)
+                writes.append(written_bytes() - before)
+                shutil.rmtree(submissions / job_id)
+            print(f'{mode:<9} p50 {statistics.median(costs):9.2f} ms   '
+                  f'written {statistics.median(writes) / (1 << 20):8.2f} MiB')
+    finally:
+        shutil.rmtree(work)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,314 @@
+'''
+Replay submissions recorded with `ARRIVAL_FILE` against `app`.
+
+Every recorded problem is served by a local `tests.backend_stub` with
+generated testdata of the recorded case counts, and every submission is
+an echo program padded to the recorded source size. Arrivals are sent at
+their recorded offsets divided by `--speed`, so a contest start can be
+re-driven as it happened or squeezed into a sharper burst. Docker is
+replaced by `tests.fake_docker` unless `--docker` is given, and redis by
+fakeredis unless `--redis` is.
+
+A submission's latency runs from sending it to backend receiving its
+result. Run it once per dispatcher config to compare them:
+
+    ARRIVAL_FILE=arrivals.jsonl gunicorn app:app ...
+    python -m benchmarks.replay arrivals.jsonl --speed 4 \\
+        --config .config/dispatcher.json.example
+'''
+import argparse
+import io
+import json
+import os
+import shutil
+import statistics
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack
+from pathlib import Path
+from typing import Optional
+from unittest import mock
+from zipfile import ZIP_STORED, ZipFile
+
+import fakeredis
+
+from telemetry import arrivals
+from tests.backend_stub import BackendStub
+from tests.fake_docker import FakeAPIClient, Latency, patch_client
+
+# programs copying stdin to stdout, so every answer is its input
+ECHO_SOURCES = (
+    ('main.c', '#include <stdio.h>\n'
+     'int main() { int c; while ((c = getchar()) != EOF) putchar(c); }\n',
+     '//'),
+    ('main.cpp', '#include <cstdio>\n'
+     'int main() { int c; while ((c = getchar()) != EOF) putchar(c); }\n',
+     '//'),
+    ('main.py', 'import sys\nsys.stdout.write(sys.stdin.read())\n', '#'),
+)
+
+
+def echo(stdin_path: Optional[Path]) -> str:
+    '''
+    what an echo program prints, answers are not kept next to the inputs
+    when the sandbox has their digests
+    '''
+    return '' if stdin_path is None else stdin_path.read_text()
+
+
+class TimedBackend(BackendStub):
+    '''
+    a backend stub recording when each submission was completed
+    '''
+
+    def __init__(self):
+        super().__init__()
+        # type: Dict[submission_id, completed_at]
+        self.completed_at = {}
+        self.expected = None
+        self.all_done = threading.Event()
+
+    def handle_put(self, path: str, body: dict) -> int:
+        status = super().handle_put(path, body)
+        now = time.perf_counter()
+        with self.lock:
+            for submission_id in self.completed:
+                self.completed_at.setdefault(submission_id, now)
+            if self.expected is not None \
+                    and self.expected <= self.completed.keys():
+                self.all_done.set()
+        return status
+
+    def expect(self, submission_ids):
+        with self.lock:
+            self.expected = {*submission_ids}
+            if self.expected <= self.completed.keys():
+                self.all_done.set()
+
+
+class LocalRedis(fakeredis.FakeStrictRedis):
+    '''
+    fakeredis with locks held in this process, its own locks need lua
+    '''
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # type: Dict[name, threading.Lock]
+        self.locks = {}
+
+    def lock(self, name, **kwargs):
+        return self.locks.setdefault(name, threading.Lock())
+
+
+def make_testdata(problem_id: int, case_counts) -> bytes:
+    buf = io.BytesIO()
+    with ZipFile(buf, 'w') as zf:
+        for i, count in enumerate(case_counts):
+            for j in range(count):
+                content = f'{problem_id} {i} {j}\n'
+                zf.writestr(f'{i:02d}{j:02d}.in', content)
+                zf.writestr(f'{i:02d}{j:02d}.out', content)
+    return buf.getvalue()
+
+
+def make_meta(language: int, case_counts) -> dict:
+    scores = [100 // len(case_counts)] * len(case_counts)
+    scores[-1] += 100 - sum(scores)
+    return {
+        'language':
+        language,
+        'tasks': [{
+            'taskScore': score,
+            'memoryLimit': 65536,
+            'timeLimit': 1000,
+            'caseCount': count,
+        } for score, count in zip(scores, case_counts)],
+    }
+
+
+def make_source(language: int, size: int) -> bytes:
+    '''
+    an echo program zipped to about `size` bytes
+    '''
+    name, code, comment = ECHO_SOURCES[language]
+    buf = io.BytesIO()
+    with ZipFile(buf, 'w', ZIP_STORED) as zf:
+        zf.writestr(name, code)
+    # stored without compression, the padding adds its own size
+    padding = size - len(buf.getvalue()) - len(comment) - 1
+    if padding > 0:
+        code += f'{comment}{"x" * padding}\n'
+        buf = io.BytesIO()
+        with ZipFile(buf, 'w', ZIP_STORED) as zf:
+            zf.writestr(name, code)
+    return buf.getvalue()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('arrivals', help='a file written via ARRIVAL_FILE')
+    parser.add_argument(
+        '--speed',
+        type=float,
+        default=1,
+        help='replay this many times faster than recorded',
+    )
+    parser.add_argument(
+        '--config',
+        default='.config/dispatcher.json.example',
+        help='the dispatcher config to replay against',
+    )
+    parser.add_argument(
+        '--clients',
+        type=int,
+        default=32,
+        help='requests handled at once, like the gunicorn threads',
+    )
+    parser.add_argument('--timeout', type=float, default=600)
+    parser.add_argument(
+        '--docker',
+        action='store_true',
+        help='run submissions in the real docker daemon',
+    )
+    parser.add_argument('--redis', help='url of a real redis server')
+    Latency.add_arguments(parser)
+    args = parser.parse_args()
+
+    loaded = arrivals.load(args.arrivals)
+    # turned away arrivals are sent too, they are part of the burst
+    recorded = arrivals.replayable(loaded)
+    if not recorded:
+        parser.error(f'no arrival to replay in {args.arrivals}')
+    # the replay is not recorded again
+    arrivals.set_sink(None)
+    work = Path(tempfile.mkdtemp()).absolute()
+    with TimedBackend() as backend, ExitStack() as stack:
+        stack.callback(shutil.rmtree, work)
+        for arrival in recorded:
+            if arrival['problemId'] not in backend.problems:
+                backend.add_problem(
+                    arrival['problemId'],
+                    make_testdata(arrival['problemId'], arrival['caseCounts']),
+                    make_meta(arrival['language'], arrival['caseCounts']),
+                )
+        # the executor reads inputs from the host path of submissions
+        submission_config = json.loads(
+            Path('.config/submission.json').read_text())
+        submission_config['working_dir'] = str(work / 'submissions')
+        (work / 'submission.json').write_text(json.dumps(submission_config))
+        # the sandbox reads these when it is imported
+        os.environ.update({
+            'BACKEND_API': backend.url,
+            'DISPATCHER_CONFIG': args.config,
+            'SUBMISSION_CONFIG': str(work / 'submission.json'),
+            'TESTDATA_ROOT': str(work / 'testdata'),
+            'SUBMISSION_DIR': str(work / 'submissions'),
+            'SUBMISSION_BACKUP_DIR': str(work / 'submissions.bk'),
+            'COMPILE_CACHE_DIR': str(work / 'compile-cache'),
+        })
+        if args.redis:
+            os.environ['REDIS_URL'] = args.redis
+        else:
+            redis = LocalRedis()
+            stack.enter_context(
+                mock.patch(
+                    'dispatcher.testdata.get_redis_client',
+                    lambda: redis,
+                ))
+        client = None
+        if not args.docker:
+            client = FakeAPIClient(Latency.from_args(args), output=echo)
+            stack.enter_context(patch_client(client))
+        # anything importing the dispatcher reads the environment above
+        import app
+        from benchmarks.dispatch_latency import percentile
+        from dispatcher.config import SANDBOX_TOKEN
+        stack.callback(app.FETCHER.shutdown)
+        stack.callback(app.DISPATCHER.stop)
+
+        sent_at = {}
+        responses = {}
+        lags = []
+
+        def send(submission_id: str, arrival: dict):
+            sent_at[submission_id] = time.perf_counter()
+            response = app.app.test_client().post(
+                f'/submit/{submission_id}',
+                data={
+                    'token':
+                    SANDBOX_TOKEN,
+                    'problem_id':
+                    arrival['problemId'],
+                    'language':
+                    arrival['language'],
+                    'src': (
+                        io.BytesIO(
+                            make_source(
+                                arrival['language'],
+                                arrival['sourceSize'],
+                            )),
+                        'src.zip',
+                    ),
+                },
+            )
+            responses[submission_id] = response.status_code
+
+        first = recorded[0]['receivedAt']
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=args.clients) as pool:
+            for i, arrival in enumerate(recorded):
+                due = start + (arrival['receivedAt'] - first) / args.speed
+                delay = due - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+                lags.append(max(0, time.perf_counter() - due))
+                pool.submit(send, f'replay-{i:06d}', arrival)
+        accepted = [
+            submission_id for submission_id, status in responses.items()
+            if status == 200
+        ]
+        backend.expect(accepted)
+        finished = backend.all_done.wait(args.timeout)
+        elapsed = time.perf_counter() - start
+        with backend.lock:
+            completed = {**backend.completed}
+            latencies = [
+                (backend.completed_at[submission_id] - sent_at[submission_id])
+                * 1e3 for submission_id in accepted
+                if submission_id in backend.completed_at
+            ]
+
+    statuses = {}
+    for tasks in completed.values():
+        for case in (case for task in tasks for case in task):
+            statuses[case['status']] = statuses.get(case['status'], 0) + 1
+    responded = {}
+    for status in responses.values():
+        responded[status] = responded.get(status, 0) + 1
+    span = recorded[-1]['receivedAt'] - first
+    outcomes = {}
+    for arrival in loaded:
+        outcome = arrival.get('outcome', arrivals.ACCEPTED)
+        outcomes[outcome] = outcomes.get(outcome, 0) + 1
+    print(f'arrivals:    {len(recorded)} over {span:.2f} s, '
+          f'replayed at {args.speed}x')
+    print(f'recorded:    {outcomes}, '
+          f'{len(loaded) - len(recorded)} not replayed')
+    print(f'responses:   {responded}')
+    print(f'completed:   {len(latencies)} in {elapsed:.2f} s'
+          f'{"" if finished else " (timed out)"}')
+    print(f'cases:       {statuses}')
+    if latencies:
+        print(f'p50:         {statistics.median(latencies):.1f} ms')
+        print(f'p99:         {percentile(latencies, 0.99):.1f} ms')
+        print(f'max:         {max(latencies):.1f} ms')
+    print(f'send lag:    {max(lags) * 1e3:.1f} ms at most')
+    if client is not None:
+        print(f'containers:  {client.created} created, '
+              f'{client.peak_containers} at once')
+
+
+if __name__ == '__main__':
+    main()
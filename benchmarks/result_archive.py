@@ -0,0 +1,125 @@
+'''
+Measure how long reading the result files of a case back from docker takes.
+
+"before" is the old way: write the archive to a temporary file, extract it
+into a temporary directory and open every file again. "after" is
+`Sandbox.get_result`, which parses the archive while it streams. The
+archive is built in memory and handed out in chunks of the size docker-py
+streams by default, so this runs without docker.
+
+    python -m benchmarks.result_archive --sizes 1K 1M 64M
+'''
+import argparse
+import io
+import statistics
+import tarfile
+import tempfile
+import time
+from pathlib import Path
+
+import docker
+
+from executor.config import DEFAULT_RESULT_MAX_BYTES
+from executor.sandbox import Sandbox
+
+CHUNK_SIZE = docker.constants.DEFAULT_DATA_CHUNK_SIZE
+FILENAMES = ['result', 'stdout', 'stderr']
+
+
+def parse_size(size: str) -> int:
+    units = {'K': 1 << 10, 'M': 1 << 20, 'G': 1 << 30}
+    if size[-1].upper() in units:
+        return int(size[:-1]) * units[size[-1].upper()]
+    return int(size)
+
+
+def make_archive(stdout_size: int) -> bytes:
+    buf = io.BytesIO()
+    files = {
+        'result': b'AC\nExited Normally\n1\n2\n',
+        'stdout': b'1234567\n' * (stdout_size // 8),
+        'stderr': b'',
+    }
+    with tarfile.open(fileobj=buf, mode='w') as tar:
+        for name, data in files.items():
+            info = tarfile.TarInfo(f'result/{name}')
+            info.size = len(data)
+            tar.addfile(info, io.BytesIO(data))
+    return buf.getvalue()
+
+
+class StreamClient:
+
+    def __init__(self, archive: bytes):
+        self.archive = archive
+
+    def get_archive(self, container, path):
+        data = self.archive
+        chunks = (data[i:i + CHUNK_SIZE]
+                  for i in range(0, len(data), CHUNK_SIZE))
+        return chunks, {}
+
+
+def legacy_get_result(client, container, filenames):
+    result_dir = '/result'
+    bits, _ = client.get_archive(container, result_dir)
+    with (tempfile.NamedTemporaryFile() as
+          tarball, tempfile.TemporaryDirectory() as extract_path):
+        for chunk in bits:
+            tarball.write(chunk)
+        tarball.flush()
+        tarball.seek(0)
+        with tarfile.open(fileobj=tarball) as tar:
+            tar.extractall(extract_path)
+        ret = []
+        for filename in filenames:
+            path = Path(extract_path) / result_dir.lstrip('/') / filename
+            if not path.is_file():
+                ret.append(None)
+                continue
+            with open(path, 'r', errors='ignore') as f:
+                ret.append(f.read())
+        return ret
+
+
+def measure(fn, rounds: int):
+    costs = []
+    for _ in range(rounds):
+        start = time.perf_counter()
+        fn()
+        costs.append((time.perf_counter() - start) * 1e3)
+    return statistics.median(costs)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--sizes', nargs='+', default=['1K', '1M', '64M'])
+    parser.add_argument('--rounds', type=int, default=5)
+    parser.add_argument(
+        '--max-bytes',
+        type=parse_size,
+        default=DEFAULT_RESULT_MAX_BYTES,
+        help='byte cap of each result file',
+    )
+    args = parser.parse_args()
+
+    # skip `__init__`, only the client and the byte cap are needed
+    sandbox = Sandbox.__new__(Sandbox)
+    sandbox.result_max_bytes = args.max_bytes
+    for size in args.sizes:
+        client = StreamClient(make_archive(parse_size(size)))
+        sandbox.client = client
+        before = measure(
+            lambda: legacy_get_result(client, 'c0', FILENAMES),
+            args.rounds,
+        )
+        after = measure(
+            lambda: sandbox.get_result('c0', FILENAMES),
+            args.rounds,
+        )
+        print(f'stdout {size:>5}   before {before:9.2f} ms   '
+              f'after {after:9.2f} ms')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,719 @@
+'''
+Simulate how the dispatcher schedules a workload, in virtual time.
+
+The model follows `Dispatcher`: one bounded queue of compile and execute
+jobs and a loop taking them one at a time. Compiles run on
+`MAX_COMPILE_NUMBER` lanes without a container slot. Execute jobs of a
+submission still compiling are parked, then put back at the front. The
+loop blocks on a free container slot before it starts a case, and jobs
+older than the dispatcher's timeout are dropped when taken. `--policy`
+only changes which queued job the loop takes next:
+
+    fifo  in the order they were queued, as the dispatcher does
+    fair  of the submission holding the fewest container slots
+    sjf   of the submission with the least expected work left
+
+Durations are resampled from the spans of a `TRACE_FILE` (`--trace`) or
+the histograms of `/metrics` (`--metrics`), anything missing there is
+exponential with the `--*-ms` mean. The workload is the submissions
+recorded via `ARRIVAL_FILE` (`--arrivals`) or generated ones, and every
+configuration runs it with the same sampled durations.
+
+    python -m benchmarks.scheduling --submissions 500 --cases 20 \\
+        --policy fifo fair sjf --containers 4 8 16
+'''
+import argparse
+import bisect
+import heapq
+import itertools
+import json
+import math
+import os
+import random
+import re
+import statistics
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+
+from telemetry import arrivals
+
+# seconds a job may wait before the dispatcher drops it, `Dispatcher.timeout`
+JOB_TIMEOUT = 300
+POLICIES = ('fifo', 'fair', 'sjf')
+# container steps around running the cases, and the ones running them
+SETUP_PHASES = (
+    'acquire',
+    'create',
+    'start',
+    'put_archive',
+    'get_archive',
+    'release',
+    'remove',
+)
+RUN_PHASES = ('wait', 'exec')
+
+
+class Exponential:
+
+    def __init__(self, mean: float):
+        self.mean = mean
+
+    def sample(self, rng: random.Random) -> float:
+        if self.mean <= 0:
+            return 0.0
+        return rng.expovariate(1 / self.mean)
+
+
+class Empirical:
+    '''
+    resample observed values
+    '''
+
+    def __init__(self, values: List[float]):
+        if not values:
+            raise ValueError('no observed value')
+        self.values = [*values]
+        self.mean = statistics.fmean(self.values)
+
+    def sample(self, rng: random.Random) -> float:
+        return rng.choice(self.values)
+
+
+class Bucketed:
+    '''
+    sample a prometheus histogram, uniformly inside the picked bucket.
+    the +Inf bucket is read as its lower bound
+    '''
+
+    def __init__(self, bounds: List[float], counts: List[int]):
+        '''
+        `counts` has one more item than `bounds`, the +Inf bucket
+        '''
+        if sum(counts) == 0:
+            raise ValueError('empty histogram')
+        self.bounds = [*bounds]
+        self.cumulative = [*itertools.accumulate(counts)]
+        lows = [0.0, *self.bounds]
+        highs = [*self.bounds, self.bounds[-1] if self.bounds else 0.0]
+        self.mean = sum((low + high) / 2 * count
+                        for low, high, count in zip(lows, highs, counts))
+        self.mean /= self.cumulative[-1]
+
+    def sample(self, rng: random.Random) -> float:
+        i = bisect.bisect_right(
+            self.cumulative,
+            rng.randrange(self.cumulative[-1]),
+        )
+        low = self.bounds[i - 1] if i > 0 else 0.0
+        high = self.bounds[i] if i < len(self.bounds) else low
+        return rng.uniform(low, high)
+
+
+class Sum:
+    '''
+    the sum of independent samples of each part
+    '''
+
+    def __init__(self, parts):
+        self.parts = [*parts]
+        self.mean = sum(part.mean for part in self.parts)
+
+    def sample(self, rng: random.Random) -> float:
+        return sum(part.sample(rng) for part in self.parts)
+
+
+@dataclass
+class Durations:
+    # seconds to compile a submission
+    compile: object
+    # seconds a container spends around its cases: acquiring or creating,
+    # starting, copying inputs in, reading results and removing or
+    # resetting it
+    setup: object
+    # seconds to run and check one case
+    run: object
+
+
+def durations_from_trace(path, default: Durations) -> Durations:
+    '''
+    fit durations to the spans written via `TRACE_FILE`, the ones without
+    spans are taken from `default`
+    '''
+    spans = []
+    with open(path) as f:
+        for line in f:
+            if line.strip():
+                spans.append(json.loads(line))
+    # type: Dict[parent span id, seconds running cases in it]
+    running = {}
+    for span in spans:
+        name = span['name']
+        if name in {f'container.{phase}' for phase in RUN_PHASES} \
+                or name == 'compare':
+            running[span['parentId']] = running.get(span['parentId'], 0) \
+                + span['end'] - span['start']
+    compiles, setups, runs = [], [], []
+    for span in spans:
+        took = span['end'] - span['start']
+        if span['name'] == 'compile':
+            compiles.append(took)
+        elif span['name'] in {'execute', 'execute_batch'} \
+                and span['spanId'] in running:
+            run = running[span['spanId']]
+            setups.append(max(0.0, took - run))
+            # a batch does not tell how its cases split the time
+            if span['name'] == 'execute':
+                runs.append(run)
+    return Durations(
+        compile=Empirical(compiles) if compiles else default.compile,
+        setup=Empirical(setups) if setups else default.setup,
+        run=Empirical(runs) if runs else default.run,
+    )
+
+
+BUCKET_SAMPLE = re.compile(r'^(\w+)_bucket\{(.*)\} (\S+)$')
+LABEL = re.compile(r'(\w+)="((?:[^"\\]|\\.)*)"')
+
+
+def parse_buckets(text: str) -> Dict[str, List[tuple]]:
+    '''
+    read histogram buckets from the prometheus text format, return
+    Dict[name, List[(labels without le, le, cumulative count)]]
+    '''
+    buckets = {}
+    for line in text.splitlines():
+        match = BUCKET_SAMPLE.match(line)
+        if match is None:
+            continue
+        labels = dict(LABEL.findall(match[2]))
+        le = float(labels.pop('le'))
+        buckets.setdefault(match[1], []).append((labels, le, float(match[3])))
+    return buckets
+
+
+def bucketed(
+    buckets: Dict[str, List[tuple]],
+    name: str,
+    **allowed,
+) -> Optional[Bucketed]:
+    '''
+    merge the series of histogram `name` whose labels have one of the
+    `allowed` values, None if there is no observation
+    '''
+    # type: Dict[le, cumulative count]
+    merged = {}
+    for labels, le, count in buckets.get(name, []):
+        if all(
+                labels.get(label) in values
+                for label, values in allowed.items()):
+            merged[le] = merged.get(le, 0) + count
+    if not merged or merged.get(math.inf, 0) == 0:
+        return None
+    bounds = sorted(le for le in merged if le != math.inf)
+    cumulative = [merged[le] for le in bounds] + [merged[math.inf]]
+    counts = [int(b - a) for a, b in zip([0, *cumulative], cumulative)]
+    return Bucketed(bounds, counts)
+
+
+def durations_from_metrics(path, default: Durations) -> Durations:
+    '''
+    fit durations to the histograms of `/metrics`. the container steps of
+    compiles are counted with the cases, which only shifts the setup
+    slightly
+    '''
+    with open(path) as f:
+        buckets = parse_buckets(f.read())
+    compile_ = bucketed(buckets, 'sandbox_compile_seconds')
+    setup = [
+        bucketed(buckets, 'sandbox_container_phase_seconds', phase={phase})
+        for phase in SETUP_PHASES
+    ]
+    run = [
+        bucketed(
+            buckets,
+            'sandbox_container_phase_seconds',
+            phase={*RUN_PHASES},
+        ),
+        bucketed(buckets, 'sandbox_compare_seconds'),
+    ]
+    setup = [part for part in setup if part is not None]
+    run = [part for part in run if part is not None]
+    return Durations(
+        compile=compile_ or default.compile,
+        setup=Sum(setup) if setup else default.setup,
+        run=Sum(run) if run else default.run,
+    )
+
+
+@dataclass
+class Submission:
+    # seconds since the first arrival
+    arrival: float
+    compiled: bool
+    cases: int
+    # sampled once and shared by every configuration
+    compile_time: float = 0.0
+    compile_ok: bool = True
+    # type: List[seconds], one setup and one run per case. a batch takes
+    # the setup of its first case
+    setups: List[float] = field(default_factory=list)
+    runs: List[float] = field(default_factory=list)
+
+
+def generate(
+    count: int,
+    rate: float,
+    cases: int,
+    compiled: float,
+    rng: random.Random,
+) -> List[Submission]:
+    '''
+    `count` submissions of `cases` cases arriving `rate` per second on
+    average, all at once if `rate` is 0. `compiled` of them need a compile
+    '''
+    submissions = []
+    arrival = 0.0
+    for _ in range(count):
+        if rate > 0:
+            arrival += rng.expovariate(rate)
+        submissions.append(
+            Submission(
+                arrival=arrival,
+                compiled=rng.random() < compiled,
+                cases=cases,
+            ))
+    return submissions
+
+
+def from_arrivals(path, speed: float) -> List[Submission]:
+    '''
+    the submissions logged via `ARRIVAL_FILE`, `speed` times faster
+    '''
+    recorded = arrivals.replayable(arrivals.load(path))
+    if not recorded:
+        return []
+    first = recorded[0]['receivedAt']
+    return [
+        Submission(
+            arrival=(arrival['receivedAt'] - first) / speed,
+            # c and c++
+            compiled=arrival['language'] in {0, 1},
+            cases=max(1, sum(arrival['caseCounts'])),
+        ) for arrival in recorded
+    ]
+
+
+def sample(
+    submissions: List[Submission],
+    durations: Durations,
+    compile_error: float,
+    rng: random.Random,
+):
+    for submission in submissions:
+        if submission.compiled:
+            submission.compile_time = durations.compile.sample(rng)
+            submission.compile_ok = rng.random() >= compile_error
+        submission.setups = [
+            durations.setup.sample(rng) for _ in range(submission.cases)
+        ]
+        submission.runs = [
+            durations.run.sample(rng) for _ in range(submission.cases)
+        ]
+
+
+@dataclass
+class Config:
+    policy: str = 'fifo'
+    # `QUEUE_SIZE`, not bounded if not positive
+    queue_size: int = 16
+    containers: int = 8
+    compilers: int = 2
+    batch: bool = False
+
+
+class Job:
+    __slots__ = ('compile', 'submission', 'cases', 'seq', 'queued_at')
+
+    def __init__(
+        self,
+        compile: bool,
+        submission: int,
+        cases: List[int],
+        queued_at: float,
+    ):
+        self.compile = compile
+        self.submission = submission
+        self.cases = cases
+        self.seq = 0
+        self.queued_at = queued_at
+
+
+class Progress:
+    '''
+    what happened to a submission in one simulation
+    '''
+
+    def __init__(self, cases: int):
+        self.remaining = cases
+        # None until compiled, then 'AC' or 'CE'
+        self.compile_status = None
+        self.parked: List[Job] = []
+        self.running = 0
+        self.rejected = False
+        self.timed_out = False
+        self.done_at = None
+
+
+class Simulation:
+
+    def __init__(
+        self,
+        config: Config,
+        submissions: List[Submission],
+        durations: Durations,
+        timeout: float = JOB_TIMEOUT,
+    ):
+        if config.policy not in POLICIES:
+            raise ValueError(f'unknown policy {config.policy}')
+        self.config = config
+        self.submissions = submissions
+        self.durations = durations
+        self.timeout = timeout
+        self.now = 0.0
+        # type: List[Tuple[time, order, callback, args]]
+        self.events = []
+        self.order = itertools.count()
+        # the order of jobs pushed to the back and to the front
+        self.back = itertools.count()
+        self.front = itertools.count(-1, -1)
+        self.progress = [Progress(s.cases) for s in submissions]
+        # type: Dict[submission index, Deque[Job]], in queue order
+        self.queued: Dict[int, deque] = {}
+        self.queue_len = 0
+        # type: List[Tuple[priority, version, submission index]], the
+        # submissions with queued jobs. an entry is stale once the version
+        # of its submission changed
+        self.ready = []
+        self.versions = [0] * len(submissions)
+        self.free_slots = config.containers
+        # the job the loop holds while it waits for a slot
+        self.blocked: Optional[Job] = None
+        self.free_compilers = config.compilers
+        self.compile_backlog = deque()
+        # container seconds and each case's wait for its container
+        self.busy = 0.0
+        self.waits = []
+
+    def at(self, time: float, callback, *args):
+        heapq.heappush(self.events, (time, next(self.order), callback, args))
+
+    def run(self) -> dict:
+        for i, submission in enumerate(self.submissions):
+            self.at(submission.arrival, self.arrive, i)
+        while self.events:
+            self.now, _, callback, args = heapq.heappop(self.events)
+            callback(*args)
+        return self.report()
+
+    def arrive(self, i: int):
+        submission = self.submissions[i]
+        jobs = []
+        if submission.compiled:
+            jobs.append(Job(True, i, [], self.now))
+        cases = [*range(submission.cases)]
+        if self.config.batch:
+            jobs.append(Job(False, i, cases, self.now))
+        else:
+            jobs += [Job(False, i, [case], self.now) for case in cases]
+        for job in jobs:
+            if 0 < self.config.queue_size <= self.queue_len:
+                # the jobs queued so far are discarded when taken
+                self.progress[i].rejected = True
+                break
+            self.push(job)
+        self.dispatch()
+
+    def push(self, job: Job, front: bool = False):
+        job.seq = next(self.front if front else self.back)
+        jobs = self.queued.setdefault(job.submission, deque())
+        if front:
+            jobs.appendleft(job)
+        else:
+            jobs.append(job)
+        self.queue_len += 1
+        self.reprioritize(job.submission)
+
+    def reprioritize(self, i: int):
+        '''
+        update the priority of submission `i` after a change it depends on
+        '''
+        if i not in self.queued:
+            return
+        self.versions[i] += 1
+        heapq.heappush(self.ready, (self.priority(i), self.versions[i], i))
+
+    def priority(self, i: int) -> tuple:
+        head = self.queued[i][0].seq
+        if self.config.policy == 'fair':
+            return self.progress[i].running, head
+        if self.config.policy == 'sjf':
+            return self.expected_work(i), head
+        return (head, )
+
+    def expected_work(self, i: int) -> float:
+        progress = self.progress[i]
+        containers = 1 if self.config.batch else progress.remaining
+        work = progress.remaining * self.durations.run.mean \
+            + containers * self.durations.setup.mean
+        if self.submissions[i].compiled and progress.compile_status is None:
+            work += self.durations.compile.mean
+        return work
+
+    def take(self) -> Job:
+        while True:
+            _, version, i = heapq.heappop(self.ready)
+            if version == self.versions[i]:
+                break
+        jobs = self.queued[i]
+        job = jobs.popleft()
+        if not jobs:
+            del self.queued[i]
+        self.queue_len -= 1
+        self.reprioritize(i)
+        return job
+
+    def dispatch(self):
+        '''
+        the dispatcher loop, until it blocks on a slot or the queue is
+        empty
+        '''
+        while self.blocked is None and self.queue_len:
+            job = self.take()
+            i = job.submission
+            submission = self.submissions[i]
+            progress = self.progress[i]
+            if progress.rejected or progress.timed_out:
+                continue
+            if self.now - submission.arrival > self.timeout:
+                progress.timed_out = True
+                continue
+            if job.compile:
+                self.start_compile(i)
+                continue
+            if submission.compiled and progress.compile_status is None:
+                progress.parked.append(job)
+                continue
+            if progress.compile_status == 'CE':
+                self.finish_cases(i, len(job.cases))
+                continue
+            if self.free_slots == 0:
+                self.blocked = job
+                return
+            self.start_container(job)
+
+    def start_compile(self, i: int):
+        if self.free_compilers == 0:
+            self.compile_backlog.append(i)
+            return
+        self.free_compilers -= 1
+        self.at(
+            self.now + self.submissions[i].compile_time,
+            self.finish_compile,
+            i,
+        )
+
+    def finish_compile(self, i: int):
+        self.free_compilers += 1
+        if self.compile_backlog:
+            self.start_compile(self.compile_backlog.popleft())
+        progress = self.progress[i]
+        progress.compile_status = 'AC' \
+            if self.submissions[i].compile_ok else 'CE'
+        parked, progress.parked = progress.parked, []
+        self.reprioritize(i)
+        if progress.compile_status == 'AC':
+            for job in reversed(parked):
+                self.push(job, front=True)
+        else:
+            for job in parked:
+                self.finish_cases(i, len(job.cases))
+        self.dispatch()
+
+    def start_container(self, job: Job):
+        submission = self.submissions[job.submission]
+        self.free_slots -= 1
+        self.progress[job.submission].running += 1
+        self.reprioritize(job.submission)
+        duration = submission.setups[job.cases[0]] \
+            + sum(submission.runs[case] for case in job.cases)
+        self.busy += duration
+        self.waits += [self.now - job.queued_at] * len(job.cases)
+        self.at(self.now + duration, self.finish_container, job)
+
+    def finish_container(self, job: Job):
+        self.free_slots += 1
+        self.progress[job.submission].running -= 1
+        self.finish_cases(job.submission, len(job.cases))
+        if self.blocked is not None:
+            blocked, self.blocked = self.blocked, None
+            self.start_container(blocked)
+        self.dispatch()
+
+    def finish_cases(self, i: int, count: int):
+        progress = self.progress[i]
+        progress.remaining -= count
+        if progress.remaining == 0:
+            progress.done_at = self.now
+        self.reprioritize(i)
+
+    def report(self) -> dict:
+        latencies = [
+            progress.done_at - submission.arrival
+            for submission, progress in zip(self.submissions, self.progress)
+            if progress.done_at is not None and not progress.rejected
+        ]
+        end = max(
+            (p.done_at for p in self.progress if p.done_at is not None),
+            default=0.0,
+        )
+        utilization = 0.0
+        if end > 0:
+            utilization = self.busy / (self.config.containers * end)
+        return {
+            'completed': len(latencies),
+            'rejected': sum(p.rejected for p in self.progress),
+            'timedOut': sum(p.timed_out for p in self.progress),
+            'latencies': latencies,
+            'waits': self.waits,
+            'makespan': end,
+            'utilization': utilization,
+        }
+
+
+def percentile(values, p):
+    if not values:
+        return math.nan
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--arrivals', help='a file written via ARRIVAL_FILE')
+    parser.add_argument(
+        '--speed',
+        type=float,
+        default=1,
+        help='replay the arrivals this many times faster',
+    )
+    parser.add_argument('--submissions', type=int, default=300)
+    parser.add_argument(
+        '--rate',
+        type=float,
+        default=0,
+        help='generated submissions per second, 0 sends all at once',
+    )
+    parser.add_argument('--cases', type=int, default=10)
+    parser.add_argument(
+        '--compiled',
+        type=float,
+        default=0.5,
+        help='the fraction of generated submissions in c or c++',
+    )
+    parser.add_argument('--trace', help='a file written via TRACE_FILE')
+    parser.add_argument('--metrics', help='a saved /metrics response')
+    parser.add_argument('--compile-ms', type=float, default=2000)
+    parser.add_argument('--setup-ms', type=float, default=500)
+    parser.add_argument('--run-ms', type=float, default=200)
+    parser.add_argument('--compile-error', type=float, default=0.1)
+    parser.add_argument(
+        '--config',
+        default=os.getenv(
+            'DISPATCHER_CONFIG',
+            '.config/dispatcher.json.example',
+        ),
+        help='the dispatcher config other options default to',
+    )
+    parser.add_argument('--policy', nargs='+', choices=POLICIES)
+    parser.add_argument('--queue-size', nargs='+', type=int)
+    parser.add_argument('--containers', nargs='+', type=int)
+    parser.add_argument('--compilers', nargs='+', type=int)
+    parser.add_argument('--batch', nargs='+', choices=('off', 'on'))
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    d_config = {}
+    if os.path.exists(args.config):
+        with open(args.config) as f:
+            d_config = json.load(f)
+    durations = Durations(
+        compile=Exponential(args.compile_ms / 1000),
+        setup=Exponential(args.setup_ms / 1000),
+        run=Exponential(args.run_ms / 1000),
+    )
+    if args.trace:
+        durations = durations_from_trace(args.trace, durations)
+    if args.metrics:
+        durations = durations_from_metrics(args.metrics, durations)
+    rng = random.Random(args.seed)
+    if args.arrivals:
+        submissions = from_arrivals(args.arrivals, args.speed)
+    else:
+        submissions = generate(
+            args.submissions,
+            args.rate,
+            args.cases,
+            args.compiled,
+            rng,
+        )
+    if not submissions:
+        parser.error('no submission to simulate')
+    sample(submissions, durations, args.compile_error, rng)
+
+    print(f'{len(submissions)} submissions, '
+          f'{sum(s.cases for s in submissions)} cases over '
+          f'{submissions[-1].arrival:.1f} s. mean compile '
+          f'{durations.compile.mean:.3f} s, setup '
+          f'{durations.setup.mean:.3f} s, case {durations.run.mean:.3f} s')
+    header = ('policy', 'queue', 'slots', 'lanes', 'batch', 'done', 'rejected',
+              'timeout', 'p50 s', 'p99 s', 'wait p99 s', 'makespan s', 'busy')
+    print(''.join(f'{name:>11}' for name in header))
+    for policy, queue_size, containers, compilers, batch in \
+            itertools.product(
+                args.policy or ['fifo'],
+                args.queue_size or [d_config.get('QUEUE_SIZE', 16)],
+                args.containers or [d_config.get('MAX_CONTAINER_NUMBER', 8)],
+                args.compilers or [d_config.get('MAX_COMPILE_NUMBER', 2)],
+                args.batch or [
+                    'on' if d_config.get('BATCH_EXECUTION') else 'off'
+                ],
+            ):
+        config = Config(
+            policy=policy,
+            queue_size=queue_size,
+            containers=containers,
+            compilers=compilers,
+            batch=batch == 'on',
+        )
+        stats = Simulation(config, submissions, durations).run()
+        row = (
+            policy,
+            queue_size,
+            containers,
+            compilers,
+            batch,
+            stats['completed'],
+            stats['rejected'],
+            stats['timedOut'],
+            f'{percentile(stats["latencies"], 0.5):.2f}',
+            f'{percentile(stats["latencies"], 0.99):.2f}',
+            f'{percentile(stats["waits"], 0.99):.2f}',
+            f'{stats["makespan"]:.1f}',
+            f'{stats["utilization"]:.0%}',
+        )
+        print(''.join(f'{value:>11}' for value in row))
+
+
+if __name__ == '__main__':
+    main()
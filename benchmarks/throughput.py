@@ -0,0 +1,151 @@
+'''
+Push submissions through the dispatcher and the real executor, with docker
+replaced by `tests.fake_docker`.
+
+`--submissions` copies of a problem under `problem/` are written with
+`tests.submission_generator` and handled at once. Every docker call sleeps
+for its `--*-ms` latency, so the numbers show what scheduling, file I/O
+and result handling cost on top of the daemon. A case's latency runs from
+`Dispatcher.handle` to its result being saved. Peak RSS is the whole
+process's.
+
+    python -m benchmarks.throughput --submissions 200 --run-ms 20
+'''
+import argparse
+import json
+import resource
+import shutil
+import statistics
+import tempfile
+import threading
+import time
+from pathlib import Path
+from typing import Callable, Optional
+
+from benchmarks.dispatch_latency import percentile
+from dispatcher.dispatcher import Dispatcher
+from tests.fake_docker import FakeAPIClient, Latency, patch_client
+from tests.submission_generator import SubmissionGenerator
+
+
+class TimedDispatcher(Dispatcher):
+    '''
+    a dispatcher recording when each case of a job finished
+    '''
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.timeline_lock = threading.Lock()
+        # type: Dict[job_id, handled_at]
+        self.handled_at = {}
+        # case latencies in seconds
+        self.latencies = []
+        self.statuses = {}
+        self.all_done = threading.Event()
+        self.expected_cases = 0
+
+    def handle(self, job_id: str, submission_id: str, meta=None):
+        with self.timeline_lock:
+            self.handled_at[job_id] = time.perf_counter()
+        super().handle(job_id, submission_id, meta)
+
+    def complete_case(self, job_id: str, case_no: str, res: dict):
+        super().complete_case(job_id, case_no, res)
+        now = time.perf_counter()
+        with self.timeline_lock:
+            self.latencies.append(now - self.handled_at[job_id])
+            status = res['Status']
+            self.statuses[status] = self.statuses.get(status, 0) + 1
+            if len(self.latencies) == self.expected_cases:
+                self.all_done.set()
+
+
+def answers(generator: SubmissionGenerator,
+            problem: str) -> Callable[[Optional[Path]], str]:
+    '''
+    print the answer of each input of `problem`, a pooled container only
+    gets the input
+    '''
+    by_input = {
+        case['in']: case['out']
+        for task in generator.problem[problem]['testcase']
+        for case in task
+    }
+    return lambda stdin_path: '' if stdin_path is None \
+        else by_input.get(stdin_path.read_text(), '')
+
+
+def write_configs(work: Path, args) -> tuple:
+    dispatcher_config = work / 'dispatcher.json'
+    dispatcher_config.write_text(
+        json.dumps({
+            'QUEUE_SIZE': args.submissions * 64,
+            'MAX_CONTAINER_NUMBER': args.containers,
+            'MAX_COMPILE_NUMBER': args.compilers,
+            'BATCH_EXECUTION': args.batch,
+            # every submission has the same source
+            'COMPILE_CACHE_SIZE': 0,
+        }))
+    submission_config = work / 'submission.json'
+    config = json.loads(Path('.config/submission.json').read_text())
+    config['working_dir'] = str(work / 'submissions')
+    config['container_pool']['size'] = args.pool
+    submission_config.write_text(json.dumps(config))
+    return str(dispatcher_config), str(submission_config)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--submissions', type=int, default=100)
+    parser.add_argument('--problem', default='normal-submission')
+    parser.add_argument('--containers', type=int, default=8)
+    parser.add_argument('--compilers', type=int, default=2)
+    parser.add_argument('--batch', action='store_true')
+    parser.add_argument('--pool', type=int, default=0)
+    Latency.add_arguments(parser)
+    args = parser.parse_args()
+
+    work = Path(tempfile.mkdtemp()).absolute()
+    try:
+        dispatcher_config, submission_config = write_configs(work, args)
+        generator = SubmissionGenerator(submission_path=work / 'submissions')
+        client = FakeAPIClient(
+            Latency.from_args(args),
+            output=answers(generator, args.problem),
+        )
+        meta = generator.problem[args.problem]['meta']
+        job_ids = []
+        for _ in range(args.submissions):
+            job_id = generator.gen_submission_id()
+            generator.gen_submission(args.problem, job_id)
+            job_ids.append(job_id)
+        with patch_client(client):
+            d = TimedDispatcher(dispatcher_config, submission_config)
+            d.SUBMISSION_DIR = work / 'submissions'
+            d.testing = True
+            d.expected_cases = args.submissions * sum(
+                task['caseCount'] for task in meta['tasks'])
+            d.start()
+            start = time.perf_counter()
+            for job_id in job_ids:
+                d.handle(job_id=job_id, submission_id=job_id)
+            d.all_done.wait()
+            elapsed = time.perf_counter() - start
+            d.stop()
+    finally:
+        shutil.rmtree(work)
+
+    latencies = [latency * 1e3 for latency in d.latencies]
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    print(f'submissions: {args.submissions} in {elapsed:.2f} s')
+    print(f'throughput:  {args.submissions / elapsed:.1f} submissions/s')
+    print(f'cases:       {len(latencies)} {d.statuses}')
+    print(f'case p50:    {statistics.median(latencies):.1f} ms')
+    print(f'case p99:    {percentile(latencies, 0.99):.1f} ms')
+    print(f'containers:  {client.created} created, '
+          f'{client.peak_containers} at once')
+    print(f'peak RSS:    {peak_rss / 1024:.1f} MiB')
+
+
+if __name__ == '__main__':
+    main()
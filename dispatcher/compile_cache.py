@@ -0,0 +1,208 @@
+import hashlib
+import json
+import os
+import secrets
+import shutil
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import List, Optional
+
+from .constant import Language
+from .utils import logger
+
+# the file produced by the sandbox compile step
+BINARY_NAME = 'main'
+# part of every key, bumped when what is cached changes
+CACHE_VERSION = 2
+# sandbox statuses of a compile that only depend on the source: the
+# compiler finished, or failed by itself. a compiler hitting a time or
+# memory limit may pass on a less loaded host
+CACHED_STATUSES = {'Exited Normally', 'RE'}
+
+
+def dir_size(path: Path) -> int:
+    return sum(p.stat().st_size for p in path.rglob('*') if p.is_file())
+
+
+class CompileCache:
+    '''
+    compile results and binaries on local disk, keyed by the source, the
+    language and the compiler image, evicted in LRU order once the total
+    size exceeds `max_size` bytes
+    '''
+
+    def __init__(self, root: Path, max_size: int):
+        self.root = Path(root)
+        self.max_size = max_size
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        # type: OrderedDict[key, size], the least recently used first
+        self.entries = OrderedDict()
+        self.size = 0
+        if self.enabled:
+            self.root.mkdir(parents=True, exist_ok=True)
+            self.scan()
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_size > 0
+
+    def scan(self):
+        '''
+        load entries left by a previous process, ordered by last use
+        '''
+        entries = []
+        for entry in self.root.iterdir():
+            # unfinished write
+            if entry.name.startswith('.'):
+                shutil.rmtree(entry, ignore_errors=True)
+                continue
+            entries.append((entry.stat().st_mtime, entry))
+        for _, entry in sorted(entries):
+            size = dir_size(entry)
+            self.entries[entry.name] = size
+            self.size += size
+
+    @staticmethod
+    def key(src_dir: Path, lang: Language, image_id: str) -> str:
+        digest = hashlib.sha256()
+        digest.update(f'{CACHE_VERSION}\0{int(lang)}\0{image_id}\0'.encode())
+        for path in sorted(src_dir.iterdir()):
+            if not path.is_file():
+                continue
+            content = path.read_bytes()
+            digest.update(f'{path.name}\0{len(content)}\0'.encode())
+            digest.update(content)
+        return digest.hexdigest()
+
+    def load(self, key: str, src_dir: Path) -> Optional[dict]:
+        '''
+        get the cached compile result and restore the binary into
+        `src_dir`, return None on miss
+        '''
+        with self.lock:
+            found = key in self.entries
+            if found:
+                self.entries.move_to_end(key)
+        res = None
+        if found:
+            entry = self.root / key
+            try:
+                res = json.loads((entry / 'result.json').read_text())
+                if not isinstance(res, dict) or 'Status' not in res:
+                    raise ValueError(f'not a compile result: {res!r}')
+                binary = entry / BINARY_NAME
+                if binary.exists():
+                    shutil.copy2(binary, src_dir / BINARY_NAME)
+                # keep the order for the next `scan`
+                os.utime(entry)
+            except OSError as e:
+                # evicted while reading, or the disk failed
+                logger().warning(f'fail to load compile cache {key}: {e!r}')
+                res = None
+            except ValueError as e:
+                # drop it, so the next compile stores a good one
+                logger().warning(f'drop broken compile cache {key}: {e!r}')
+                self.discard(key)
+                res = None
+        with self.lock:
+            if res is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return res
+
+    def store(self, key: str, res: dict, src_dir: Path):
+        '''
+        cache a compile result and its binary, errors are logged and the
+        result is left uncached
+        '''
+        # judge errors and compilers hitting a limit say nothing about
+        # the source
+        if res['Status'] not in {'AC', 'CE'} \
+                or res.get('SandboxStatus') not in CACHED_STATUSES:
+            return
+        binary = src_dir / BINARY_NAME
+        if res['Status'] == 'AC' and not binary.is_file():
+            logger().warning(f'no binary to cache in {src_dir}')
+            return
+        tmp = self.root / f'.{key}-{secrets.token_hex(4)}'
+        try:
+            tmp.mkdir()
+            (tmp / 'result.json').write_text(json.dumps(res))
+            if res['Status'] == 'AC':
+                shutil.copy2(binary, tmp / BINARY_NAME)
+            size = dir_size(tmp)
+        except OSError as e:
+            logger().warning(f'fail to store compile cache {key}: {e!r}')
+            shutil.rmtree(tmp, ignore_errors=True)
+            return
+        victims = []
+        with self.lock:
+            if key in self.entries:
+                victims.append(tmp)
+            else:
+                try:
+                    os.rename(tmp, self.root / key)
+                except OSError as e:
+                    logger().warning(
+                        f'fail to store compile cache {key}: {e!r}')
+                    victims.append(tmp)
+                else:
+                    self.entries[key] = size
+                    self.size += size
+                    victims += self.evict()
+        for victim in victims:
+            shutil.rmtree(victim, ignore_errors=True)
+
+    def discard(self, key: str):
+        '''
+        remove an entry
+        '''
+        with self.lock:
+            size = self.entries.pop(key, None)
+            if size is None:
+                return
+            self.size -= size
+            # hide it from `load` before it is removed
+            victim = self.root / f'.{key}-{secrets.token_hex(4)}'
+            try:
+                os.rename(self.root / key, victim)
+            except OSError:
+                return
+        shutil.rmtree(victim, ignore_errors=True)
+
+    def evict(self) -> List[Path]:
+        '''
+        drop the least recently used entries until the size fits, must
+        be called with `lock` held. return the directories to remove
+        '''
+        victims = []
+        # the newest entry is always kept
+        while self.size > self.max_size and len(self.entries) > 1:
+            key, size = self.entries.popitem(last=False)
+            self.size -= size
+            # hide it from `load` before it is removed
+            victim = self.root / f'.{key}-{secrets.token_hex(4)}'
+            try:
+                os.rename(self.root / key, victim)
+            except OSError as e:
+                # forgotten until the next `scan`
+                logger().warning(f'fail to evict compile cache {key}: {e!r}')
+                continue
+            victims.append(victim)
+        return victims
+
+    def stats(self) -> dict:
+        with self.lock:
+            total = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hitRate': self.hits / total if total else 0,
+                'entries': len(self.entries),
+                'size': self.size,
+                'maxSize': self.max_size,
+            }
@@ -16,6 +16,22 @@ TESTDATA_ROOT = Path(os.getenv(
     'sandbox-testdata',
 ))
 TESTDATA_ROOT.mkdir(exist_ok=True)
+# bytes of extracted testdata kept on disk, cold problems are evicted
+# past it. 0 keeps everything
+TESTDATA_MAX_SIZE = int(os.getenv(
+    'TESTDATA_MAX_SIZE',
+    '0',
+))
+# seconds a testdata checksum confirmed with backend is trusted
+CHECKSUM_TTL = float(os.getenv(
+    'CHECKSUM_TTL',
+    '10',
+))
+# problem metas kept parsed in memory
+META_CACHE_SIZE = int(os.getenv(
+    'META_CACHE_SIZE',
+    '256',
+))
 SUBMISSION_DIR = Path(os.getenv(
     'SUBMISSION_DIR',
     'submissions',
@@ -25,6 +41,25 @@ SUBMISSION_BACKUP_DIR = Path(
         'SUBMISSION_BACKUP_DIR',
         'submissions.bk',
     ))
+# seconds a backup is kept, and how many are kept at most. 0 is no limit
+SUBMISSION_BACKUP_MAX_AGE = float(os.getenv(
+    'SUBMISSION_BACKUP_MAX_AGE',
+    '0',
+))
+SUBMISSION_BACKUP_MAX_COUNT = int(
+    os.getenv(
+        'SUBMISSION_BACKUP_MAX_COUNT',
+        '0',
+    ))
+COMPILE_CACHE_DIR = Path(os.getenv(
+    'COMPILE_CACHE_DIR',
+    'compile-cache',
+))
+# how testdata is put into a job directory: copy, hardlink or reflink
+TESTDATA_WORKSPACE = os.getenv(
+    'TESTDATA_WORKSPACE',
+    'copy',
+)
 # create directory
 SUBMISSION_DIR.mkdir(exist_ok=True)
-SUBMISSION_BACKUP_DIR.mkdir(exist_ok=True)
\ No newline at end of file
+SUBMISSION_BACKUP_DIR.mkdir(exist_ok=True)
@@ -1,22 +1,46 @@
 import json
 import os
 import threading
-import time
-import requests
 import pathlib
 import queue
-import tempfile
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
 from datetime import datetime
+from typing import Dict, List, Optional, Union
 
+from executor.config import load_config
+from executor.sandbox import BatchCase
 from executor.submission import SubmissionExecutor
+from telemetry import metrics, tracing
 from . import job, file_manager, config
+from .compile_cache import CompileCache
+from .reporter import Report, ResultReporter
 from .exception import *
-from .meta import Meta
+from .meta import Meta, Task
+from .result import CaseResult, CaseResults
 from .constant import Language
 from .utils import logger
 
+QUEUE_WAIT_SECONDS = metrics.histogram(
+    'sandbox_queue_wait_seconds',
+    'Time from admitting a job until a worker takes it.',
+    ('kind', ),
+)
+COMPILE_SECONDS = metrics.histogram(
+    'sandbox_compile_seconds',
+    'Time to get the compile result of a submission.',
+    ('cache', ),
+)
+CASES = metrics.counter(
+    'sandbox_cases',
+    'Judged cases by status.',
+    ('status', ),
+)
+
 
 class Dispatcher(threading.Thread):
+    # seconds between `do_run` checks while blocked on a container slot
+    STOP_CHECK_INTERVAL = 0.5
 
     def __init__(
         self,
@@ -37,25 +61,64 @@ class Dispatcher(threading.Thread):
         # task queue
         # type Queue[Tuple[job_id, task_no]]
         self.MAX_TASK_COUNT = d_config.get('QUEUE_SIZE', 16)
-        self.queue = queue.Queue(self.MAX_TASK_COUNT)
+        self.queue = job.JobQueue(self.MAX_TASK_COUNT)
         # task result
-        # type: Dict[job_id, Tuple[submission_info, List[result]]]
+        # type: Dict[job_id, Tuple[submission_info, CaseResults]]
         self.result = {}
         # threading locks for each job
         self.locks = {}
         self.compile_locks = {}
         self.compile_results = {}
+        # execute jobs waiting for their compile, guarded by `park_lock`
+        # type: Dict[job_id, List[job.Execute]]
+        self.parked = {}
+        self.park_lock = threading.Lock()
         # maps job_id -> submission_id, for the backend callback
         self.submission_ids = {}
+        # type: Dict[job_id, Dict[case_no, digest of the expected output]]
+        self.digests = {}
+        # type: Dict[job_id, SpanContext], the trace of each job if traced
+        self.traces = {}
         # manage containers
         self.MAX_CONTAINER_SIZE = d_config.get('MAX_CONTAINER_NUMBER', 8)
         self.container_count_lock = threading.Lock()
         self.container_count = 0
+        # each running container holds one slot, released by `dec_container`
+        self.container_slots = threading.BoundedSemaphore(
+            self.MAX_CONTAINER_SIZE)
+        # run all cases of a job in one container
+        self.BATCH_EXECUTION = d_config.get('BATCH_EXECUTION', False)
+        # worker lanes. the loop takes a slot before submitting work which
+        # runs a container, but cases of a failed compile take none, so
+        # the execute lane may hold more work than there are free slots
+        self.MAX_COMPILE_SIZE = d_config.get('MAX_COMPILE_NUMBER', 2)
+        self.compile_pool = ThreadPoolExecutor(
+            max_workers=self.MAX_COMPILE_SIZE,
+            thread_name_prefix='compile',
+        )
+        self.execute_pool = ThreadPoolExecutor(
+            max_workers=self.MAX_CONTAINER_SIZE,
+            thread_name_prefix='execute',
+        )
+        # compile results keyed by source, language and image
+        self.compile_cache = CompileCache(
+            config.COMPILE_CACHE_DIR,
+            d_config.get('COMPILE_CACHE_SIZE', 512 * 1024 * 1024),
+        )
+        # upload results to backend off the worker lanes
+        self.reporter = ResultReporter(
+            queue_size=d_config.get('REPORT_QUEUE_SIZE', 256),
+            timeout=d_config.get('REPORT_TIMEOUT', 10),
+            max_retries=d_config.get('REPORT_MAX_RETRIES', 3),
+            gzip_payload=d_config.get('REPORT_GZIP', False),
+            batch_size=d_config.get('REPORT_BATCH_SIZE', 1),
+            flush_interval=d_config.get('REPORT_FLUSH_INTERVAL', 0.2),
+        )
+        # read once and shared by every executor
+        self.executor_config = load_config(submission_config)
         # read cwd from submission executor config
-        with open(submission_config) as f:
-            s_config = json.load(f)
-            self.submission_executor_cwd = pathlib.Path(
-                s_config['working_dir'])
+        self.submission_executor_cwd = pathlib.Path(
+            self.executor_config.working_dir)
         self.timeout = 300
         self.created_at = {}
 
@@ -65,13 +128,25 @@ class Dispatcher(threading.Thread):
     def contains(self, job_id: str):
         return job_id in self.result
 
-    def inc_container(self):
+    def inc_container(self) -> bool:
+        '''
+        block until a container slot is free and take it, return False
+        if the dispatcher is stopped while waiting
+        '''
+        # the timeout only bounds how long `stop` may go unnoticed, a freed
+        # slot wakes the waiter immediately
+        while not self.container_slots.acquire(
+                timeout=self.STOP_CHECK_INTERVAL):
+            if not self.do_run:
+                return False
         with self.container_count_lock:
             self.container_count += 1
+        return True
 
     def dec_container(self):
         with self.container_count_lock:
             self.container_count -= 1
+        self.container_slots.release()
 
     def is_timed_out(self, job_id: str):
         if not self.contains(job_id):
@@ -79,10 +154,18 @@ class Dispatcher(threading.Thread):
         delta = (datetime.now() - self.created_at[job_id]).seconds
         return delta > self.timeout
 
-    def handle(self, job_id: str, submission_id: str):
+    def handle(
+        self,
+        job_id: str,
+        submission_id: str,
+        meta: Optional[Meta] = None,
+    ):
         '''
         handle a job, save its config and push into task queue
 
+        `meta` is the one the job was extracted with, it is read from the
+        job directory if not given.
+
         multiple jobs for the same submission are legal concurrency
         (e.g. rejudge racing an in-flight judge run); they are kept
         fully separate here, keyed by job_id.
@@ -94,36 +177,57 @@ class Dispatcher(threading.Thread):
             raise FileNotFoundError(f'job id: {job_id} file not found.')
         elif not job_path.is_dir():
             raise NotADirectoryError(f'{job_path} is not a directory')
-        # read submission meta
-        with (job_path / 'meta.json').open() as f:
-            submission_config = Meta.parse_obj(json.load(f))
+        submission_config = meta
+        if submission_config is None:
+            # read submission meta
+            with (job_path / 'meta.json').open() as f:
+                submission_config = Meta.parse_obj(json.load(f))
 
         # assign job context
-        task_content = {}
-        self.result[job_id] = (submission_config, task_content)
+        self.result[job_id] = (
+            submission_config,
+            CaseResults(submission_config.tasks),
+        )
         self.locks[job_id] = threading.Lock()
         self.compile_locks[job_id] = threading.Lock()
         self.created_at[job_id] = datetime.now()
         self.submission_ids[job_id] = submission_id
+        self.digests[job_id] = self.load_digests(job_path)
+        self.traces[job_id] = tracing.current()
 
         logger().debug(f'current jobs: {[*self.result.keys()]}')
         try:
             if self.compile_need(submission_config.language):
                 self.queue.put_nowait(job.Compile(job_id=job_id))
-            for i, task in enumerate(submission_config.tasks):
-                for j in range(task.caseCount):
-                    case_no = f'{i:02d}{j:02d}'
-                    task_content[case_no] = None
-                    _job = job.Execute(
-                        job_id=job_id,
-                        task_id=i,
-                        case_id=j,
-                    )
-                    self.queue.put_nowait(_job)
+            if self.BATCH_EXECUTION:
+                self.queue.put_nowait(job.ExecuteBatch(job_id=job_id))
+            else:
+                for i, task in enumerate(submission_config.tasks):
+                    for j in range(task.caseCount):
+                        _job = job.Execute(
+                            job_id=job_id,
+                            task_id=i,
+                            case_id=j,
+                        )
+                        self.queue.put_nowait(_job)
         except queue.Full as e:
             self.release(job_id)
             raise e
 
+    def load_digests(self, job_path: pathlib.Path) -> Dict[str, dict]:
+        '''
+        read the digests of expected outputs copied into the job, return
+        an empty dict if there are none
+        '''
+        try:
+            with (job_path / 'digest.json').open() as f:
+                return json.load(f)['cases']
+        except FileNotFoundError:
+            return {}
+        except (ValueError, KeyError) as e:
+            logger().warning(f'ignore broken digest index: {e!r}')
+            return {}
+
     def release(self, job_id: str):
         '''
         Release variable about job
@@ -132,31 +236,31 @@ class Dispatcher(threading.Thread):
                 self.result,
                 self.compile_locks,
                 self.compile_results,
+                self.parked,
                 self.locks,
                 self.created_at,
                 self.submission_ids,
+                self.digests,
+                self.traces,
         ):
             if job_id in v:
                 del v[job_id]
 
     def run(self):
         self.do_run = True
+        if not self.reporter.is_alive():
+            self.reporter.start()
         logger().debug('start dispatcher loop')
         while True:
+            # block until a job (or the stop sentinel) arrives
+            _job = self.queue.get()
             # end the loop
             if not self.do_run:
                 logger().debug('exit dispatcher loop')
                 break
-            # no testcase need to be run
-            if self.queue.empty():
-                time.sleep(1)
+            # stale sentinel from a previous `stop`
+            if _job is None:
                 continue
-            # no space for new cotainer now
-            if self.container_count >= self.MAX_CONTAINER_SIZE:
-                time.sleep(1)
-                continue
-            # get a case
-            _job = self.queue.get()
             job_id = _job.job_id
             # if a job was discarded, it will not appear in the `self.result`
             if not self.contains(job_id):
@@ -168,47 +272,161 @@ class Dispatcher(threading.Thread):
             # get task info
             submission_config, _ = self.result[job_id]
             if isinstance(_job, job.Compile):
-                threading.Thread(
-                    target=self.compile,
-                    args=(
-                        job_id,
-                        submission_config.language,
-                    ),
-                ).start()
-            # if this job needs compile and it haven't finished
-            elif self.compile_need(submission_config.language) \
-                and self.compile_results.get(job_id) is None:
-                self.queue.put(_job)
-            else:
-                task_info = submission_config.tasks[_job.task_id]
-                case_no = f'{_job.task_id:02d}{_job.case_id:02d}'
-                logger().info(f'create container [task={job_id}/{case_no}]')
-                logger().debug(f'task info: {task_info}')
-                # output path should be the container path
-                base_path = self.SUBMISSION_DIR / job_id / 'testcase'
-                out_path = str((base_path / f'{case_no}.out').absolute())
-                # input path should be the host path
-                base_path = self.submission_executor_cwd / job_id / 'testcase'
-                in_path = str((base_path / f'{case_no}.in').absolute())
-                # debug log
-                logger().debug('in path: ' + in_path)
-                logger().debug('out path: ' + out_path)
-                # assign a new executor
-                threading.Thread(
-                    target=self.create_container,
-                    args=(
-                        job_id,
-                        case_no,
-                        task_info.memoryLimit,
-                        task_info.timeLimit,
-                        in_path,
-                        out_path,
-                        submission_config.language,
-                    ),
-                ).start()
+                self.observe_queue_wait(_job)
+                self.submit(
+                    self.compile_pool,
+                    self.compile,
+                    job_id,
+                    submission_config.language,
+                )
+                continue
+            # park it until the compile finishes, `compile` releases it
+            if self.compile_need(submission_config.language) \
+                and self.park(_job):
+                continue
+            compile_res = self.extract_compile_result(
+                job_id,
+                submission_config.language,
+            )
+            # compile failed, no container is needed to judge this case
+            if compile_res['Status'] != 'AC':
+                self.submit(
+                    self.execute_pool,
+                    self.complete_cases,
+                    job_id,
+                    self.case_nos(_job),
+                    compile_res,
+                )
+                continue
+            # wait for a free container slot
+            if not self.inc_container():
+                logger().debug('exit dispatcher loop')
+                break
+            self.observe_queue_wait(_job)
+            if isinstance(_job, job.ExecuteBatch):
+                logger().info(f'create batch container [task={job_id}]')
+                future = self.submit(
+                    self.execute_pool,
+                    self.create_batch_container,
+                    job_id,
+                    submission_config,
+                )
+                # dropped, nothing will run to give the slot back
+                if future is None:
+                    self.dec_container()
+                continue
+            task_info = submission_config.tasks[_job.task_id]
+            case_no = f'{_job.task_id:02d}{_job.case_id:02d}'
+            logger().info(f'create container [task={job_id}/{case_no}]')
+            logger().debug(f'task info: {task_info}')
+            # output path should be the container path
+            base_path = self.SUBMISSION_DIR / job_id / 'testcase'
+            out_path = str((base_path / f'{case_no}.out').absolute())
+            # input path should be the host path
+            base_path = self.submission_executor_cwd / job_id / 'testcase'
+            in_path = str((base_path / f'{case_no}.in').absolute())
+            # debug log
+            logger().debug('in path: ' + in_path)
+            logger().debug('out path: ' + out_path)
+            # assign a new executor
+            future = self.submit(
+                self.execute_pool,
+                self.create_container,
+                job_id,
+                case_no,
+                task_info.memoryLimit,
+                task_info.timeLimit,
+                in_path,
+                out_path,
+                submission_config.language,
+            )
+            if future is None:
+                self.dec_container()
+
+    def observe_queue_wait(self, _job):
+        '''
+        record how long a job waited from admission until a worker lane
+        takes it, execute jobs also wait for their compile and a slot
+        '''
+        kind = 'compile' if isinstance(_job, job.Compile) else 'execute'
+        waited = time.monotonic() - _job.queued_at
+        QUEUE_WAIT_SECONDS.observe(waited, kind=kind)
+        now = time.time()
+        tracing.record(
+            'queue.wait',
+            now - waited,
+            now,
+            self.traces.get(_job.job_id),
+            kind=kind,
+        )
+
+    def case_nos(self, _job) -> List[str]:
+        '''
+        get the case numbers an execute job covers
+        '''
+        if isinstance(_job, job.ExecuteBatch):
+            _, results = self.result[_job.job_id]
+            return results.case_nos()
+        return [f'{_job.task_id:02d}{_job.case_id:02d}']
+
+    def park(self, _job: Union[job.Execute, job.ExecuteBatch]) -> bool:
+        '''
+        hold an execute job if its compile result is not ready yet,
+        return whether it was parked
+        '''
+        with self.park_lock:
+            if self.compile_results.get(_job.job_id) is not None:
+                return False
+            self.parked.setdefault(_job.job_id, []).append(_job)
+            return True
+
+    def unpark(self, job_id: str, res: dict):
+        '''
+        save the compile result and release every parked job in one shot
+        '''
+        with self.park_lock:
+            self.compile_results[job_id] = res
+            parked = self.parked.pop(job_id, [])
+        if res['Status'] == 'AC':
+            # they were admitted already, don't make them wait again
+            self.queue.put_front(*parked)
+            return
+        for _job in parked:
+            self.complete_cases(job_id, self.case_nos(_job), res)
+
+    def submit(self, pool: ThreadPoolExecutor, fn, *args):
+        '''
+        run `fn` on a worker lane, errors are logged instead of being
+        silently kept in the future
+        '''
+        try:
+            future = pool.submit(fn, *args)
+        except RuntimeError:
+            # the lane was shut down by `stop`
+            logger().debug(f'drop work submitted after stop: {fn.__name__}')
+            return None
+        future.add_done_callback(self.on_worker_done)
+        return future
+
+    def on_worker_done(self, future: Future):
+        if future.cancelled():
+            return
+        err = future.exception()
+        if err is not None:
+            logger().error(
+                f'worker failed: {err!r}',
+                exc_info=(type(err), err, err.__traceback__),
+            )
 
     def stop(self):
         self.do_run = False
+        # wake up the loop if it is blocked on an empty queue
+        self.queue.put_front(None)
+        # running jobs are left to finish
+        self.compile_pool.shutdown(wait=False)
+        self.execute_pool.shutdown(wait=False)
+        # reports queued so far are still sent
+        self.reporter.stop()
 
     def compile(
         self,
@@ -226,18 +444,79 @@ class Dispatcher(threading.Thread):
                 f' with language {lang}', )
             return
         # compile this job. don't forget to acquire the lock
-        with self.compile_locks[job_id]:
-            logger().info(f'start compiling {job_id}')
-            res = SubmissionExecutor(
+        with self.compile_locks[job_id], tracing.span(
+                'compile',
+                parent=self.traces.get(job_id),
                 job_id=job_id,
-                time_limit=-1,
-                mem_limit=-1,
-                testdata_input_path='',
-                testdata_output_path='',
-                lang=['c11', 'cpp17'][int(lang)],
-            ).compile()
-            self.compile_results[job_id] = res
+        ) as span:
+            logger().info(f'start compiling {job_id}')
+            try:
+                res = self.get_compile_result(job_id, lang, span)
+            except Exception as e:
+                logger().error(
+                    f'fail to compile job {job_id}: {e!r}',
+                    exc_info=True,
+                )
+                res = {'Status': 'JE'}
             logger().debug(f'finish compiling, get status {res["Status"]}')
+            # parked jobs are released whatever happened, or they wait
+            # forever
+            self.unpark(job_id, res)
+
+    def get_compile_result(
+        self,
+        job_id: str,
+        lang: Language,
+        span: Optional[tracing.Span],
+    ) -> dict:
+        '''
+        compile a job or get its result from the compile cache
+        '''
+        executor = SubmissionExecutor(
+            job_id=job_id,
+            time_limit=-1,
+            mem_limit=-1,
+            testdata_input_path='',
+            testdata_output_path='',
+            lang=['c11', 'cpp17'][int(lang)],
+            config=self.executor_config,
+        )
+        src_dir = self.SUBMISSION_DIR / job_id / 'src'
+        cache_key = self.compile_cache_key(executor, src_dir, lang)
+        start = time.perf_counter()
+        res = None
+        if cache_key is not None:
+            res = self.compile_cache.load(cache_key, src_dir)
+        if res is None:
+            res = executor.compile()
+            if cache_key is not None:
+                self.compile_cache.store(cache_key, res, src_dir)
+            cache = 'miss'
+        else:
+            logger().info(f'compile cache hit [id={job_id}]')
+            cache = 'hit'
+        COMPILE_SECONDS.observe(time.perf_counter() - start, cache=cache)
+        if span is not None:
+            span.set(cache=cache, status=res['Status'])
+        return res
+
+    def compile_cache_key(
+        self,
+        executor: SubmissionExecutor,
+        src_dir: pathlib.Path,
+        lang: Language,
+    ) -> Optional[str]:
+        '''
+        get the compile cache key of a job, return None if it can not be
+        cached
+        '''
+        if not self.compile_cache.enabled:
+            return None
+        try:
+            return self.compile_cache.key(src_dir, lang, executor.image_id())
+        except Exception as e:
+            logger().warning(f'skip compile cache: {e}')
+            return None
 
     def create_container(
         self,
@@ -249,25 +528,84 @@ class Dispatcher(threading.Thread):
         case_out_path: str,
         lang: Language,
     ):
-        lang = ['c11', 'cpp17', 'python3'][int(lang)]
-        executor = SubmissionExecutor(
-            job_id,
-            time_limit,
-            mem_limit,
-            case_in_path,
-            case_out_path,
-            lang=lang,
-            case_no=case_no,
-        )
-        res = self.extract_compile_result(job_id, lang)
-        # Execute if compile successfully
-        if res['Status'] != 'CE':
+        with tracing.span(
+                'execute',
+                parent=self.traces.get(job_id),
+                job_id=job_id,
+                case_no=case_no,
+        ):
+            lang = ['c11', 'cpp17', 'python3'][int(lang)]
             try:
-                self.inc_container()
-                res = executor.run()
+                executor = SubmissionExecutor(
+                    job_id,
+                    time_limit,
+                    mem_limit,
+                    case_in_path,
+                    case_out_path,
+                    lang=lang,
+                    case_no=case_no,
+                    config=self.executor_config,
+                    digests=self.digests.get(job_id),
+                    local_dir=str(self.SUBMISSION_DIR / job_id),
+                )
+                res = self.extract_compile_result(job_id, lang)
+                # Execute if compile successfully
+                if res['Status'] != 'CE':
+                    res = executor.run()
             finally:
+                # the slot was taken by the dispatcher loop
                 self.dec_container()
         logger().info(f'finish task {job_id}/{case_no}')
+        self.complete_case(job_id, case_no, res)
+
+    def create_batch_container(self, job_id: str, submission_config: Meta):
+        lang = ['c11', 'cpp17', 'python3'][int(submission_config.language)]
+        cases = [
+            BatchCase(
+                case_no=f'{i:02d}{j:02d}',
+                time_limit=task.timeLimit,
+                mem_limit=task.memoryLimit,
+            ) for i, task in enumerate(submission_config.tasks)
+            for j in range(task.caseCount)
+        ]
+        with tracing.span(
+                'execute_batch',
+                parent=self.traces.get(job_id),
+                job_id=job_id,
+        ):
+            try:
+                # only the inputs are mounted, answers stay on the host
+                file_manager.link_inputs(self.SUBMISSION_DIR / job_id)
+                executor = SubmissionExecutor(
+                    job_id,
+                    -1,
+                    -1,
+                    str((self.submission_executor_cwd / job_id /
+                         file_manager.INPUT_DIR).absolute()),
+                    str((self.SUBMISSION_DIR / job_id /
+                         'testcase').absolute()),
+                    lang=lang,
+                    config=self.executor_config,
+                    digests=self.digests.get(job_id),
+                    local_dir=str(self.SUBMISSION_DIR / job_id),
+                )
+                results = executor.run_batch(cases)
+            except OSError as e:
+                logger().error(f'fail to link inputs of {job_id}: {e!r}')
+                results = {case.case_no: {'Status': 'JE'} for case in cases}
+            finally:
+                # the slot was taken by the dispatcher loop
+                self.dec_container()
+        logger().info(f'finish batch task {job_id}')
+        for case_no, res in results.items():
+            self.complete_case(job_id, case_no, res)
+
+    def complete_cases(self, job_id: str, case_nos: List[str], res: dict):
+        for case_no in case_nos:
+            self.complete_case(job_id, case_no, res)
+
+    def complete_case(self, job_id: str, case_no: str, res: dict):
+        CASES.inc(status=res['Status'])
         with self.locks[job_id]:
             self.on_case_complete(
                 job_id=job_id,
@@ -310,18 +648,21 @@ class Dispatcher(threading.Thread):
         _, results = self.result[job_id]
         if case_no not in results:
             raise ValueError(f'{job_id}/{case_no} not found.')
-        results[case_no] = {
-            'stdout': stdout,
-            'stderr': stderr,
-            'exitCode': exit_code,
-            'execTime': exec_time,
-            'memoryUsage': mem_usage,
-            'status': prob_status
-        }
+        done = results.set(
+            case_no,
+            CaseResult(
+                stdout=stdout,
+                stderr=stderr,
+                exit_code=exit_code,
+                exec_time=exec_time,
+                mem_usage=mem_usage,
+                status=prob_status,
+            ),
+        )
         # check completion
-        _results = [k for k, v in results.items() if not v]
-        logger().debug(f'tasks wait for judge: {_results}')
-        if all(results.values()):
+        logger().debug(f'{results.remaining} cases wait for judge '
+                       f'[job_id={job_id}]')
+        if done:
             self.on_job_complete(job_id)
 
     def on_job_complete(self, job_id: str):
@@ -333,46 +674,49 @@ class Dispatcher(threading.Thread):
             return True
         _, results = self.result[job_id]
         # parse results
-        submission_result = {}
-        for no, r in results.items():
-            task_no = int(no[:2])
-            case_no = int(no[2:])
-            if task_no not in submission_result:
-                submission_result[task_no] = {}
-            submission_result[task_no][case_no] = r
-        # convert to list and check
-        for task_no, cases in submission_result.items():
-            assert [*cases.keys()] == [*range(len(cases))]
-            submission_result[task_no] = [*cases.values()]
-        assert [*submission_result.keys()] == [*range(len(submission_result))]
-        submission_result = [*submission_result.values()]
-        # post data
+        submission_result = results.to_tasks()
         submission_id = self.submission_ids[job_id]
-        with tempfile.NamedTemporaryFile("w") as tmpf:
-            submission_data = {
-                'tasks': submission_result,
-                'token': config.SANDBOX_TOKEN
-            }
-            # write payload to file
-            json.dump(submission_data, tmpf)
-            tmpf.flush()
-            # release resources
-            del submission_data
-            self.release(job_id)
+        trace = self.traces.get(job_id)
+        # release resources
+        self.release(job_id)
+        self.reporter.report(
+            Report(
+                job_id=job_id,
+                submission_id=submission_id,
+                tasks=submission_result,
+                trace=trace,
+            ))
 
-            logger().info(
-                f'send to BE [job_id={job_id}, submission_id={submission_id}]')
-            # open in binary mode as requests needs a binary stream
-            with open(tmpf.name, "rb") as payload:
-                resp = requests.put(
-                    f'{config.BACKEND_API}/submission/{submission_id}/complete',
-                    data=payload,
-                    headers={'Content-Type': 'application/json'},
-                )
-        logger().debug(f'get BE response: [{resp.status_code}] {resp.text}', )
-        # clear
-        if resp.ok:
-            file_manager.clean_data(job_id)
-        # copy to another place
-        else:
-            file_manager.backup_data(job_id)
+    def reject(
+        self,
+        job_id: str,
+        submission_id: str,
+        tasks: List[Task],
+        trace: Optional[tracing.SpanContext] = None,
+    ):
+        '''
+        report a job that can not be judged, every case of `tasks` is JE.
+        `tasks` may be empty if the problem meta is unknown
+        '''
+        logger().warning(f'reject job {job_id} (submission {submission_id})')
+        results = CaseResults(tasks)
+        for case_no in results.case_nos():
+            CASES.inc(status='JE')
+            results.set(
+                case_no,
+                CaseResult(
+                    stdout='',
+                    stderr='',
+                    exit_code=-1,
+                    exec_time=-1,
+                    mem_usage=-1,
+                    status='JE',
+                ),
+            )
+        self.reporter.report(
+            Report(
+                job_id=job_id,
+                submission_id=submission_id,
+                tasks=results.to_tasks(),
+                trace=trace,
+            ))
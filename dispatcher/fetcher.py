@@ -0,0 +1,136 @@
+import threading
+import time
+from contextlib import ExitStack
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Callable, ContextManager, Dict, List, Optional, Set
+
+from telemetry import tracing
+
+from .constant import Language
+from .testdata import TestdataNotFound, ensure_testdata, pin_testdata
+from .utils import logger
+
+
+@dataclass
+class PendingSubmission:
+    submission_id: str
+    problem_id: int
+    language: Language
+    # the source zip
+    source: bytes
+    # the trace of the request, if traced
+    trace: Optional[tracing.SpanContext] = None
+    # times it was released but had to wait again
+    retries: int = 0
+
+
+class TestdataFetcher:
+    '''
+    hold submissions whose testdata may be stale and bring it up to date
+    off the request path
+
+    the first submission waiting for a problem schedules one sync of its
+    testdata, submissions arriving while it runs join the same wait.
+    once it finishes every waiting submission is passed to `on_ready`, or
+    to `on_failed` with the error if the sync failed. a released
+    submission which can not be queued yet waits again by `wait_for`.
+    '''
+
+    def __init__(
+        self,
+        on_ready: Callable[[PendingSubmission], None],
+        on_failed: Callable[[PendingSubmission, Exception], None],
+        max_workers: int = 2,
+        ensure: Callable[[int], None] = ensure_testdata,
+        pin: Callable[[int], ContextManager] = pin_testdata,
+    ):
+        self.on_ready = on_ready
+        self.on_failed = on_failed
+        self.ensure = ensure
+        self.pin = pin
+        self.lock = threading.Lock()
+        # type: Dict[problem_id, List[PendingSubmission]]
+        self.waiting: Dict[int, List[PendingSubmission]] = {}
+        # timers of submissions waiting for a delayed `wait_for`
+        self.delayed: Set[threading.Timer] = set()
+        self.pool = ThreadPoolExecutor(
+            max_workers=max_workers,
+            thread_name_prefix='testdata',
+        )
+
+    def wait_for(self, pending: PendingSubmission, delay: float = 0):
+        '''
+        hold `pending` until the testdata of its problem is synced, the
+        sync starts `delay` seconds later if given
+        '''
+        if delay > 0:
+            timer = threading.Timer(delay, self.resume, (pending, ))
+            timer.daemon = True
+            with self.lock:
+                self.delayed.add(timer)
+            timer.start()
+            return
+        with self.lock:
+            waiting = self.waiting.setdefault(pending.problem_id, [])
+            waiting.append(pending)
+            # a sync of this problem is already scheduled
+            if len(waiting) > 1:
+                return
+        self.pool.submit(self.sync, pending.problem_id)
+
+    def resume(self, pending: PendingSubmission):
+        with self.lock:
+            self.delayed.discard(threading.current_thread())
+        self.wait_for(pending)
+
+    def sync(self, problem_id: int):
+        start = time.time()
+        error = None
+        try:
+            self.ensure(problem_id)
+        except Exception as e:
+            logger().error(f'fail to sync testdata '
+                           f'[problem_id={problem_id}]: {e!r}')
+            error = e
+        # later submissions schedule a new sync
+        with self.lock:
+            waiting = self.waiting.pop(problem_id, [])
+        end = time.time()
+        with ExitStack() as stack:
+            if error is None:
+                try:
+                    # keep it from eviction until every waiting submission
+                    # is extracted
+                    stack.enter_context(self.pin(problem_id))
+                except TestdataNotFound:
+                    # already evicted, `on_ready` finds it out
+                    pass
+            for pending in waiting:
+                tracing.record(
+                    'testdata.sync',
+                    start,
+                    end,
+                    pending.trace,
+                    problem_id=problem_id,
+                    ok=error is None,
+                )
+                try:
+                    if error is None:
+                        self.on_ready(pending)
+                    else:
+                        self.on_failed(pending, error)
+                except Exception as e:
+                    logger().error(f'fail to release submission '
+                                   f'{pending.submission_id}: {e!r}')
+
+    def waiting_count(self) -> int:
+        with self.lock:
+            return sum(map(len, self.waiting.values())) + len(self.delayed)
+
+    def shutdown(self):
+        with self.lock:
+            delayed, self.delayed = self.delayed, set()
+        for timer in delayed:
+            timer.cancel()
+        self.pool.shutdown(wait=False)
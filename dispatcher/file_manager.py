@@ -1,12 +1,83 @@
+import errno
+import fcntl
 import os
 import shutil
+import time
 from datetime import datetime
 from zipfile import ZipFile
 from pathlib import Path
+from typing import Callable, List, Optional
 from . import config
+from .constant import Language
 from .meta import Meta
 from .utils import logger
 
+# ioctl cloning a whole file on copy-on-write filesystems (btrfs, xfs)
+FICLONE = 0x40049409
+# ways to build a job's testcase directory
+WORKSPACE_MODES = ('copy', 'hardlink', 'reflink')
+# the inputs of a job without their answers, mounted by batch execution
+INPUT_DIR = 'testcase-in'
+
+
+def reflink(src: str, dst: str):
+    with open(src, 'rb') as fsrc, open(dst, 'wb') as fdst:
+        fcntl.ioctl(fdst.fileno(), FICLONE, fsrc.fileno())
+    shutil.copystat(src, dst)
+
+
+def link_function(mode: str) -> Callable[[str, str], None]:
+    '''
+    get a `copy_function` for `shutil.copytree` sharing file content with
+    the source if `mode` allows, it copies if the filesystem does not
+    support that (e.g. another device)
+    '''
+    if mode not in WORKSPACE_MODES:
+        raise ValueError(f'unknown testdata workspace mode: {mode}')
+    if mode == 'copy':
+        return shutil.copy2
+    share = os.link if mode == 'hardlink' else reflink
+
+    def copy(src: str, dst: str):
+        try:
+            share(src, dst)
+        except OSError as e:
+            if e.errno not in {
+                    errno.EXDEV,
+                    errno.EPERM,
+                    errno.EMLINK,
+                    errno.EOPNOTSUPP,
+                    errno.EINVAL,
+                    errno.ENOTTY,
+            }:
+                raise
+            # a failed reflink leaves an empty file behind
+            if os.path.lexists(dst):
+                os.unlink(dst)
+            shutil.copy2(src, dst)
+
+    return copy
+
+
+def check_source(source, language: Language):
+    '''
+    validate a source zip without extracting it, raise ValueError if it
+    would be rejected by `extract`
+    '''
+    with ZipFile(source) as zf:
+        # top level entries, as they would appear in the `src` directory
+        names = {name.split('/')[0] for name in zf.namelist()}
+    source.seek(0)
+    if len(names) == 0:
+        raise ValueError('no file in \'src\' directory')
+    language_type = ['.c', '.cpp', '.py'][int(language)]
+    for name in names:
+        stem, suffix = os.path.splitext(name)
+        if stem != 'main':
+            raise ValueError('none main')
+        if suffix != language_type:
+            raise ValueError('data type is not match')
+
 
 def extract(
     root_dir: Path,
@@ -14,7 +85,16 @@ def extract(
     meta: Meta,
     source,
     testdata: Path,
+    digest: Optional[Path] = None,
+    mode: Optional[str] = None,
 ):
+    '''
+    create the directory of a job, `mode` is how the testdata is put into
+    it, see `WORKSPACE_MODES`
+    '''
+    if mode is None:
+        mode = config.TESTDATA_WORKSPACE
+    testdata = Path(testdata)
     job_dir = root_dir / job_id
     job_dir.mkdir()
     (job_dir / 'meta.json').write_text(meta.json())
@@ -38,17 +118,44 @@ def extract(
             raise ValueError('none main')
         if _file.suffix != language_type:
             raise ValueError('data type is not match')
-    # copy testdata
+    # copy testdata, files are shared with the problem directory unless
+    # in copy mode, so nothing may write to them
     testcase_dir = job_dir / 'testcase'
-    shutil.copytree(testdata, testcase_dir)
-    # move chaos files to src directory
-    chaos_dir = testcase_dir / 'chaos'
+    shutil.copytree(
+        testdata,
+        testcase_dir,
+        copy_function=link_function(mode),
+        ignore=lambda d, _: ['chaos'] if Path(d) == testdata else [],
+    )
+    # copy chaos files to src directory, always real copies because the
+    # submission is free to modify them
+    chaos_dir = testdata / 'chaos'
     if chaos_dir.exists():
         if chaos_dir.is_file():
             raise ValueError('\'chaos\' can not be a file')
         for chaos_file in chaos_dir.iterdir():
-            shutil.move(str(chaos_file), str(code_dir))
-        os.rmdir(chaos_dir)
+            if chaos_file.is_dir():
+                shutil.copytree(chaos_file, code_dir / chaos_file.name)
+            else:
+                shutil.copy2(chaos_file, code_dir)
+    # digests of the expected outputs, judging falls back to a full
+    # compare without them
+    if digest is not None and digest.exists():
+        shutil.copyfile(digest, job_dir / 'digest.json')
+
+
+def link_inputs(job_dir: Path) -> Path:
+    '''
+    link every input of a job into `INPUT_DIR`, so a container can get the
+    inputs without the expected outputs next to them. return the directory
+    '''
+    input_dir = job_dir / INPUT_DIR
+    input_dir.mkdir(exist_ok=True)
+    link = link_function('hardlink')
+    for path in (job_dir / 'testcase').glob('*.in'):
+        if not (input_dir / path.name).exists():
+            link(str(path), str(input_dir / path.name))
+    return input_dir
 
 
 def clean_data(job_id):
@@ -60,3 +167,40 @@ def backup_data(job_id):
     job_dir = config.SUBMISSION_DIR / job_id
     dest = config.SUBMISSION_BACKUP_DIR / f'{job_id}_{datetime.now().strftime("%Y-%m-%d_%H:%M:%S")}'
     shutil.move(job_dir, dest)
+    # the time it was backed up, see `prune_backups`
+    os.utime(dest)
+    prune_backups()
+
+
+def prune_backups(
+    max_age: Optional[float] = None,
+    max_count: Optional[int] = None,
+    now: Optional[float] = None,
+) -> List[Path]:
+    '''
+    remove backups older than `max_age` seconds and the oldest ones past
+    `max_count`, 0 disables either limit. return the removed ones
+    '''
+    if max_age is None:
+        max_age = config.SUBMISSION_BACKUP_MAX_AGE
+    if max_count is None:
+        max_count = config.SUBMISSION_BACKUP_MAX_COUNT
+    if max_age <= 0 and max_count <= 0:
+        return []
+    if now is None:
+        now = time.time()
+    backups = sorted((backup.stat().st_mtime, backup)
+                     for backup in config.SUBMISSION_BACKUP_DIR.iterdir()
+                     if backup.is_dir())
+    # the newest first
+    backups.reverse()
+    removed = []
+    for i, (backed_up_at, backup) in enumerate(backups):
+        too_old = max_age > 0 and now - backed_up_at > max_age
+        too_many = max_count > 0 and i >= max_count
+        if too_old or too_many:
+            shutil.rmtree(backup, ignore_errors=True)
+            removed.append(backup)
+    if removed:
+        logger().info(f'remove {len(removed)} submission backups')
+    return removed
@@ -1,9 +1,17 @@
-from dataclasses import dataclass
+import queue
+import time
+from dataclasses import dataclass, field
+
+
+def queued_at_field():
+    # when the job entered the queue, kept out of comparisons
+    return field(default_factory=time.monotonic, compare=False, repr=False)
 
 
 @dataclass
 class Compile:
     job_id: str
+    queued_at: float = queued_at_field()
 
 
 @dataclass
@@ -11,3 +19,29 @@ class Execute:
     job_id: str
     task_id: int
     case_id: int
+    queued_at: float = queued_at_field()
+
+
+@dataclass
+class ExecuteBatch:
+    '''
+    execute every case of a job in one container
+    '''
+    job_id: str
+    queued_at: float = queued_at_field()
+
+
+class JobQueue(queue.Queue):
+    '''
+    a `queue.Queue` which can push items to its head regardless of `maxsize`
+
+    used for items that were already admitted once (or control signals
+    such as the stop sentinel), they should neither be rejected nor wait
+    behind newer submissions.
+    '''
+
+    def put_front(self, *items):
+        with self.not_empty:
+            self.queue.extendleft(reversed(items))
+            self.unfinished_tasks += len(items)
+            self.not_empty.notify(len(items))
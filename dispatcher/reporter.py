@@ -0,0 +1,233 @@
+import gzip
+import json
+import queue
+import threading
+import time
+from dataclasses import dataclass
+from typing import List, Optional
+
+import requests
+
+from telemetry import metrics, tracing
+from . import config, file_manager
+from .utils import logger
+
+UPLOAD_SECONDS = metrics.histogram(
+    'sandbox_report_upload_seconds',
+    'Time to upload results to backend, retries included.',
+    ('endpoint', ),
+)
+REPORTS = metrics.counter(
+    'sandbox_reports',
+    'Reported jobs by whether backend accepted them.',
+    ('result', ),
+)
+
+
+@dataclass
+class Report:
+    job_id: str
+    submission_id: str
+    tasks: List[List[dict]]
+    # the trace of the job, if traced
+    trace: Optional[tracing.SpanContext] = None
+
+
+# statuses meaning backend has no bulk endpoint
+BULK_UNSUPPORTED = {404, 405, 501}
+
+
+class ResultReporter(threading.Thread):
+    '''
+    upload finished jobs to backend on its own thread, so judging never
+    waits for backend
+
+    reports are buffered in a bounded queue. reports arriving within
+    `flush_interval` seconds are sent together in one bulk request of at
+    most `batch_size` jobs, falling back to one request per job if
+    backend does not support it or rejects the batch. a failed upload is
+    retried with exponential backoff on network errors, 429 and 5xx
+    responses; the job directory is cleaned after success and backed up
+    otherwise.
+    '''
+
+    def __init__(
+        self,
+        base_url: str = config.BACKEND_API,
+        session=None,
+        queue_size: int = 256,
+        timeout: float = 10,
+        max_retries: int = 3,
+        backoff: float = 1,
+        gzip_payload: bool = False,
+        batch_size: int = 1,
+        flush_interval: float = 0.2,
+        sleep=time.sleep,
+    ):
+        super().__init__(daemon=True)
+        self.base_url = base_url.rstrip('/')
+        self.session = session if session is not None else requests.Session()
+        self.queue = queue.Queue(queue_size)
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.gzip_payload = gzip_payload
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        # turned off once backend rejects a bulk request as unknown
+        self.bulk_supported = True
+        self.sleep = sleep
+
+    def report(self, report: Report):
+        '''
+        queue a finished job, block if the queue is full
+        '''
+        self.queue.put(report)
+
+    def run(self):
+        stopping = False
+        while not stopping:
+            report = self.queue.get()
+            # stop sentinel, every report queued before it was sent
+            if report is None:
+                break
+            batch = [report]
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size:
+                try:
+                    report = self.queue.get(
+                        timeout=max(0, deadline - time.monotonic()))
+                except queue.Empty:
+                    break
+                if report is None:
+                    stopping = True
+                    break
+                batch.append(report)
+            self.flush(batch)
+
+    def stop(self):
+        self.queue.put(None)
+
+    def flush(self, batch: List[Report]):
+        start = time.time()
+        try:
+            if len(batch) > 1 and self.bulk_supported:
+                results = self.send_bulk(batch)
+                if results is None:
+                    logger().info('backend has no bulk endpoint, '
+                                  'fall back to per submission upload')
+                    self.bulk_supported = False
+            else:
+                results = None
+            if results is None:
+                results = [self.send(report) for report in batch]
+        except Exception as e:
+            logger().error(f'fail to report jobs: {e!r}')
+            results = [False] * len(batch)
+        end = time.time()
+        for report, ok in zip(batch, results):
+            REPORTS.inc(result='ok' if ok else 'failed')
+            tracing.record(
+                'report.upload',
+                start,
+                end,
+                report.trace,
+                ok=ok,
+                batch=len(batch),
+            )
+            try:
+                if ok:
+                    file_manager.clean_data(report.job_id)
+                else:
+                    file_manager.backup_data(report.job_id)
+            except FileNotFoundError:
+                # rejected before it was extracted
+                pass
+            except OSError as e:
+                logger().error(f'fail to clean job {report.job_id}: {e!r}')
+
+    def payload(self, data: dict):
+        '''
+        serialize a request body, return it with the request headers
+        '''
+        headers = {'Content-Type': 'application/json'}
+        data = {**data, 'token': config.SANDBOX_TOKEN}
+        # bytes, so requests sends them as they are. a file would be asked
+        # for its `fileno` to get the length
+        body = json.dumps(data).encode()
+        if self.gzip_payload:
+            headers['Content-Encoding'] = 'gzip'
+            body = gzip.compress(body)
+        return body, headers
+
+    def send(self, report: Report) -> bool:
+        '''
+        upload a report, return whether backend accepted it
+        '''
+        logger().info(f'send to BE [job_id={report.job_id}, '
+                      f'submission_id={report.submission_id}]')
+        with UPLOAD_SECONDS.time(endpoint='single'):
+            resp = self.put(
+                f'{self.base_url}/submission/{report.submission_id}/complete',
+                {'tasks': report.tasks},
+            )
+        return resp is not None and resp.ok
+
+    def send_bulk(self, batch: List[Report]) -> Optional[List[bool]]:
+        '''
+        upload reports in one request, return whether each of them was
+        accepted, or None if backend does not support bulk upload. the
+        reports of a rejected request are uploaded one by one
+        '''
+        logger().info(f'send {len(batch)} submissions to BE: '
+                      f'{[report.submission_id for report in batch]}')
+        with UPLOAD_SECONDS.time(endpoint='bulk'):
+            resp = self.put(
+                f'{self.base_url}/submission/complete',
+                {
+                    'submissions': [{
+                        'submissionId': report.submission_id,
+                        'tasks': report.tasks,
+                    } for report in batch],
+                },
+            )
+        # backend was never reached, one by one would not reach it either
+        if resp is None:
+            return [False] * len(batch)
+        if resp.status_code in BULK_UNSUPPORTED:
+            return None
+        if resp.ok:
+            return [True] * len(batch)
+        # one bad report must not discard the others
+        logger().warning(f'backend rejects bulk upload [{resp.status_code}], '
+                         'upload them one by one')
+        return [self.send(report) for report in batch]
+
+    def put(self, url: str, data: dict) -> Optional[requests.Response]:
+        '''
+        PUT `data` to `url` with retries, return the last response or None
+        if backend was never reached
+        '''
+        body, headers = self.payload(data)
+        resp = None
+        for attempt in range(self.max_retries + 1):
+            if attempt:
+                self.sleep(self.backoff * 2**(attempt - 1))
+            try:
+                resp = self.session.put(
+                    url,
+                    data=body,
+                    headers=headers,
+                    timeout=self.timeout,
+                )
+            except requests.RequestException as e:
+                logger().warning(f'fail to send to BE: {e!r}')
+                continue
+            logger().debug(
+                f'get BE response: [{resp.status_code}] {resp.text}')
+            if resp.ok:
+                break
+            # the request itself is wrong, retrying does not help
+            if resp.status_code < 500 and resp.status_code != 429:
+                break
+        return resp
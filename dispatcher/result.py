@@ -0,0 +1,95 @@
+from typing import Iterator, List, NamedTuple, Optional
+from .meta import Task
+
+
+class CaseResult(NamedTuple):
+    stdout: str
+    stderr: str
+    exit_code: int
+    exec_time: int
+    mem_usage: int
+    status: str
+
+    def to_dict(self) -> dict:
+        '''
+        the case result format expected by backend
+        '''
+        return {
+            'stdout': self.stdout,
+            'stderr': self.stderr,
+            'exitCode': self.exit_code,
+            'execTime': self.exec_time,
+            'memoryUsage': self.mem_usage,
+            'status': self.status,
+        }
+
+
+class CaseResults:
+    '''
+    results of every case in a job, one slot per case
+
+    case `ttcc` (task `tt`, case `cc`) lives in slot `offsets[tt] + cc`,
+    and a counter of empty slots makes completion checks constant time.
+    '''
+    __slots__ = ('offsets', 'counts', 'slots', 'remaining')
+
+    def __init__(self, tasks: List[Task]):
+        self.offsets = []
+        self.counts = []
+        total = 0
+        for task in tasks:
+            self.offsets.append(total)
+            self.counts.append(task.caseCount)
+            total += task.caseCount
+        self.slots: List[Optional[CaseResult]] = [None] * total
+        self.remaining = total
+
+    def index(self, case_no: str) -> int:
+        task_id, case_id = int(case_no[:2]), int(case_no[2:])
+        if task_id >= len(self.counts) or case_id >= self.counts[task_id]:
+            raise KeyError(case_no)
+        return self.offsets[task_id] + case_id
+
+    def __contains__(self, case_no: str) -> bool:
+        try:
+            self.index(case_no)
+        except (KeyError, ValueError):
+            return False
+        return True
+
+    def __getitem__(self, case_no: str) -> Optional[CaseResult]:
+        return self.slots[self.index(case_no)]
+
+    def __iter__(self) -> Iterator[Optional[CaseResult]]:
+        return iter(self.slots)
+
+    def __len__(self) -> int:
+        return len(self.slots)
+
+    def case_nos(self) -> List[str]:
+        return [
+            f'{task_id:02d}{case_id:02d}'
+            for task_id, count in enumerate(self.counts)
+            for case_id in range(count)
+        ]
+
+    def set(self, case_no: str, result: CaseResult) -> bool:
+        '''
+        save the result of a case, return True if it was the last one
+        '''
+        i = self.index(case_no)
+        first = self.slots[i] is None
+        self.slots[i] = result
+        # a repeated result must not complete the job twice
+        if not first:
+            return False
+        self.remaining -= 1
+        return self.remaining == 0
+
+    @property
+    def done(self) -> bool:
+        return self.remaining == 0
+
+    def to_tasks(self) -> List[List[dict]]:
+        return [[r.to_dict() for r in self.slots[offset:offset + count]]
+                for offset, count in zip(self.offsets, self.counts)]
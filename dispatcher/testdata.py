@@ -1,30 +1,59 @@
-import io
 import json
+import os
 import secrets
 import shutil
 import hashlib
-from pathlib import Path
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path, PurePosixPath
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, NamedTuple, Optional, Set
 from zipfile import ZipFile
 import requests as rq
 
+from executor.compare import (
+    DIGEST_VERSION,
+    decode,
+    output_digest,
+    read_chunks,
+)
+from telemetry import metrics
+from .compile_cache import dir_size
 from .constant import Language
+from .file_manager import link_function
 from .meta import Meta
+from .testdata_store import TestdataStore
 from .utils import (
     get_redis_client,
     logger,
 )
 from .config import (
     BACKEND_API,
+    CHECKSUM_TTL,
+    META_CACHE_SIZE,
     SANDBOX_TOKEN,
+    TESTDATA_MAX_SIZE,
     TESTDATA_ROOT,
 )
 
 META_DIR = TESTDATA_ROOT / 'meta'
 META_DIR.mkdir(exist_ok=True)
-
-
-def calc_checksum(data: bytes) -> str:
-    return hashlib.md5(data).hexdigest()
+# every extracted version of a problem's testdata, `TESTDATA_ROOT/<id>` is
+# a symlink to the current one
+VERSION_DIR = TESTDATA_ROOT / '.versions'
+VERSION_DIR.mkdir(exist_ok=True)
+# bytes written to disk at once when downloading testdata
+DOWNLOAD_CHUNK_SIZE = 1024 * 1024
+REFRESH_SECONDS = metrics.histogram(
+    'sandbox_testdata_refresh_seconds',
+    'Time to download and install the testdata of a problem.',
+)
+CHECKS = metrics.counter(
+    'sandbox_testdata_checks',
+    'Testdata checks with backend by result.',
+    ('result', ),
+)
 
 
 def handle_problem_response(resp: rq.Response):
@@ -52,32 +81,296 @@ def fetch_problem_meta(problem_id: int) -> str:
     return content
 
 
-def get_problem_meta(problem_id: int, language: Language) -> Meta:
-    meta_path = META_DIR / f'{problem_id}.json'
-    if not meta_path.exists():
-        fetch_problem_meta(problem_id)
-    obj = json.load(meta_path.open())
+def load_problem_meta(meta_path: Path, language: Language) -> Meta:
+    obj = json.loads(meta_path.read_text())
     obj['language'] = int(language)
     return Meta.parse_obj(obj)
 
 
+class MetaCache:
+    '''
+    validated problem metas keyed by problem id and testdata checksum, the
+    least recently used one is dropped once more than `max_size` are kept
+
+    a meta does not change without its checksum, so entries never go
+    stale, they are only replaced by the key of the new checksum
+    '''
+
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        # type: OrderedDict[(problem_id, checksum), Meta]
+        self.entries = OrderedDict()
+
+    def get(
+        self,
+        problem_id: int,
+        checksum: str,
+        load: Callable[[], Meta],
+    ) -> Meta:
+        key = (problem_id, checksum)
+        with self.lock:
+            meta = self.entries.get(key)
+            if meta is not None:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return meta
+            self.misses += 1
+        # parse outside the lock, a concurrent miss only costs a parse
+        meta = load()
+        if self.max_size <= 0:
+            return meta
+        with self.lock:
+            self.entries[key] = meta
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+        return meta
+
+
+META_CACHE = MetaCache(META_CACHE_SIZE)
+
+
+def get_problem_meta(
+    problem_id: int,
+    language: Language,
+    testdata: Optional['PinnedTestdata'] = None,
+) -> Meta:
+    '''
+    get the meta of a problem for a submission in `language`, the one of
+    a pinned testdata version is parsed once and then served from memory
+    '''
+    if testdata is None:
+        meta_path = META_DIR / f'{problem_id}.json'
+        if not meta_path.exists():
+            fetch_problem_meta(problem_id)
+        return load_problem_meta(meta_path, language)
+
+    def load():
+        meta_path = testdata.meta
+        # saved by a sandbox which did not keep metas in versions
+        if not meta_path.exists():
+            meta_path = META_DIR / f'{problem_id}.json'
+        return load_problem_meta(meta_path, language)
+
+    meta = META_CACHE.get(problem_id, testdata.checksum, load)
+    if meta.language == language:
+        return meta
+    # metas are never mutated, the copy shares the validated tasks
+    return meta.copy(update={'language': Language(language)})
+
+
 def get_problem_root(problem_id: int) -> Path:
     return TESTDATA_ROOT / str(problem_id)
 
 
-def fetch_testdata(problem_id: int):
+class PinnedTestdata(NamedTuple):
+    # the testcase files
+    root: Path
+    # the digest index of `root`, see `build_digest_index`
+    digest: Path
+    # the problem meta fetched with `root`
+    meta: Path
+    # backend checksum of `root` and its meta
+    checksum: str
+
+
+class TestdataNotFound(FileNotFoundError):
+    '''
+    the testdata of a problem is not on disk, e.g. it has been evicted
+    '''
+
+
+# type: Dict[version directory, pin count]
+_pins: Dict[Path, int] = {}
+# problems whose testdata is being refreshed
+_refreshing: Set[int] = set()
+# guards `_pins`, `_refreshing` and the symlinks of problem roots
+_pins_lock = threading.Lock()
+
+
+@contextmanager
+def pin_testdata(problem_id: int) -> Iterator[PinnedTestdata]:
+    '''
+    get the current version of a problem's testdata, it is not removed
+    before the block exits even if a newer version replaces it
     '''
-    Fetch testdata from backend server
+    with _pins_lock:
+        root = get_problem_root(problem_id)
+        if not root.is_symlink():
+            raise TestdataNotFound(f'no testdata of problem {problem_id}')
+        root = root.resolve()
+        version = root.parent
+        _pins[version] = _pins.get(version, 0) + 1
+    TESTDATA_STORE.touch(problem_id)
+    try:
+        yield PinnedTestdata(
+            root=root,
+            digest=version / 'digest.json',
+            meta=version / 'meta.json',
+            # versions are named `<checksum>-<token>`
+            checksum=version.name.split('-')[0],
+        )
+    finally:
+        with _pins_lock:
+            _pins[version] -= 1
+            if _pins[version] == 0:
+                del _pins[version]
+        collect_versions(problem_id)
+
+
+def collect_versions(problem_id: int):
+    '''
+    remove the versions of a problem which are neither current nor pinned
+    '''
+    problem_versions = (VERSION_DIR / str(problem_id)).resolve()
+    victims = []
+    with _pins_lock:
+        root = get_problem_root(problem_id)
+        current = root.resolve().parent if root.is_symlink() else None
+        if not problem_versions.exists():
+            return
+        for version in problem_versions.iterdir():
+            # being written by a refresh
+            if version.name.startswith('.'):
+                continue
+            if version == current or version in _pins:
+                continue
+            # hide it from `pin_testdata` before it is removed
+            victim = version.with_name(f'.removed-{version.name}')
+            os.rename(version, victim)
+            victims.append(victim)
+    for victim in victims:
+        logger().debug(f'remove testdata version {victim}')
+        shutil.rmtree(victim, ignore_errors=True)
+
+
+def switch_version(problem_id: int, version: Path):
+    '''
+    point the problem root at `version` atomically
+    '''
+    root = get_problem_root(problem_id)
+    link = root.with_name(f'.{root.name}-{secrets.token_hex(4)}')
+    os.symlink(os.path.relpath(version / 'testdata', root.parent), link)
+    with _pins_lock:
+        # extracted in place by an older sandbox, moved aside once
+        if root.exists() and not root.is_symlink():
+            legacy = version.with_name(f'.removed-{secrets.token_hex(4)}')
+            os.rename(root, legacy)
+            shutil.rmtree(legacy, ignore_errors=True)
+        os.replace(link, root)
+
+
+def build_digest_index(
+    testdata_dir: Path,
+    index_path: Path,
+    checksum: str,
+    known: Optional[Dict[str, dict]] = None,
+):
+    '''
+    save the digest of every expected output, so judging a case does not
+    need to read its `.out` file. `known` maps case numbers to digests
+    still valid for their output, these are not computed again
+    '''
+    known = known or {}
+    cases = {}
+    for out_path in sorted(testdata_dir.glob('*.out')):
+        digest = known.get(out_path.stem)
+        if digest is None or digest.get('version') != DIGEST_VERSION:
+            digest = output_digest(decode(read_chunks(out_path)))
+        cases[out_path.stem] = digest
+    tmp_path = index_path.with_name(f'.{index_path.name}')
+    tmp_path.write_text(json.dumps({'checksum': checksum, 'cases': cases}))
+    os.replace(tmp_path, index_path)
+
+
+def read_manifest(version: Path) -> Dict[str, dict]:
+    '''
+    the files of a version as path -> {'crc32', 'size'}, empty if it was
+    written without a manifest
+    '''
+    try:
+        return json.loads((version / 'manifest.json').read_text())
+    except (OSError, ValueError):
+        return {}
+
+
+def zip_manifest(zf: ZipFile) -> Dict[str, dict]:
+    '''
+    the manifest of an archive, taken from its central directory so no
+    member has to be decompressed
+    '''
+    return {
+        info.filename: {
+            'crc32': info.CRC,
+            'size': info.file_size,
+        }
+        for info in zf.infolist() if not info.is_dir()
+    }
+
+
+def is_plain_path(name: str) -> bool:
+    '''
+    whether `ZipFile.extract` would write member `name` to `dest / name`
+    '''
+    path = PurePosixPath(name)
+    return not path.is_absolute() and '..' not in path.parts \
+        and '\\' not in name
+
+
+def extract_testdata(
+    archive: Path,
+    dest: Path,
+    base: Optional[Path] = None,
+) -> Dict[str, dict]:
+    '''
+    extract a testdata archive into `dest` and return its manifest
+
+    files listed with the same crc32 and size in the manifest of version
+    `base` are hard linked from it instead of being decompressed again,
+    so a refresh only writes the files which changed
+    '''
+    previous = read_manifest(base) if base is not None else {}
+    share = link_function('hardlink')
+    dest.mkdir()
+    with ZipFile(archive) as zf:
+        manifest = zip_manifest(zf)
+        changed = 0
+        for info in zf.infolist():
+            name = info.filename
+            if not info.is_dir() and is_plain_path(name) \
+                    and previous.get(name) == manifest[name]:
+                (dest / name).parent.mkdir(parents=True, exist_ok=True)
+                share(str(base / 'testdata' / name), str(dest / name))
+            else:
+                zf.extract(info, dest)
+                changed += not info.is_dir()
+    logger().debug(f'extract testdata [archive={archive}, '
+                   f'changed={changed}, total={len(manifest)}]')
+    return manifest
+
+
+def download_testdata(problem_id: int, dest: Path):
+    '''
+    stream testdata from backend server into `dest`, return its md5
     '''
     logger().debug(f'fetch problem testdata [problem_id={problem_id}]')
-    resp = rq.get(
-        f'{BACKEND_API}/problem/{problem_id}/testdata',
-        params={
-            'token': SANDBOX_TOKEN,
-        },
-    )
-    handle_problem_response(resp)
-    return resp.content
+    md5 = hashlib.md5()
+    with rq.get(
+            f'{BACKEND_API}/problem/{problem_id}/testdata',
+            params={
+                'token': SANDBOX_TOKEN,
+            },
+            stream=True,
+    ) as resp:
+        handle_problem_response(resp)
+        with dest.open('wb') as f:
+            for chunk in resp.iter_content(DOWNLOAD_CHUNK_SIZE):
+                f.write(chunk)
+                md5.update(chunk)
+    return md5
 
 
 def get_checksum(problem_id: int) -> str:
@@ -91,30 +384,257 @@ def get_checksum(problem_id: int) -> str:
     return resp.json()['data']
 
 
+class Flight:
+    __slots__ = ('done', 'error')
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.error: Optional[BaseException] = None
+
+
+class ChecksumCache:
+    '''
+    problems whose testdata was confirmed up to date in the last `ttl`
+    seconds, and the checks in flight
+
+    concurrent `ensure` calls for one problem share a single check, the
+    others wait for it and get its result or its exception
+    '''
+
+    def __init__(self, ttl: float, clock=time.monotonic):
+        self.ttl = ttl
+        self.clock = clock
+        self.lock = threading.Lock()
+        # type: Dict[problem_id, confirmed_at]
+        self.confirmed = {}
+        # type: Dict[problem_id, Flight]
+        self.flights = {}
+
+    def is_fresh(self, problem_id: int) -> bool:
+        with self.lock:
+            return self._is_fresh(problem_id)
+
+    def _is_fresh(self, problem_id: int) -> bool:
+        confirmed_at = self.confirmed.get(problem_id)
+        return confirmed_at is not None \
+            and self.clock() - confirmed_at < self.ttl
+
+    def ensure(self, problem_id: int, check: Callable[[], None]):
+        with self.lock:
+            if self._is_fresh(problem_id):
+                return
+            flight = self.flights.get(problem_id)
+            leader = flight is None
+            if leader:
+                flight = self.flights[problem_id] = Flight()
+        if not leader:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return
+        try:
+            check()
+        except BaseException as e:
+            flight.error = e
+            raise
+        else:
+            with self.lock:
+                self.confirmed[problem_id] = self.clock()
+        finally:
+            with self.lock:
+                del self.flights[problem_id]
+            flight.done.set()
+
+    def forget(self, problem_id: int):
+        with self.lock:
+            self.confirmed.pop(problem_id, None)
+
+
+CHECKSUM_CACHE = ChecksumCache(CHECKSUM_TTL)
+
+
+def remove_problem(problem_id: int) -> bool:
+    '''
+    remove every version of a problem from disk, return False without
+    removing anything if it is pinned or being refreshed
+    '''
+    root = get_problem_root(problem_id)
+    problem_versions = (VERSION_DIR / str(problem_id)).resolve()
+    with _pins_lock:
+        if problem_id in _refreshing:
+            return False
+        if any(version.parent == problem_versions for version in _pins):
+            return False
+        # the next submission has to sync it again
+        CHECKSUM_CACHE.forget(problem_id)
+        if root.is_symlink():
+            root.unlink()
+        victim = None
+        if problem_versions.exists():
+            # hide it from `collect_versions` before it is removed
+            token = secrets.token_hex(4)
+            victim = VERSION_DIR / f'.removed-{problem_id}-{token}'
+            os.rename(problem_versions, victim)
+    if victim is not None:
+        shutil.rmtree(victim, ignore_errors=True)
+    (META_DIR / f'{problem_id}.json').unlink(missing_ok=True)
+    return True
+
+
+def scan_store(store: TestdataStore):
+    '''
+    load the problems extracted by a previous process, ordered by when
+    they were last switched to a new version
+    '''
+    problems = []
+    for problem_versions in VERSION_DIR.iterdir():
+        # removal that did not finish
+        if problem_versions.name.startswith('.'):
+            shutil.rmtree(problem_versions, ignore_errors=True)
+            continue
+        if not problem_versions.name.isdigit():
+            continue
+        root = get_problem_root(problem_versions.name)
+        if not root.is_symlink():
+            continue
+        last_used = root.lstat().st_mtime
+        problems.append((last_used, int(problem_versions.name), root))
+    for last_used, problem_id, root in sorted(problems):
+        store.add(problem_id, dir_size(root.resolve().parent), last_used)
+
+
+TESTDATA_STORE = TestdataStore(TESTDATA_MAX_SIZE, evict=remove_problem)
+if TESTDATA_STORE.enabled:
+    scan_store(TESTDATA_STORE)
+
+
 def ensure_testdata(problem_id: int):
     '''
     Ensure the testdata of problem is up to date
     '''
+    CHECKSUM_CACHE.ensure(problem_id, lambda: check_testdata(problem_id))
+
+
+def is_testdata_fresh(problem_id: int) -> bool:
+    '''
+    whether `ensure_testdata` would return at once
+    '''
+    return CHECKSUM_CACHE.is_fresh(problem_id)
+
+
+def check_testdata(problem_id: int):
+    '''
+    compare the local checksum with backend, refresh the testdata under
+    the redis lock only if they differ
+    '''
     client = get_redis_client()
     key = f'problem-{problem_id}-checksum'
     lock_key = f'{key}-lock'
+    checksums = {}
+
+    def up_to_date(curr_checksum: Optional[bytes]) -> bool:
+        if curr_checksum is None:
+            return False
+        if 'backend' not in checksums:
+            checksums['backend'] = get_checksum(problem_id)
+        checksum = checksums['backend']
+        if not secrets.compare_digest(curr_checksum.decode(), checksum):
+            return False
+        # extracted in place by an older sandbox, without digests
+        if not get_problem_root(problem_id).is_symlink():
+            return False
+        logger().debug(
+            f'problem testdata is up to date [problem_id={problem_id}]')
+        return True
+
+    curr_checksum = client.get(key)
+    if up_to_date(curr_checksum):
+        CHECKS.inc(result='fresh')
+        return
     with client.lock(lock_key, timeout=60):
-        curr_checksum = client.get(key)
-        if curr_checksum is not None:
-            curr_checksum = curr_checksum.decode()
-            checksum = get_checksum(problem_id)
-            if secrets.compare_digest(curr_checksum, checksum):
-                logger().debug(
-                    f'problem testdata is up to date [problem_id={problem_id}]'
-                )
-                return
-        logger().info(f'refresh problem testdata [problem_id={problem_id}]')
-        testdata = fetch_testdata(problem_id)
-        problem_root = get_problem_root(problem_id)
-        if problem_root.exists():
-            shutil.rmtree(problem_root)
-        with ZipFile(io.BytesIO(testdata)) as zf:
-            zf.extractall(problem_root)
-        meta = fetch_problem_meta(problem_id)
-        checksum = calc_checksum(testdata + meta.encode())
+        # another worker may have refreshed it while we were waiting
+        latest_checksum = client.get(key)
+        if latest_checksum != curr_checksum and up_to_date(latest_checksum):
+            CHECKS.inc(result='refreshed_elsewhere')
+            return
+        checksum = refresh_testdata(problem_id)
         client.setex(key, 600, checksum)
+    CHECKS.inc(result='refreshed')
+
+
+def refresh_testdata(problem_id: int) -> str:
+    '''
+    install the latest testdata of a problem, then evict cold problems if
+    the store is over its budget. return its checksum
+    '''
+    with _pins_lock:
+        _refreshing.add(problem_id)
+    try:
+        with REFRESH_SECONDS.time():
+            checksum = install_testdata(problem_id)
+    finally:
+        with _pins_lock:
+            _refreshing.discard(problem_id)
+    # without a budget nothing is evicted, so the version is not walked
+    if TESTDATA_STORE.enabled:
+        version = get_problem_root(problem_id).resolve().parent
+        TESTDATA_STORE.add(problem_id, dir_size(version))
+        for evicted in TESTDATA_STORE.evict(keep=problem_id):
+            logger().info(f'evict problem testdata [problem_id={evicted}]')
+    return checksum
+
+
+def install_testdata(problem_id: int) -> str:
+    '''
+    download and extract the testdata into a new version, then switch to
+    it. files unchanged since the current version are linked from it.
+    return its checksum
+    '''
+    logger().info(f'refresh problem testdata [problem_id={problem_id}]')
+    # files shared with the new version are taken from the current one,
+    # only a refresh switches versions so it stays current until then
+    root = get_problem_root(problem_id)
+    base = root.resolve().parent if root.is_symlink() else None
+    problem_versions = VERSION_DIR / str(problem_id)
+    problem_versions.mkdir(exist_ok=True)
+    # left by a refresh that did not finish, only one runs at a time
+    for leftover in problem_versions.glob('.*'):
+        if leftover.is_dir():
+            shutil.rmtree(leftover, ignore_errors=True)
+        else:
+            leftover.unlink()
+    tmp = problem_versions / f'.{secrets.token_hex(4)}'
+    tmp.mkdir()
+    archive = tmp / 'testdata.zip'
+    md5 = download_testdata(problem_id, archive)
+    manifest = extract_testdata(archive, tmp / 'testdata', base)
+    archive.unlink()
+    meta = fetch_problem_meta(problem_id)
+    # same as the md5 of the testdata followed by the meta
+    md5.update(meta.encode())
+    checksum = md5.hexdigest()
+    # digests of outputs which did not change are still valid
+    known = {}
+    if base is not None:
+        previous = read_manifest(base)
+        try:
+            cases = json.loads((base / 'digest.json').read_text())['cases']
+        except (OSError, ValueError, KeyError):
+            cases = {}
+        for case_no, digest in cases.items():
+            name = f'{case_no}.out'
+            if name in manifest and previous.get(name) == manifest[name]:
+                known[case_no] = digest
+    build_digest_index(
+        tmp / 'testdata',
+        tmp / 'digest.json',
+        checksum,
+        known=known,
+    )
+    (tmp / 'manifest.json').write_text(json.dumps(manifest))
+    (tmp / 'meta.json').write_text(meta)
+    version = problem_versions / f'{checksum}-{secrets.token_hex(4)}'
+    os.rename(tmp, version)
+    switch_version(problem_id, version)
+    collect_versions(problem_id)
+    return checksum
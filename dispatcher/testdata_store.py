@@ -0,0 +1,106 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, List
+
+
+class TestdataStore:
+    '''
+    the disk usage and last use of every extracted problem, cold problems
+    are evicted in LRU order once the total size exceeds `max_size` bytes
+
+    `evict` removes a problem from disk and returns False if it is in use
+    and must be kept, a kept problem is tried again on the next eviction
+    '''
+
+    def __init__(
+        self,
+        max_size: int,
+        evict: Callable[[int], bool],
+        clock=time.time,
+    ):
+        self.max_size = max_size
+        self.remove = evict
+        self.clock = clock
+        self.lock = threading.Lock()
+        self.evictions = 0
+        # type: OrderedDict[problem_id, size], the least recently used first
+        self.entries = OrderedDict()
+        # type: Dict[problem_id, last_used_at]
+        self.last_used = {}
+        self.size = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_size > 0
+
+    def add(self, problem_id: int, size: int, last_used: float = None):
+        '''
+        record the size of a problem's current testdata as the most
+        recently used one
+        '''
+        with self.lock:
+            self.size += size - self.entries.get(problem_id, 0)
+            self.entries[problem_id] = size
+            self.entries.move_to_end(problem_id)
+            self.last_used[problem_id] = last_used or self.clock()
+
+    def touch(self, problem_id: int):
+        with self.lock:
+            if problem_id not in self.entries:
+                return
+            self.entries.move_to_end(problem_id)
+            self.last_used[problem_id] = self.clock()
+
+    def discard(self, problem_id: int):
+        with self.lock:
+            self.size -= self.entries.pop(problem_id, 0)
+            self.last_used.pop(problem_id, None)
+
+    def evict(self, keep: int = None) -> List[int]:
+        '''
+        remove the least recently used problems until the size fits,
+        problem `keep` is never removed. return the removed ones
+        '''
+        if not self.enabled:
+            return []
+        with self.lock:
+            candidates = [
+                problem_id for problem_id in self.entries if problem_id != keep
+            ]
+            over = self.size - self.max_size
+        evicted = []
+        for problem_id in candidates:
+            if over <= 0:
+                break
+            with self.lock:
+                size = self.entries.get(problem_id)
+            # discarded since the candidates were listed
+            if size is None or not self.remove(problem_id):
+                continue
+            self.discard(problem_id)
+            over -= size
+            evicted.append(problem_id)
+        with self.lock:
+            self.evictions += len(evicted)
+        return evicted
+
+    def usage(self) -> List[dict]:
+        '''
+        every problem on disk, the least recently used first
+        '''
+        with self.lock:
+            return [{
+                'problemId': problem_id,
+                'size': size,
+                'lastUsed': self.last_used[problem_id],
+            } for problem_id, size in self.entries.items()]
+
+    def stats(self) -> dict:
+        with self.lock:
+            return {
+                'problems': len(self.entries),
+                'size': self.size,
+                'maxSize': self.max_size,
+                'evictions': self.evictions,
+            }
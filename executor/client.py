@@ -0,0 +1,41 @@
+import atexit
+import threading
+from typing import Dict
+import docker
+
+# connections kept alive to one docker daemon, enough for every worker
+# lane and the container pools to talk to it at once
+MAX_POOL_SIZE = 32
+
+# type: Dict[base_url, docker.APIClient]
+_clients: Dict[str, docker.APIClient] = {}
+_clients_lock = threading.Lock()
+
+
+def get_client(base_url: str) -> docker.APIClient:
+    '''
+    get the docker client shared by the whole process
+
+    `APIClient` is a `requests.Session` backed by a thread safe urllib3
+    connection pool, so sharing one per daemon lets every case reuse an
+    open connection instead of connecting and asking for the API version
+    again.
+    '''
+    with _clients_lock:
+        client = _clients.get(base_url)
+        if client is None:
+            client = docker.APIClient(
+                base_url=base_url,
+                max_pool_size=MAX_POOL_SIZE,
+            )
+            _clients[base_url] = client
+        return client
+
+
+@atexit.register
+def close_clients():
+    with _clients_lock:
+        clients = [*_clients.values()]
+        _clients.clear()
+    for client in clients:
+        client.close()
@@ -0,0 +1,135 @@
+import codecs
+import hashlib
+import re
+from typing import Iterable, Iterator
+
+# bytes read from an answer file at once
+CHUNK_SIZE = 1024 * 1024
+# the line boundaries of `str.splitlines`
+LINE_BREAK = '\n\r\v\f\x1c\x1d\x1e\x85\u2028\u2029'
+# trailing whitespace of a line and the line break after it, a bare `\n`
+# is left alone since it would be replaced by itself
+LINE_END = re.compile(rf'[^\S{LINE_BREAK}]+(?:\r\n|[{LINE_BREAK}])'
+                      rf'|\r\n?|[{LINE_BREAK[2:]}]')
+# bytes `decode` could not decode, see `surrogateescape`
+ESCAPED = re.compile('[\udc80-\udcff]')
+# bumped when `output_digest` of the same text changes
+DIGEST_VERSION = 2
+
+
+def read_chunks(path, size: int = CHUNK_SIZE) -> Iterator[bytes]:
+    with open(path, 'rb') as f:
+        while True:
+            chunk = f.read(size)
+            if not chunk:
+                return
+            yield chunk
+
+
+def decode(chunks: Iterable[bytes]) -> Iterator[str]:
+    '''
+    decode utf-8 chunks, a character split between chunks is kept whole.
+    an invalid byte becomes a lone surrogate, so outputs differing in
+    invalid bytes never compare equal
+    '''
+    decoder = codecs.getincrementaldecoder('utf-8')(errors='surrogateescape')
+    for chunk in chunks:
+        yield decoder.decode(chunk)
+    yield decoder.decode(b'', final=True)
+
+
+def printable(text: str) -> str:
+    '''
+    drop the invalid bytes kept by `decode`, for text sent to backend
+    '''
+    return ESCAPED.sub('', text)
+
+
+def split_text(text: str, size: int = CHUNK_SIZE) -> Iterator[str]:
+    for i in range(0, len(text), size):
+        yield text[i:i + size]
+
+
+def normalize(texts: Iterable[str]) -> Iterator[str]:
+    '''
+    turn text pieces into pieces of `'\\n'.join(SubmissionExecutor.strip())`
+
+    trailing whitespace is held back until something else follows it. it
+    is kept as the number of line breaks, whether the last one is a `\\r`
+    which a `\\n` may complete, and the whitespace after the last break,
+    so only the longest whitespace run within a line has to fit in memory.
+    '''
+    breaks = 0
+    cr = False
+    # whitespace since the last line break, in pieces
+    spaces = []
+    for text in texts:
+        if not text:
+            continue
+        body = text.rstrip()
+        tail = text[len(body):]
+        if body:
+            if breaks:
+                held = '\n' * (breaks - 1) + ('\r' if cr else '\n')
+            else:
+                held = ''
+            yield LINE_END.sub('\n', ''.join((held, *spaces, body)))
+            breaks, cr, spaces = 0, False, []
+        if not tail:
+            continue
+        # the second half of a `\r\n`
+        if cr and tail[0] == '\n':
+            tail = tail[1:]
+        cr = False
+        count = sum(map(tail.count, LINE_BREAK)) - tail.count('\r\n')
+        if not count:
+            if tail:
+                spaces.append(tail)
+            continue
+        breaks += count
+        end = max(map(tail.rfind, LINE_BREAK)) + 1
+        cr = end == len(tail) and tail[-1] == '\r'
+        spaces = [tail[end:]] if end < len(tail) else []
+    # the held whitespace is trailing whitespace and empty lines, both
+    # stripped
+
+
+def same_output(actual: Iterable[str], expected: Iterable[str]) -> bool:
+    '''
+    compare two texts given in pieces the way `SubmissionExecutor.strip`
+    does, stop at the first difference
+    '''
+    actual = normalize(actual)
+    expected = normalize(expected)
+    a, i = '', 0
+    b, j = '', 0
+    while True:
+        if i == len(a):
+            a, i = next(actual, None), 0
+        if j == len(b):
+            b, j = next(expected, None), 0
+        if a is None or b is None:
+            return a is None and b is None
+        n = min(len(a) - i, len(b) - j)
+        if a[i:i + n] != b[j:j + n]:
+            return False
+        i += n
+        j += n
+
+
+def output_digest(texts: Iterable[str]) -> dict:
+    '''
+    sha256 and byte length of the normalized text, two outputs have the
+    same digest iff `same_output` holds for them
+    '''
+    digest = hashlib.sha256()
+    length = 0
+    for piece in normalize(texts):
+        data = piece.encode('utf-8', 'surrogateescape')
+        digest.update(data)
+        length += len(data)
+    return {
+        'sha256': digest.hexdigest(),
+        'length': length,
+        'version': DIGEST_VERSION,
+    }
@@ -0,0 +1,94 @@
+import json
+import threading
+from dataclasses import dataclass, field
+from typing import Dict
+
+DEFAULT_PATH = '.config/submission.json'
+# bytes a program may write, enforced by the sandbox binary
+OUTPUT_LIMIT = 1024 * 1024 * 1024
+# bytes kept of each result file read back from a container, no output the
+# sandbox allows is cut by default
+DEFAULT_RESULT_MAX_BYTES = OUTPUT_LIMIT
+
+
+@dataclass(frozen=True)
+class SubmissionConfig:
+    '''
+    validated content of `.config/submission.json`
+    '''
+    working_dir: str
+    docker_url: str
+    # type: Dict[lang, lang_id]
+    lang_id: Dict[str, int]
+    # type: Dict[lang, image]
+    image: Dict[str, str]
+    container_pool: dict = field(default_factory=dict)
+    result_max_bytes: int = DEFAULT_RESULT_MAX_BYTES
+
+    @classmethod
+    def from_dict(cls, data: dict) -> 'SubmissionConfig':
+        '''
+        build a config from parsed json, raise ValueError if it is invalid
+        '''
+        for key, type_ in (
+            ('working_dir', str),
+            ('docker_url', str),
+            ('lang_id', dict),
+            ('image', dict),
+        ):
+            if not isinstance(data.get(key), type_):
+                raise ValueError(f'{key} should be a {type_.__name__}')
+        if data['lang_id'].keys() != data['image'].keys():
+            raise ValueError('lang_id and image should have the same '
+                             'languages')
+        if not all(isinstance(v, int) for v in data['lang_id'].values()):
+            raise ValueError('lang_id should map languages to int')
+        if not all(isinstance(v, str) for v in data['image'].values()):
+            raise ValueError('image should map languages to str')
+        container_pool = data.get('container_pool')
+        if container_pool is None:
+            container_pool = {}
+        if not isinstance(container_pool, dict):
+            raise ValueError('container_pool should be a dict')
+        result_max_bytes = data.get(
+            'result_max_bytes',
+            DEFAULT_RESULT_MAX_BYTES,
+        )
+        if not isinstance(result_max_bytes, int) or result_max_bytes <= 0:
+            raise ValueError('result_max_bytes should be a positive int')
+        return cls(
+            working_dir=data['working_dir'],
+            docker_url=data['docker_url'],
+            lang_id=dict(data['lang_id']),
+            image=dict(data['image']),
+            container_pool=dict(container_pool),
+            result_max_bytes=result_max_bytes,
+        )
+
+
+# type: Dict[path, SubmissionConfig]
+_configs: Dict[str, SubmissionConfig] = {}
+_configs_lock = threading.Lock()
+
+
+def load_config(path: str = DEFAULT_PATH) -> SubmissionConfig:
+    '''
+    read and validate the config at `path` once, later calls get the same
+    object without touching the file
+    '''
+    key = str(path)
+    with _configs_lock:
+        config = _configs.get(key)
+        if config is None:
+            with open(path) as f:
+                config = SubmissionConfig.from_dict(json.load(f))
+            _configs[key] = config
+        return config
+
+
+def clear_config_cache():
+    '''
+    forget loaded configs, the next `load_config` reads the file again
+    '''
+    with _configs_lock:
+        _configs.clear()
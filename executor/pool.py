@@ -0,0 +1,254 @@
+import atexit
+import logging
+import secrets
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
+import docker
+from executor.client import get_client
+from executor.config import DEFAULT_PATH, SubmissionConfig, load_config
+
+# label used to find containers owned by a pool
+POOL_LABEL = 'noj.pool'
+# the user the sandbox binary runs submissions as, see the dockerfiles
+SANDBOX_UID = 1450
+# where a case can write in the sandbox images, the sandbox user has no
+# home directory
+WRITABLE_DIRS = ('/result', '/tmp', '/var/tmp', '/dev/shm', '/run/lock')
+# wipe everything a case can leave behind before the container is reused:
+# its leftover processes, the copied source and inputs, and the content
+# of `WRITABLE_DIRS`. only these are walked, not the whole filesystem
+RESET_SCRIPT = f'''
+for p in /proc/[0-9]*; do
+    [ "$(stat -c %u "$p" 2>/dev/null)" = {SANDBOX_UID} ] \\
+        && kill -9 "${{p#/proc/}}" 2>/dev/null
+done
+rm -rf /src /testdata /testcase || exit 1
+for d in {' '.join(WRITABLE_DIRS)}; do
+    [ ! -d "$d" ] || find "$d" -mindepth 1 -delete || exit 1
+done
+'''
+# seconds the reset may take before the container is given up
+RESET_TIMEOUT = 10
+
+
+class PooledContainer:
+    __slots__ = ('id', 'uses')
+
+    def __init__(self, container_id: str):
+        self.id = container_id
+        self.uses = 0
+
+
+class ContainerPool:
+    '''
+    idle, already started containers of one image
+
+    a pooled container shares nothing with the host, every case copies
+    its source and inputs in and runs through `exec`, so a case does not
+    pay for container create and remove. a container is wiped with
+    `RESET_SCRIPT` after each case, recycled after `max_uses` runs or
+    after any failure, and replaced in the background.
+    '''
+
+    def __init__(
+        self,
+        client: docker.APIClient,
+        image: str,
+        size: int,
+        max_uses: int,
+    ):
+        self.client = client
+        self.image = image
+        self.size = size
+        self.max_uses = max_uses
+        self.lock = threading.Lock()
+        self.idle: List[PooledContainer] = []
+        self.closed = False
+        # counters
+        self.hits = 0
+        self.misses = 0
+        self.recycled = 0
+        # creating and removing containers happens off the judging path
+        self.background = ThreadPoolExecutor(
+            max_workers=1,
+            thread_name_prefix=f'pool-{image}',
+        )
+
+    def warm_up(self):
+        for _ in range(self.size):
+            self.background.submit(self.replenish)
+
+    def create(self) -> PooledContainer:
+        container = self.client.create_container(
+            image=self.image,
+            name=f'noj-pool-{secrets.token_hex(4)}',
+            command='sleep infinity',
+            labels={POOL_LABEL: self.image},
+            network_disabled=True,
+        )
+        self.client.start(container)
+        return PooledContainer(container['Id'])
+
+    def destroy(self, container: PooledContainer):
+        try:
+            self.client.remove_container(container.id, v=True, force=True)
+        except Exception as e:
+            logging.warning(f'fail to remove pooled container: {e}')
+
+    def replenish(self):
+        with self.lock:
+            if self.closed or len(self.idle) >= self.size:
+                return
+        try:
+            container = self.create()
+        except Exception as e:
+            logging.error(f'fail to create pooled container: {e}')
+            return
+        with self.lock:
+            if not self.closed and len(self.idle) < self.size:
+                self.idle.append(container)
+                return
+        self.destroy(container)
+
+    def acquire(self) -> PooledContainer:
+        with self.lock:
+            if self.idle:
+                self.hits += 1
+                return self.idle.pop()
+            self.misses += 1
+        return self.create()
+
+    def release(self, container: PooledContainer, healthy: bool = True):
+        container.uses += 1
+        if healthy and container.uses < self.max_uses:
+            healthy = self.reset(container)
+        with self.lock:
+            if healthy and not self.closed \
+                and container.uses < self.max_uses \
+                and len(self.idle) < self.size:
+                self.idle.append(container)
+                return
+            self.recycled += 1
+        self.background.submit(self.destroy, container)
+        self.background.submit(self.replenish)
+
+    def reset(self, container: PooledContainer) -> bool:
+        '''
+        wipe what the last case left in the container, return whether it
+        is clean
+        '''
+        try:
+            exit_status = self.exec(container, RESET_SCRIPT, RESET_TIMEOUT)
+        except Exception as e:
+            logging.warning(f'fail to reset pooled container: {e}')
+            return False
+        if exit_status['StatusCode'] != 0:
+            logging.warning('fail to reset pooled container: exit code '
+                            f'{exit_status["StatusCode"]}')
+            return False
+        return True
+
+    def exec(
+        self,
+        container: PooledContainer,
+        script: str,
+        timeout: float,
+    ) -> dict:
+        '''
+        run `script` in the container and wait for it, the container is
+        killed if it takes longer than `timeout` seconds
+
+        return a dict shaped like the response of `APIClient.wait`
+        '''
+        exec_id = self.client.exec_create(
+            container.id,
+            ['sh', '-c', script],
+        )['Id']
+        timed_out = threading.Event()
+
+        def kill():
+            timed_out.set()
+            self.client.kill(container.id)
+
+        timer = threading.Timer(timeout, kill)
+        timer.start()
+        try:
+            self.client.exec_start(exec_id)
+        finally:
+            timer.cancel()
+        if timed_out.is_set():
+            raise TimeoutError(f'exec exceeds {timeout} seconds')
+        return {
+            'StatusCode': self.client.exec_inspect(exec_id)['ExitCode'],
+        }
+
+    def stats(self) -> dict:
+        with self.lock:
+            return {
+                'size': self.size,
+                'idle': len(self.idle),
+                'hits': self.hits,
+                'misses': self.misses,
+                'recycled': self.recycled,
+            }
+
+    def close(self):
+        with self.lock:
+            self.closed = True
+            idle, self.idle = self.idle, []
+        for container in idle:
+            self.destroy(container)
+        self.background.shutdown(wait=False)
+
+
+# type: Dict[image, ContainerPool]
+_pools: Dict[str, ContainerPool] = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(
+    image: str,
+    config: SubmissionConfig,
+) -> Optional[ContainerPool]:
+    '''
+    get the pool of `image`, return None if pooling is disabled
+    '''
+    size = config.container_pool.get('size', 0)
+    if size <= 0:
+        return None
+    with _pools_lock:
+        pool = _pools.get(image)
+        if pool is None:
+            pool = ContainerPool(
+                client=get_client(config.docker_url),
+                image=image,
+                size=size,
+                max_uses=config.container_pool.get('max_uses', 50),
+            )
+            pool.warm_up()
+            _pools[image] = pool
+        return pool
+
+
+def warm_up_pools(config_path: str = DEFAULT_PATH):
+    '''
+    create the pool of every configured image
+    '''
+    config = load_config(config_path)
+    for image in set(config.image.values()):
+        get_pool(image, config)
+
+
+def pool_stats() -> Dict[str, dict]:
+    with _pools_lock:
+        return {image: pool.stats() for image, pool in _pools.items()}
+
+
+@atexit.register
+def close_pools():
+    with _pools_lock:
+        pools = [*_pools.values()]
+        _pools.clear()
+    for pool in pools:
+        pool.close()
@@ -1,11 +1,32 @@
-import json
+import io
 import logging
 import tarfile
-import tempfile
+from contextlib import contextmanager
 from dataclasses import dataclass
-from typing import Optional
-from pathlib import Path
-import docker
+from pathlib import Path, PurePosixPath
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+from executor.client import get_client
+from executor.config import OUTPUT_LIMIT, SubmissionConfig, load_config
+from executor.pool import ContainerPool, get_pool
+from telemetry import metrics, tracing
+
+# bytes read from a streamed archive at once
+READ_SIZE = 1024 * 1024
+CONTAINER_SECONDS = metrics.histogram(
+    'sandbox_container_phase_seconds',
+    'Time spent in each step of running a container.',
+    ('phase', ),
+)
+
+
+@contextmanager
+def step(phase: str):
+    '''
+    time a step of running a container, also as a span if tracing is on
+    '''
+    with CONTAINER_SECONDS.time(phase=phase), \
+            tracing.span(f'container.{phase}'):
+        yield
 
 
 class JudgeError(Exception):
@@ -24,6 +45,13 @@ class Result:
     DockerExitCode: int
 
 
+@dataclass
+class BatchCase:
+    case_no: str
+    time_limit: int  # ms
+    mem_limit: int  # KB
+
+
 class Sandbox:
 
     def __init__(
@@ -36,9 +64,17 @@ class Sandbox:
         compile_need: bool,
         stdin_path: Optional[str] = None,
         name: Optional[str] = None,
+        config: Optional[SubmissionConfig] = None,
+        local_dir: Optional[str] = None,
     ):
-        with open('.config/submission.json') as f:
-            config = json.load(f)
+        '''
+        `src_dir` and `stdin_path` are host paths under a job directory,
+        `local_dir` is that directory as this process sees it. pooled
+        containers get their files copied from it, cases are not pooled
+        without it
+        '''
+        if config is None:
+            config = load_config()
         self.time_limit = time_limit
         self.mem_limit = mem_limit
         self.image = image
@@ -47,12 +83,19 @@ class Sandbox:
         self.lang_id = lang_id
         self.compile_need = compile_need
         self.name = name
-        self.client = docker.APIClient(base_url=config['docker_url'])
+        self.local_dir = local_dir
+        self.result_max_bytes = config.result_max_bytes
+        self.client = get_client(config.docker_url)
+        self.pool = get_pool(image, config)
 
-    def run(self):
-        # docker container settings
-        stdin_path = '/dev/null' if not self.stdin_path else '/testdata/in'
-        command_sandbox = ' '.join(
+    def command(
+        self,
+        stdin_path: str,
+        result_dir: str,
+        time_limit: int,
+        mem_limit: int,
+    ) -> str:
+        return ' '.join(
             map(
                 str,
                 (
@@ -60,23 +103,159 @@ class Sandbox:
                     self.lang_id,
                     int(self.compile_need),
                     stdin_path,
-                    '/result/stdout',
-                    '/result/stderr',
-                    self.time_limit,
-                    self.mem_limit,
+                    f'{result_dir}/stdout',
+                    f'{result_dir}/stderr',
+                    time_limit,
+                    mem_limit,
                     '1',
-                    '1073741824',  # 1 GB output limit
+                    OUTPUT_LIMIT,
                     '10',  # 10 process
-                    '/result/result',
+                    f'{result_dir}/result',
                 ),
             ))
+
+    def run(self):
+        stdin_path = '/dev/null' if not self.stdin_path else '/testdata/in'
+        command = self.command(
+            stdin_path,
+            '/result',
+            self.time_limit,
+            self.mem_limit,
+        )
+        timeout = 5 * self.time_limit // 1000
+        filenames = ['result', 'stdout', 'stderr']
+        archive = self.pool_archive({'testdata/in': self.stdin_path})
+        if archive is not None:
+            exit_status, files, truncated = self.run_pooled(
+                f'cd /src && {command}',
+                archive,
+                timeout,
+                filenames,
+            )
+        else:
+            exit_status, files, truncated = self.run_container(
+                command,
+                '/testdata/in',
+                timeout,
+                filenames,
+            )
+        try:
+            return self.to_result(
+                *files,
+                exit_status,
+                stdout_truncated='stdout' in truncated,
+            )
+        except Exception as e:
+            logging.error(e)
+            raise JudgeError
+
+    def run_batch(
+        self,
+        cases: List[BatchCase],
+    ) -> Dict[str, Optional[Result]]:
+        '''
+        run every case in one container, `stdin_path` is the directory of
+        inputs and each case keeps its own limits
+
+        a case whose result can not be read is mapped to None
+        '''
+        commands = []
+        filenames = []
+        for case in cases:
+            result_dir = f'/result/{case.case_no}'
+            commands.append(f'mkdir -p {result_dir} && ' + self.command(
+                f'/testcase/{case.case_no}.in',
+                result_dir,
+                case.time_limit,
+                case.mem_limit,
+            ))
+            filenames += [
+                f'{case.case_no}/{filename}'
+                for filename in ('result', 'stdout', 'stderr')
+            ]
+        # one case failing must not stop the others
+        script = '; '.join(commands)
+        timeout = sum(5 * case.time_limit // 1000 for case in cases)
+        archive = self.pool_archive({'testcase': self.stdin_path})
+        if archive is not None:
+            exit_status, files, truncated = self.run_pooled(
+                f'cd /src && {{ {script}; }}',
+                archive,
+                timeout,
+                filenames,
+            )
+        else:
+            exit_status, files, truncated = self.run_container(
+                ['sh', '-c', script],
+                '/testcase',
+                timeout,
+                filenames,
+            )
+        results = {}
+        for i, case in enumerate(cases):
+            try:
+                results[case.case_no] = self.to_result(
+                    *files[3 * i:3 * i + 3],
+                    exit_status,
+                    stdout_truncated=f'{case.case_no}/stdout' in truncated,
+                )
+            except Exception as e:
+                logging.error(f'fail to read result of {case.case_no}: {e}')
+                results[case.case_no] = None
+        return results
+
+    def pool_archive(
+        self,
+        inputs: Dict[str, Optional[str]],
+    ) -> Optional[bytes]:
+        '''
+        pack the source and `inputs` (Dict[path under /, host path]) into
+        an archive to copy into a pooled container, return None if the
+        case can not be pooled
+        '''
+        # a compile writes its binary into the source directory, which
+        # must be the one on the host
+        if self.pool is None or self.compile_need or not self.local_dir:
+            return None
+        job_dir = PurePosixPath(self.src_dir).parent
+        buf = io.BytesIO()
+        with tarfile.open(fileobj=buf, mode='w', dereference=True) as tar:
+            for arcname, host_path in {
+                    'src': self.src_dir,
+                    **inputs,
+            }.items():
+                if not host_path:
+                    continue
+                try:
+                    rel = PurePosixPath(host_path).relative_to(job_dir)
+                except ValueError:
+                    logging.warning(f'{host_path} is not under {job_dir}, '
+                                    'skip container pool')
+                    return None
+                tar.add(Path(self.local_dir) / rel, arcname=arcname)
+        return buf.getvalue()
+
+    def run_container(
+        self,
+        command,
+        stdin_bind: str,
+        timeout: int,
+        filenames: List[str],
+    ):
+        '''
+        run `command` in a fresh container and remove it afterward
+
+        return the exit status, the content of `filenames` under `/result`
+        and the names of the ones cut, see `get_result`
+        '''
+        # docker container settings
         volume = {
             self.src_dir: {
                 'bind': '/src',
                 'mode': 'rw'
             },
             self.stdin_path: {
-                'bind': '/testdata/in',
+                'bind': stdin_bind,
                 'mode': 'ro'
             }
         }
@@ -88,49 +267,111 @@ class Sandbox:
                     'mode': 'rw'
                 },
                 self.stdin_path: {
-                    'bind': '/testdata/in',
+                    'bind': stdin_bind,
                     'mode': 'ro'
                 }
             })
 
-        container = self.client.create_container(
-            image=self.image,
-            name=self.name,
-            command=command_sandbox,
-            volumes=volume,
-            network_disabled=True,
-            working_dir=container_working_dir,
-            host_config=host_config,
-        )
+        with step('create'):
+            container = self.client.create_container(
+                image=self.image,
+                name=self.name,
+                command=command,
+                volumes=volume,
+                network_disabled=True,
+                working_dir=container_working_dir,
+                host_config=host_config,
+            )
         if container.get('Warning'):
             docker_msg = container.get('Warning')
             logging.warning(f'Warning: {docker_msg}')
         # start and wait container
-        self.client.start(container)
+        with step('start'):
+            self.client.start(container)
         try:
-            exit_status = self.client.wait(
-                container,
-                timeout=5 * self.time_limit // 1000,
-            )
+            with step('wait'):
+                exit_status = self.client.wait(
+                    container,
+                    timeout=timeout,
+                )
         except Exception as e:
-            self.client.remove_container(container, v=True, force=True)
+            self.remove_container(container)
             logging.error(e)
             raise JudgeError
         # retrive result
         try:
-            result, stdout, stderr = self.get_result(
-                container,
-                ['result', 'stdout', 'stderr'],
-            )
-            result = result.split('\n')
+            with step('get_archive'):
+                files, truncated = self.get_result(container, filenames)
         except Exception as e:
+            self.remove_container(container)
+            logging.error(e)
+            raise JudgeError
+        self.remove_container(container)
+        return exit_status, files, truncated
+
+    def remove_container(self, container):
+        with step('remove'):
             self.client.remove_container(container, v=True, force=True)
+
+    def run_pooled(
+        self,
+        script: str,
+        archive: bytes,
+        timeout: int,
+        filenames: List[str],
+    ):
+        '''
+        same as `run_container` but copy `archive` into a pooled container
+        and run `script` in it
+        '''
+        pool: ContainerPool = self.pool
+        try:
+            with step('acquire'):
+                container = pool.acquire()
+        except Exception as e:
+            logging.error(e)
+            raise JudgeError
+        healthy = False
+        try:
+            with step('put_archive'):
+                self.client.put_archive(container.id, '/', archive)
+            with step('exec'):
+                exit_status = pool.exec(container, script, timeout)
+            with step('get_archive'):
+                files, truncated = self.get_result(container.id, filenames)
+            healthy = True
+        except Exception as e:
             logging.error(e)
             raise JudgeError
-        self.client.remove_container(container, v=True, force=True)
+        finally:
+            # wipes the container before it is reused
+            with step('release'):
+                pool.release(container, healthy)
+        return exit_status, files, truncated
 
+    def to_result(
+        self,
+        result: Optional[str],
+        stdout: Optional[str],
+        stderr: Optional[str],
+        exit_status: dict,
+        stdout_truncated: bool = False,
+    ) -> Result:
+        '''
+        `stdout_truncated` tells that `stdout` is only the start of the
+        output, which is judged OLE since it can not be compared
+        '''
+        if None in (result, stdout, stderr):
+            raise FileNotFoundError('missing result files')
+        result = result.split('\n')
+        status = result[0]
+        # a compile only needs its status, and a program stopped by a
+        # limit is not judged by its output
+        if stdout_truncated and not self.compile_need \
+                and status not in {'TLE', 'MLE', 'RE', 'OLE'}:
+            status = 'OLE'
         return Result(
-            Status=result[0],
+            Status=status,
             Duration=int(result[2]),  # ms
             MemUsage=int(result[3]),  # KB
             Stdout=stdout,
@@ -140,21 +381,92 @@ class Sandbox:
             DockerExitCode=exit_status['StatusCode'],
         )
 
-    def get_result(self, container, filenames: list[str]) -> list[str]:
+    def get_result(
+        self,
+        container,
+        filenames: List[str],
+    ) -> Tuple[List[Optional[str]], Set[str]]:
+        '''
+        read files under `/result`, a missing file is returned as None
+
+        the archive is parsed while docker streams it, only `filenames`
+        are kept and each of them is cut at `result_max_bytes`. return
+        their contents and the names of the ones cut
+        '''
         result_dir = '/result'
         bits, _ = self.client.get_archive(container, result_dir)
-        with (tempfile.NamedTemporaryFile() as
-              tarball, tempfile.TemporaryDirectory() as extract_path):
-            for chunk in bits:
-                tarball.write(chunk)
-            tarball.flush()
-            tarball.seek(0)
-            with tarfile.open(fileobj=tarball) as tar:
-                tar.extractall(extract_path)
-            return [
-                open(
-                    Path(extract_path) / result_dir.lstrip('/') / filename,
-                    'r',
-                    errors='ignore',
-                ).read() for filename in filenames
-            ]
+        wanted = {
+            f'{result_dir.lstrip("/")}/{filename}': filename
+            for filename in filenames
+        }
+        contents = {}
+        truncated = set()
+        with tarfile.open(
+                fileobj=ChunkStream(bits),
+                mode='r|',
+                bufsize=READ_SIZE,
+        ) as tar:
+            for member in tar:
+                filename = wanted.get(member.name)
+                if filename is None or not member.isfile():
+                    continue
+                if member.size > self.result_max_bytes:
+                    truncated.add(filename)
+                data = read_at_most(
+                    tar.extractfile(member),
+                    min(member.size, self.result_max_bytes),
+                )
+                # same newlines as reading the file in text mode
+                if b'\r' in data:
+                    data = data.replace(b'\r\n', b'\n').replace(b'\r', b'\n')
+                # invalid bytes are kept for comparing, see `decode`
+                contents[filename] = data.decode(errors='surrogateescape')
+        return [contents.get(filename) for filename in filenames], truncated
+
+
+def read_at_most(f, size: int) -> bytearray:
+    # tarfile in stream mode is slow on one large read, read in pieces
+    buf = bytearray(size)
+    view = memoryview(buf)
+    pos = 0
+    while pos < size:
+        n = f.readinto(view[pos:pos + READ_SIZE])
+        if not n:
+            break
+        pos += n
+    view.release()
+    del buf[pos:]
+    return buf
+
+
+class ChunkStream(io.RawIOBase):
+    '''
+    read-only file object over an iterator of bytes chunks, a read returns
+    at most one chunk without copying it
+    '''
+
+    def __init__(self, chunks: Iterable[bytes]):
+        self.chunks = iter(chunks)
+        self.buffer = b''
+
+    def readable(self) -> bool:
+        return True
+
+    def read(self, size: int = -1) -> bytes:
+        if size is None or size < 0:
+            return self.readall()
+        while not self.buffer:
+            self.buffer = next(self.chunks, None)
+            if self.buffer is None:
+                self.buffer = b''
+                return b''
+        if size >= len(self.buffer):
+            data, self.buffer = self.buffer, b''
+        else:
+            data, self.buffer = self.buffer[:size], self.buffer[size:]
+        return data
+
+    def readinto(self, b) -> int:
+        data = self.read(len(b))
+        b[:len(data)] = data
+        return len(data)
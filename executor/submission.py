@@ -1,8 +1,33 @@
-import json
 import dataclasses
 import secrets
-from typing import Optional
-from executor.sandbox import Sandbox, JudgeError
+import threading
+import time
+from pathlib import Path
+from typing import Dict, List, Optional
+from executor.client import get_client
+from executor.compare import (
+    DIGEST_VERSION,
+    decode,
+    output_digest,
+    printable,
+    read_chunks,
+    same_output,
+    split_text,
+)
+from executor.config import SubmissionConfig, load_config
+from executor.sandbox import BatchCase, Result, Sandbox, JudgeError
+from telemetry import metrics, tracing
+
+# seconds an image id is trusted before docker is asked again
+IMAGE_ID_TTL = 60
+# type: Dict[image, Tuple[image_id, fetched_at]]
+_image_ids = {}
+_image_ids_lock = threading.Lock()
+COMPARE_SECONDS = metrics.histogram(
+    'sandbox_compare_seconds',
+    'Time spent comparing an output with its answer.',
+    ('method', ),
+)
 
 
 class SubmissionExecutor:
@@ -17,13 +42,21 @@ class SubmissionExecutor:
         special_judge: bool = False,
         lang: Optional[str] = None,
         case_no: Optional[str] = None,
+        config: Optional[SubmissionConfig] = None,
+        digests: Optional[Dict[str, dict]] = None,
+        local_dir: Optional[str] = None,
     ):
         # config file
-        with open('.config/submission.json') as f:
-            config = json.load(f)
+        if config is None:
+            config = load_config()
+        self.config = config
         self.lang = lang
         self.special_judge = special_judge
         self.case_no = case_no
+        # type: Dict[case_no, digest of the expected output]
+        self.digests = digests or {}
+        # the job directory as this process sees it, for pooled containers
+        self.local_dir = local_dir
         # required
         self.job_id = job_id
         self.time_limit = time_limit
@@ -31,16 +64,33 @@ class SubmissionExecutor:
         self.testdata_input_path = testdata_input_path  # absoulte path str
         self.testdata_output_path = testdata_output_path  # absoulte path str
         # working_dir
-        self.working_dir = config['working_dir']
+        self.working_dir = config.working_dir
         # for language specified settings
-        self.lang_id = config['lang_id']
-        self.image = config['image']
+        self.lang_id = config.lang_id
+        self.image = config.image
+        self.docker_url = config.docker_url
 
     def container_name(self, phase: str) -> str:
         # random suffix: a reclaimed job can rerun while a zombie container
         # from a previous attempt is still alive; a fixed name would collide
         return f'{self.job_id}-{phase}-{secrets.token_hex(3)}'
 
+    def image_id(self) -> str:
+        '''
+        get the id of the image used by this language, it changes when
+        the image is rebuilt
+        '''
+        image = self.image[self.lang]
+        now = time.monotonic()
+        with _image_ids_lock:
+            cached = _image_ids.get(image)
+        if cached is not None and now - cached[1] < IMAGE_ID_TTL:
+            return cached[0]
+        image_id = get_client(self.docker_url).inspect_image(image)['Id']
+        with _image_ids_lock:
+            _image_ids[image] = (image_id, now)
+        return image_id
+
     def compile(self):
         try:
             # compile must be done in 20 seconds
@@ -52,14 +102,23 @@ class SubmissionExecutor:
                 lang_id=self.lang_id[self.lang],
                 compile_need=True,
                 name=self.container_name('compile'),
+                config=self.config,
             ).run()
         except JudgeError:
             return {'Status': 'JE'}
+        result.Stdout = printable(result.Stdout)
+        result.Stderr = printable(result.Stderr)
+        # the sandbox status tells a compiler error (RE) from a compiler
+        # hitting a limit, see `CompileCache.store`
+        sandbox_status = result.Status
         if result.Status == 'Exited Normally':
             result.Status = 'AC'
         else:
             result.Status = 'CE'
-        return dataclasses.asdict(result)
+        return {
+            **dataclasses.asdict(result),
+            'SandboxStatus': sandbox_status,
+        }
 
     def run(self):
         try:
@@ -72,18 +131,82 @@ class SubmissionExecutor:
                 compile_need=False,
                 stdin_path=self.testdata_input_path,
                 name=self.container_name(self.case_no or 'run'),
+                config=self.config,
+                local_dir=self.local_dir,
             ).run()
         except JudgeError:
             return {'Status': 'JE'}
-        with open(self.testdata_output_path, 'r') as f:
-            ans_output = f.read()
+        return self.judge(
+            result,
+            self.testdata_output_path,
+            self.digests.get(self.case_no),
+        )
+
+    def run_batch(self, cases: List[BatchCase]) -> Dict[str, dict]:
+        '''
+        run all cases in one container, the testdata paths are the
+        directory of inputs and the one of answers instead of single files,
+        the answers are never mounted
+        '''
+        try:
+            results = Sandbox(
+                time_limit=sum(case.time_limit for case in cases),
+                mem_limit=max(case.mem_limit for case in cases),
+                image=self.image[self.lang],
+                src_dir=f'{self.working_dir}/{self.job_id}/src',
+                lang_id=self.lang_id[self.lang],
+                compile_need=False,
+                stdin_path=self.testdata_input_path,
+                name=self.container_name('batch'),
+                config=self.config,
+                local_dir=self.local_dir,
+            ).run_batch(cases)
+        except JudgeError:
+            return {case.case_no: {'Status': 'JE'} for case in cases}
+        ret = {}
+        for case_no, result in results.items():
+            if result is None:
+                ret[case_no] = {'Status': 'JE'}
+                continue
+            ret[case_no] = self.judge(
+                result,
+                Path(self.testdata_output_path) / f'{case_no}.out',
+                self.digests.get(case_no),
+            )
+        return ret
+
+    def judge(
+        self,
+        result: Result,
+        answer_path,
+        digest: Optional[dict] = None,
+    ) -> dict:
+        '''
+        compare the output with the answer, `digest` is the precomputed
+        `output_digest` of the answer, which saves reading the answer file
+        '''
         status = {'TLE', 'MLE', 'RE', 'OLE'}
         if result.Status not in status:
             result.Status = 'WA'
-            res_outs = self.strip(result.Stdout)
-            ans_outputs = self.strip(ans_output)
-            if res_outs == ans_outputs:
+            stdout = split_text(result.Stdout)
+            # digests of an older format are not comparable
+            if digest is not None \
+                    and digest.get('version') == DIGEST_VERSION:
+                with COMPARE_SECONDS.time(method='digest'), \
+                        tracing.span('compare', method='digest'):
+                    same = output_digest(stdout) == digest
+            else:
+                # compared in chunks, same as comparing `strip` of both
+                with COMPARE_SECONDS.time(method='full'), \
+                        tracing.span('compare', method='full'):
+                    same = same_output(
+                        stdout,
+                        decode(read_chunks(answer_path)),
+                    )
+            if same:
                 result.Status = 'AC'
+        result.Stdout = printable(result.Stdout)
+        result.Stderr = printable(result.Stderr)
         return dataclasses.asdict(result)
 
     @classmethod
@@ -0,0 +1,91 @@
+import json
+import os
+import time
+from typing import List, Optional, Sequence
+
+from .tracing import JsonlSink
+
+# where arriving submissions are logged as JSON lines, for replaying them
+# with `benchmarks.replay`. recording is off if unset
+ARRIVAL_FILE = os.getenv('ARRIVAL_FILE')
+
+_sink = None
+
+
+def set_sink(sink):
+    '''
+    replace where arrivals go, None turns recording off
+    '''
+    global _sink
+    old, _sink = _sink, sink
+    if old is not None:
+        old.close()
+
+
+def enabled() -> bool:
+    return _sink is not None
+
+
+# what `app` did with a submission when it arrived
+ACCEPTED = 'accepted'
+# waiting for its testdata to be synced
+PARKED = 'parked'
+# turned away with the queue full, backend sends it again later
+QUEUE_FULL = 'queueFull'
+# a bad request, e.g. a source in the wrong language
+REJECTED = 'rejected'
+
+
+def record(
+    problem_id: int,
+    language: int,
+    case_counts: Optional[Sequence[int]],
+    source_size: int,
+    outcome: str,
+    received_at: Optional[float] = None,
+):
+    '''
+    log a submission as it arrives, `received_at` is the unix time its
+    request arrived and `outcome` what was done with it. `case_counts` is
+    None if the problem meta was not known yet. the source itself is not
+    kept
+    '''
+    sink = _sink
+    if sink is None:
+        return
+    sink.export({
+        'receivedAt': received_at or time.time(),
+        'problemId': problem_id,
+        'language': int(language),
+        'caseCounts': None if case_counts is None else [*case_counts],
+        'sourceSize': source_size,
+        'outcome': outcome,
+    })
+
+
+def load(path) -> List[dict]:
+    '''
+    read arrivals logged to `path`, the earliest first. an arrival without
+    case counts takes the ones of another arrival of its problem if any
+    '''
+    with open(path) as f:
+        arrivals = [json.loads(line) for line in f if line.strip()]
+    known = {
+        arrival['problemId']: arrival['caseCounts']
+        for arrival in arrivals if arrival['caseCounts'] is not None
+    }
+    for arrival in arrivals:
+        if arrival['caseCounts'] is None:
+            arrival['caseCounts'] = known.get(arrival['problemId'])
+    return sorted(arrivals, key=lambda arrival: arrival['receivedAt'])
+
+
+def replayable(arrivals: List[dict]) -> List[dict]:
+    '''
+    the arrivals which can be sent again: their case counts are known and
+    they were not bad requests
+    '''
+    return [
+        arrival for arrival in arrivals if arrival['caseCounts'] is not None
+        and arrival.get('outcome') != REJECTED
+    ]
@@ -0,0 +1,252 @@
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Sequence, Tuple
+
+# seconds, from a cached compare to a slow compile
+DEFAULT_BUCKETS = (
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+    30.0,
+    60.0,
+)
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+class Shards:
+    '''
+    one copy of a metric's state per thread, a thread only writes its own
+    copy so recording takes no lock. reading sums up every copy
+    '''
+
+    def __init__(self, new: Callable[[], list]):
+        self.new = new
+        self.local = threading.local()
+        self.lock = threading.Lock()
+        self.shards: List[list] = []
+
+    def get(self) -> list:
+        try:
+            return self.local.shard
+        except AttributeError:
+            pass
+        # first record of this thread
+        shard = self.local.shard = self.new()
+        with self.lock:
+            self.shards.append(shard)
+        return shard
+
+    def total(self) -> list:
+        with self.lock:
+            shards = [*self.shards]
+        total = self.new()
+        for shard in shards:
+            for i, value in enumerate(shard):
+                total[i] += value
+        return total
+
+
+class Metric:
+    '''
+    a family of series sharing a name, one per combination of label
+    values
+    '''
+    kind = ''
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.lock = threading.Lock()
+        # type: Dict[label values, Shards]
+        self.series: Dict[Tuple[str, ...], Shards] = {}
+
+    def new_shard(self) -> list:
+        raise NotImplementedError
+
+    @property
+    def family(self) -> str:
+        # the name in the exposition
+        return self.name
+
+    def key(self, labels: dict) -> Tuple[str, ...]:
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f'{self.name} takes labels {self.labelnames}, '
+                             f'got {tuple(labels)}')
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def total(self, labels: dict) -> list:
+        '''
+        the summed state of one series, without creating it
+        '''
+        series = self.series.get(self.key(labels))
+        if series is None:
+            return self.new_shard()
+        return series.total()
+
+    def shards(self, labels: dict) -> Shards:
+        key = self.key(labels)
+        series = self.series.get(key)
+        if series is None:
+            with self.lock:
+                series = self.series.setdefault(key, Shards(self.new_shard))
+        return series
+
+    def samples(self) -> Iterator[Tuple[str, dict, float]]:
+        '''
+        yield (suffix, labels, value) of every sample
+        '''
+        raise NotImplementedError
+
+    def collect(self) -> List[Tuple[dict, list]]:
+        with self.lock:
+            series = [*self.series.items()]
+        return [(dict(zip(self.labelnames, key)), shards.total())
+                for key, shards in sorted(series)]
+
+    def render(self) -> str:
+        lines = [
+            f'# HELP {self.family} {self.help}',
+            f'# TYPE {self.family} {self.kind}',
+        ]
+        for suffix, labels, value in self.samples():
+            lines.append(f'{self.family}{suffix}{format_labels(labels)} '
+                         f'{format_value(value)}')
+        return '\n'.join(lines)
+
+
+class Counter(Metric):
+    kind = 'counter'
+
+    @property
+    def family(self) -> str:
+        return f'{self.name}_total'
+
+    def new_shard(self) -> list:
+        return [0.0]
+
+    def inc(self, amount: float = 1, **labels):
+        self.shards(labels).get()[0] += amount
+
+    def value(self, **labels) -> float:
+        return self.total(labels)[0]
+
+    def samples(self):
+        for labels, (value, ) in self.collect():
+            yield '', labels, value
+
+
+class Histogram(Metric):
+    kind = 'histogram'
+
+    def __init__(
+        self,
+        name: str,
+        help: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS,
+    ):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def new_shard(self) -> list:
+        # a count per bucket, one for +Inf, then the sum
+        return [0] * (len(self.buckets) + 1) + [0.0]
+
+    def observe(self, value: float, **labels):
+        shard = self.shards(labels).get()
+        shard[bisect.bisect_left(self.buckets, value)] += 1
+        shard[-1] += value
+
+    @contextmanager
+    def time(self, **labels):
+        '''
+        observe the seconds the block takes, also if it raises
+        '''
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def count(self, **labels) -> int:
+        return sum(self.total(labels)[:-1])
+
+    def samples(self):
+        for labels, shard in self.collect():
+            cumulative = 0
+            bounds = [*map(format_value, self.buckets), '+Inf']
+            for bound, count in zip(bounds, shard):
+                cumulative += count
+                yield '_bucket', {**labels, 'le': bound}, cumulative
+            yield '_sum', labels, shard[-1]
+            yield '_count', labels, cumulative
+
+
+class Registry:
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.metrics: Dict[str, Metric] = {}
+
+    def register(self, metric: Metric) -> Metric:
+        with self.lock:
+            if metric.name in self.metrics:
+                raise ValueError(f'duplicate metric {metric.name}')
+            self.metrics[metric.name] = metric
+        return metric
+
+    def render(self) -> str:
+        '''
+        every metric in the prometheus text format
+        '''
+        with self.lock:
+            metrics = sorted(self.metrics.items())
+        return ''.join(f'{metric.render()}\n' for _, metric in metrics)
+
+
+def format_labels(labels: dict) -> str:
+    if not labels:
+        return ''
+    pairs = ','.join(f'{name}="{escape(value)}"'
+                     for name, value in labels.items())
+    return f'{{{pairs}}}'
+
+
+def escape(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n') \
+        .replace('"', '\\"')
+
+
+def format_value(value: float) -> str:
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+REGISTRY = Registry()
+
+
+def counter(name: str, help: str, labelnames: Sequence[str] = ()) -> Counter:
+    return REGISTRY.register(Counter(name, help, labelnames))
+
+
+def histogram(
+    name: str,
+    help: str,
+    labelnames: Sequence[str] = (),
+    buckets: Sequence[float] = DEFAULT_BUCKETS,
+) -> Histogram:
+    return REGISTRY.register(Histogram(name, help, labelnames, buckets))
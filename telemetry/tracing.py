@@ -0,0 +1,173 @@
+import contextvars
+import json
+import os
+import secrets
+import threading
+import time
+from contextlib import contextmanager
+from typing import Iterator, NamedTuple, Optional
+
+# where spans are written as JSON lines, tracing is off if unset
+TRACE_FILE = os.getenv('TRACE_FILE')
+
+
+class SpanContext(NamedTuple):
+    trace_id: str
+    span_id: str
+
+
+class Span:
+    __slots__ = ('name', 'context', 'parent_id', 'start', 'attributes')
+
+    def __init__(
+        self,
+        name: str,
+        context: SpanContext,
+        parent_id: Optional[str],
+        attributes: dict,
+    ):
+        self.name = name
+        self.context = context
+        self.parent_id = parent_id
+        self.start = time.time()
+        self.attributes = attributes
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+    def to_dict(self, end: float, error: Optional[BaseException]) -> dict:
+        return {
+            'traceId': self.context.trace_id,
+            'spanId': self.context.span_id,
+            'parentId': self.parent_id,
+            'name': self.name,
+            'start': self.start,
+            'end': end,
+            'status': 'ok' if error is None else 'error',
+            'error': None if error is None else repr(error),
+            'attributes': self.attributes,
+        }
+
+
+class JsonlSink:
+    '''
+    append finished spans to a file, one JSON object per line
+
+    any object with `export(span: dict)` and `close()` can replace it,
+    e.g. one forwarding spans to an OTLP collector
+    '''
+
+    def __init__(self, path):
+        self.lock = threading.Lock()
+        self.file = open(path, 'a', buffering=1)
+
+    def export(self, span: dict):
+        line = json.dumps(span, default=str)
+        with self.lock:
+            self.file.write(f'{line}\n')
+
+    def close(self):
+        with self.lock:
+            self.file.close()
+
+
+_sink = None
+_current: contextvars.ContextVar[Optional[SpanContext]] = \
+    contextvars.ContextVar('span', default=None)
+
+
+def set_sink(sink):
+    '''
+    replace where spans go, None turns tracing off
+    '''
+    global _sink
+    old, _sink = _sink, sink
+    if old is not None:
+        old.close()
+
+
+def enabled() -> bool:
+    return _sink is not None
+
+
+def current() -> Optional[SpanContext]:
+    '''
+    the span the caller runs in, pass it to work done on other threads
+    '''
+    return _current.get()
+
+
+def new_id() -> str:
+    return secrets.token_hex(8)
+
+
+@contextmanager
+def activate(context: Optional[SpanContext]):
+    '''
+    make spans started in the block children of `context`
+    '''
+    token = _current.set(context)
+    try:
+        yield
+    finally:
+        _current.reset(token)
+
+
+@contextmanager
+def span(
+    name: str,
+    parent: Optional[SpanContext] = None,
+    **attributes,
+) -> Iterator[Optional[Span]]:
+    '''
+    record the block as a span, a child of `parent` or of the current
+    span. a new trace is started if there is neither. yield None if
+    tracing is off
+    '''
+    sink = _sink
+    if sink is None:
+        yield None
+        return
+    if parent is None:
+        parent = _current.get()
+    if parent is None:
+        context = SpanContext(trace_id=secrets.token_hex(16), span_id=new_id())
+        parent_id = None
+    else:
+        context = SpanContext(trace_id=parent.trace_id, span_id=new_id())
+        parent_id = parent.span_id
+    _span = Span(name, context, parent_id, attributes)
+    token = _current.set(context)
+    error = None
+    try:
+        yield _span
+    except BaseException as e:
+        error = e
+        raise
+    finally:
+        _current.reset(token)
+        sink.export(_span.to_dict(time.time(), error))
+
+
+def record(
+    name: str,
+    start: float,
+    end: float,
+    parent: Optional[SpanContext],
+    **attributes,
+):
+    '''
+    record a span measured elsewhere, `start` and `end` are unix times.
+    it is dropped without a parent
+    '''
+    sink = _sink
+    if sink is None or parent is None:
+        return
+    context = SpanContext(trace_id=parent.trace_id, span_id=new_id())
+    _span = Span(name, context, parent.span_id, attributes)
+    _span.start = start
+    sink.export(_span.to_dict(end, None))
+
+
+if TRACE_FILE:
+    set_sink(JsonlSink(TRACE_FILE))
@@ -0,0 +1,123 @@
+import gzip
+import hashlib
+import json
+import re
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class BackendStub:
+    '''
+    a local stand-in for the backend, records every completed submission
+
+    run it with `with BackendStub() as backend:` and point clients at
+    `backend.url`. set `bulk` to False to act like a backend without the
+    bulk endpoint, and append status codes to `failures` to make the next
+    requests fail. problems served to the sandbox are set with
+    `add_problem`.
+    '''
+
+    def __init__(self, bulk: bool = True):
+        self.bulk = bulk
+        self.failures = []
+        self.lock = threading.Lock()
+        # every request as (method, path, body)
+        self.requests = []
+        # type: Dict[submission_id, tasks]
+        self.completed = {}
+        # type: Dict[problem_id, Dict[str, Any]]
+        self.problems = {}
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), self.handler())
+        self.thread = threading.Thread(
+            target=self.server.serve_forever,
+            daemon=True,
+        )
+
+    @property
+    def url(self) -> str:
+        host, port = self.server.server_address
+        return f'http://{host}:{port}'
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *_):
+        self.server.shutdown()
+        self.server.server_close()
+        self.thread.join()
+
+    def add_problem(self, problem_id: int, testdata: bytes, meta: dict):
+        # the sandbox hashes the zip then the meta it got back
+        checksum = hashlib.md5(testdata + json.dumps(meta).encode())
+        with self.lock:
+            self.problems[problem_id] = {
+                'testdata': testdata,
+                'meta': meta,
+                'checksum': checksum.hexdigest(),
+            }
+
+    def handle_get(self, path: str):
+        '''
+        return the status code, content type and body of a GET
+        '''
+        with self.lock:
+            self.requests.append(('GET', path, None))
+            if self.failures:
+                return self.failures.pop(0), 'text/plain', b''
+            match = re.fullmatch(
+                r'/problem/(\d+)/(testdata|meta|checksum)',
+                path.split('?')[0],
+            )
+            if match is None or int(match[1]) not in self.problems:
+                return 404, 'text/plain', b''
+            problem = self.problems[int(match[1])]
+            if match[2] == 'testdata':
+                return 200, 'application/zip', problem['testdata']
+            body = json.dumps({'data': problem[match[2]]}).encode()
+            return 200, 'application/json', body
+
+    def handle_put(self, path: str, body: dict) -> int:
+        with self.lock:
+            self.requests.append(('PUT', path, body))
+            if self.failures:
+                return self.failures.pop(0)
+            if path == '/submission/complete':
+                if not self.bulk:
+                    return 404
+                for submission in body['submissions']:
+                    self.completed[submission['submissionId']] = \
+                        submission['tasks']
+                return 200
+            match = re.fullmatch(r'/submission/([^/]+)/complete', path)
+            if match is None:
+                return 404
+            self.completed[match[1]] = body['tasks']
+            return 200
+
+    def handler(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+
+            def do_PUT(self):
+                body = self.rfile.read(int(self.headers['Content-Length']))
+                if self.headers.get('Content-Encoding') == 'gzip':
+                    body = gzip.decompress(body)
+                status = stub.handle_put(self.path, json.loads(body))
+                self.send_response(status)
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+
+            def do_GET(self):
+                status, content_type, body = stub.handle_get(self.path)
+                self.send_response(status)
+                self.send_header('Content-Type', content_type)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *_):
+                pass
+
+        return Handler
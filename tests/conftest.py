@@ -1,12 +1,24 @@
+import time
+import threading
 import pytest
 import pathlib
 from dispatcher.dispatcher import Dispatcher
 from executor.submission import SubmissionExecutor
+from telemetry import tracing
 from tests.submission_generator import SubmissionGenerator
 
 TEST_CONFIG_PATH = '.config/dispatcher.test.json'
 
 
+@pytest.fixture(autouse=True)
+def isolated_compile_cache(tmp_path, monkeypatch):
+    # cached results must not leak between tests
+    monkeypatch.setattr(
+        'dispatcher.config.COMPILE_CACHE_DIR',
+        tmp_path / 'compile-cache',
+    )
+
+
 @pytest.fixture
 def docker_dispatcher(tmp_path):
     # create a dispatcer in test config
@@ -57,3 +69,111 @@ def TestSubmissionExecutor(tmp_path):
                 pathlib.Path(self.working_dir or 'submissions').name)
 
     return TestSubmissionExecutor
+
+
+class FakeSubmissionExecutor:
+    '''
+    stand-in for `SubmissionExecutor` that never touches docker
+    '''
+    # status returned by `compile`
+    compile_status = 'AC'
+    # `compile` blocks until this event is set, if given
+    compile_gate = None
+    # seconds spent in `run`
+    run_duration = 0
+
+    # names of the threads `compile` and `run` were called on
+    compile_threads = []
+    run_threads = []
+
+    def __init__(
+        self,
+        job_id,
+        time_limit,
+        mem_limit,
+        testdata_input_path,
+        testdata_output_path,
+        special_judge=False,
+        lang=None,
+        case_no=None,
+        config=None,
+        digests=None,
+        local_dir=None,
+    ):
+        self.job_id = job_id
+        self.case_no = case_no
+
+    def image_id(self):
+        return 'sha256:fake'
+
+    def compile(self):
+        self.compile_threads.append(threading.current_thread().name)
+        if self.compile_gate is not None:
+            self.compile_gate.wait()
+        # a failed compile is a compiler error
+        sandbox_status = 'Exited Normally' \
+            if self.compile_status == 'AC' else 'RE'
+        return {
+            'Status': self.compile_status,
+            'SandboxStatus': sandbox_status,
+        }
+
+    def run(self):
+        self.run_threads.append(threading.current_thread().name)
+        time.sleep(self.run_duration)
+        return self.accepted()
+
+    def run_batch(self, cases):
+        self.run_threads.append(threading.current_thread().name)
+        return {case.case_no: self.accepted() for case in cases}
+
+    @classmethod
+    def accepted(cls):
+        return {
+            'Status': 'AC',
+            'Stdout': '',
+            'Stderr': '',
+            'DockerExitCode': 0,
+            'Duration': 0,
+            'MemUsage': 0,
+        }
+
+
+@pytest.fixture
+def fake_executor(monkeypatch):
+
+    class Executor(FakeSubmissionExecutor):
+        compile_threads = []
+        run_threads = []
+
+    monkeypatch.setattr('dispatcher.dispatcher.SubmissionExecutor', Executor)
+    return Executor
+
+
+class ListSink:
+    '''
+    keep finished spans in memory
+    '''
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.spans = []
+
+    def export(self, span: dict):
+        with self.lock:
+            self.spans.append(span)
+
+    def names(self):
+        with self.lock:
+            return [span['name'] for span in self.spans]
+
+    def close(self):
+        pass
+
+
+@pytest.fixture
+def trace_sink():
+    sink = ListSink()
+    tracing.set_sink(sink)
+    yield sink
+    tracing.set_sink(None)
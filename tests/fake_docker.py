@@ -0,0 +1,302 @@
+import io
+import itertools
+import shlex
+import shutil
+import tarfile
+import tempfile
+import threading
+import time
+from contextlib import ExitStack
+from dataclasses import dataclass
+from pathlib import Path, PurePosixPath
+from typing import Callable, Dict, List, Optional
+from unittest import mock
+
+# modules holding their own reference to `get_client`
+CLIENT_USERS = (
+    'executor.sandbox',
+    'executor.submission',
+    'executor.pool',
+)
+# arguments of the sandbox binary after its name
+SANDBOX_ARGC = 11
+
+
+@dataclass
+class Latency:
+    '''
+    seconds each docker call takes, `run` is the time a container or an
+    exec runs per sandbox command in it
+    '''
+    create: float = 0
+    start: float = 0
+    run: float = 0
+    archive: float = 0
+    remove: float = 0
+
+    @staticmethod
+    def add_arguments(parser):
+        '''
+        add a `--<call>-ms` option of each latency to an argparse parser
+        '''
+        for call, default in (
+            ('create', 30),
+            ('start', 20),
+            ('run', 10),
+            ('archive', 5),
+            ('remove', 20),
+        ):
+            parser.add_argument(
+                f'--{call}-ms',
+                type=float,
+                default=default,
+                help=f'latency of the fake docker {call} call',
+            )
+
+    @classmethod
+    def from_args(cls, args) -> 'Latency':
+        return cls(
+            **{
+                call: getattr(args, f'{call}_ms') / 1000
+                for call in ('create', 'start', 'run', 'archive', 'remove')
+            })
+
+
+def expected_output(stdin_path: Optional[Path]) -> str:
+    '''
+    the answer next to the input, or in the `testcase` directory next to
+    the inputs of a batch, so every case is accepted
+    '''
+    if stdin_path is None:
+        return ''
+    for answer_path in (
+            stdin_path.with_suffix('.out'),
+            stdin_path.parent.with_name('testcase') / f'{stdin_path.stem}.out',
+    ):
+        try:
+            return answer_path.read_text()
+        except OSError:
+            pass
+    return ''
+
+
+class FakeContainer:
+
+    def __init__(self, container_id: str, command, binds: Dict[str, str]):
+        self.id = container_id
+        self.command = command
+        # type: Dict[container path, host path]
+        self.binds = binds
+        # type: Dict[path under /result, content]
+        self.files: Dict[str, str] = {}
+        self.exit_code = 0
+        # where archives put into the container are extracted, if any
+        self.root: Optional[Path] = None
+
+
+class FakeAPIClient:
+    '''
+    a drop-in `docker.APIClient` for the calls the executor makes
+
+    nothing runs, `wait` and `exec_start` read the sandbox commands of the
+    container and write their result files: `output` maps the host path
+    of a command's stdin to its stdout and every run exits normally.
+    each call sleeps for its `latency` first, which releases the GIL
+    like waiting on the daemon does
+    '''
+
+    def __init__(
+        self,
+        latency: Optional[Latency] = None,
+        output: Callable[[Optional[Path]], str] = expected_output,
+    ):
+        self.latency = latency or Latency()
+        self.output = output
+        self.lock = threading.Lock()
+        self.ids = itertools.count()
+        # type: Dict[container id, FakeContainer]
+        self.containers: Dict[str, FakeContainer] = {}
+        # type: Dict[exec id, Tuple[container id, command]]
+        self.execs = {}
+        self.created = 0
+        self.removed = 0
+        self.peak_containers = 0
+
+    @staticmethod
+    def sleep(seconds: float):
+        if seconds > 0:
+            time.sleep(seconds)
+
+    def container(self, container) -> FakeContainer:
+        if isinstance(container, dict):
+            container = container['Id']
+        with self.lock:
+            return self.containers[container]
+
+    def create_host_config(self, binds=None, **kwargs):
+        return {'Binds': binds or {}, **kwargs}
+
+    def create_container(
+        self,
+        image,
+        command=None,
+        host_config=None,
+        **kwargs,
+    ):
+        self.sleep(self.latency.create)
+        binds = {
+            bind['bind']: host_path
+            for host_path, bind in (
+                host_config or {}).get('Binds', {}).items()
+        }
+        with self.lock:
+            container_id = f'fake-{next(self.ids)}'
+            self.containers[container_id] = FakeContainer(
+                container_id,
+                command,
+                binds,
+            )
+            self.created += 1
+            self.peak_containers = max(
+                self.peak_containers,
+                len(self.containers),
+            )
+        return {'Id': container_id, 'Warning': None}
+
+    def start(self, container):
+        self.sleep(self.latency.start)
+        self.container(container)
+
+    def wait(self, container, timeout=None):
+        container = self.container(container)
+        self.execute(container, container.command)
+        return {'StatusCode': container.exit_code}
+
+    def exec_create(self, container, cmd, **kwargs):
+        container = self.container(container)
+        with self.lock:
+            exec_id = f'exec-{next(self.ids)}'
+            self.execs[exec_id] = (container.id, cmd)
+        return {'Id': exec_id}
+
+    def exec_start(self, exec_id, **kwargs):
+        if isinstance(exec_id, dict):
+            exec_id = exec_id['Id']
+        container_id, cmd = self.execs[exec_id]
+        container = self.container(container_id)
+        container.files.clear()
+        self.execute(container, cmd)
+        return b''
+
+    def exec_inspect(self, exec_id):
+        if isinstance(exec_id, dict):
+            exec_id = exec_id['Id']
+        with self.lock:
+            container_id, _ = self.execs.pop(exec_id)
+        return {'ExitCode': self.container(container_id).exit_code}
+
+    def kill(self, container):
+        pass
+
+    def put_archive(self, container, path, data):
+        container = self.container(container)
+        with self.lock:
+            if container.root is None:
+                container.root = Path(tempfile.mkdtemp(prefix='fake-'))
+        dest = container.root / PurePosixPath(path).relative_to('/')
+        with tarfile.open(fileobj=io.BytesIO(data)) as tar:
+            tar.extractall(dest, filter='data')
+        return True
+
+    def get_archive(self, container, path):
+        self.sleep(self.latency.archive)
+        container = self.container(container)
+        buf = io.BytesIO()
+        with tarfile.open(fileobj=buf, mode='w') as tar:
+            for name, content in container.files.items():
+                data = content.encode()
+                info = tarfile.TarInfo(f'result/{name}')
+                info.size = len(data)
+                tar.addfile(info, io.BytesIO(data))
+        data = buf.getvalue()
+        chunk = 64 * 1024
+        return (data[i:i + chunk] for i in range(0, len(data), chunk)), {}
+
+    def remove_container(self, container, v=False, force=False):
+        self.sleep(self.latency.remove)
+        if isinstance(container, dict):
+            container = container['Id']
+        with self.lock:
+            container = self.containers.pop(container, None)
+            if container is not None:
+                self.removed += 1
+        if container is not None and container.root is not None:
+            shutil.rmtree(container.root, ignore_errors=True)
+
+    def inspect_image(self, image):
+        return {'Id': f'sha256:fake-{image}'}
+
+    def ping(self):
+        return True
+
+    def close(self):
+        pass
+
+    def execute(self, container: FakeContainer, command):
+        '''
+        "run" every sandbox command in a shell command or script
+        '''
+        if isinstance(command, list):
+            command = command[-1] if command[:2] == ['sh', '-c'] \
+                else ' '.join(command)
+        lexer = shlex.shlex(command or '', posix=True, punctuation_chars=True)
+        lexer.whitespace_split = True
+        tokens = [*lexer]
+        for i, token in enumerate(tokens):
+            if token != 'sandbox':
+                continue
+            args = tokens[i + 1:i + 1 + SANDBOX_ARGC]
+            compile_need = args[1] == '1'
+            stdin_path = self.host_path(container, args[2])
+            self.sleep(self.latency.run)
+            stdout = '' if compile_need else self.output(stdin_path)
+            status = 'Exited Normally' if compile_need else 'AC'
+            for path, content in (
+                (args[3], stdout),
+                (args[4], ''),
+                (args[10], f'{status}\nExited Normally\n1\n1024\n'),
+            ):
+                name = str(PurePosixPath(path).relative_to('/result'))
+                container.files[name] = content
+
+    def host_path(
+        self,
+        container: FakeContainer,
+        path: str,
+    ) -> Optional[Path]:
+        '''
+        find a path of the container on the host: in the mount it is in, or
+        among the files put into the container
+        '''
+        if path == '/dev/null':
+            return None
+        for bind, host_path in sorted(
+                container.binds.items(),
+                key=lambda item: -len(item[0]),
+        ):
+            if path == bind or path.startswith(f'{bind.rstrip("/")}/'):
+                return Path(host_path + path[len(bind):])
+        if container.root is not None:
+            return container.root / PurePosixPath(path).relative_to('/')
+        return None
+
+
+def patch_client(client: FakeAPIClient) -> ExitStack:
+    '''
+    make the executor use `client`, as a context manager
+    '''
+    stack = ExitStack()
+    for module in CLIENT_USERS:
+        stack.enter_context(
+            mock.patch(f'{module}.get_client', lambda base_url: client))
+    return stack
@@ -0,0 +1,247 @@
+import io
+import queue
+from zipfile import ZipFile
+
+import pytest
+
+from dispatcher.constant import Language
+from dispatcher.fetcher import PendingSubmission
+from dispatcher.meta import Meta
+from dispatcher import testdata
+from telemetry import arrivals
+from tests.conftest import ListSink
+
+
+@pytest.fixture(scope='session')
+def sandbox_app():
+    # imported here, it starts the dispatcher once it is imported
+    import app
+    yield app
+    app.FETCHER.shutdown()
+    app.DISPATCHER.stop()
+
+
+class FakeFetcher:
+
+    def __init__(self):
+        self.waiting = []
+
+    def wait_for(self, pending, delay=0):
+        self.waiting.append((pending.submission_id, delay))
+
+    def waiting_count(self):
+        return len(self.waiting)
+
+
+@pytest.fixture
+def fake_app(sandbox_app, tmp_path, monkeypatch):
+    monkeypatch.setattr(sandbox_app, 'SUBMISSION_DIR', tmp_path)
+    monkeypatch.setattr('dispatcher.config.SUBMISSION_DIR', tmp_path)
+    monkeypatch.setattr(sandbox_app, 'FETCHER', FakeFetcher())
+    monkeypatch.setattr(sandbox_app, 'is_testdata_fresh', lambda _: True)
+    return sandbox_app
+
+
+@pytest.fixture
+def rejected(fake_app, monkeypatch):
+    '''
+    the jobs reported as JE
+    '''
+    reports = []
+    monkeypatch.setattr(
+        fake_app.DISPATCHER,
+        'reject',
+        lambda **kwargs: reports.append(kwargs),
+    )
+    return reports
+
+
+def make_source(filename='main.c') -> bytes:
+    buf = io.BytesIO()
+    with ZipFile(buf, 'w') as zf:
+        zf.writestr(filename, 'int main() {}\n')
+    return buf.getvalue()
+
+
+def submit(app, submission_id='s0', source=None):
+    return app.app.test_client().post(
+        f'/submit/{submission_id}',
+        data={
+            'token': app.SANDBOX_TOKEN,
+            'problem_id': 1,
+            'language': int(Language.C),
+            'src': (io.BytesIO(source or make_source()), 'src.zip'),
+        },
+    )
+
+
+def make_pending(submission_id='s0'):
+    return PendingSubmission(
+        submission_id=submission_id,
+        problem_id=1,
+        language=Language.C,
+        source=make_source(),
+    )
+
+
+META = Meta(
+    language=Language.C,
+    tasks=[{
+        'taskScore': 100,
+        'memoryLimit': 65536,
+        'timeLimit': 1000,
+        'caseCount': 2,
+    }],
+)
+
+
+def test_fresh_submission_is_accepted(fake_app, monkeypatch):
+    accepted = []
+    monkeypatch.setattr(
+        fake_app,
+        'accept',
+        lambda submission_id, *args: accepted.append(submission_id) or META,
+    )
+    resp = submit(fake_app)
+    assert resp.status_code == 200
+    assert accepted == ['s0']
+    assert fake_app.FETCHER.waiting == []
+
+
+def test_bad_source_is_rejected(fake_app):
+    resp = submit(fake_app, source=make_source('main.py'))
+    assert resp.status_code == 400
+    assert fake_app.FETCHER.waiting == []
+
+
+def test_full_queue_turns_submission_away(fake_app, monkeypatch):
+
+    def accept(*args):
+        raise queue.Full
+
+    monkeypatch.setattr(fake_app, 'accept', accept)
+    resp = submit(fake_app)
+    assert resp.status_code == 500
+    assert resp.get_json() == fake_app.QUEUE_FULL_RESPONSE
+
+
+def test_stale_submission_is_parked(fake_app, monkeypatch):
+    monkeypatch.setattr(fake_app, 'is_testdata_fresh', lambda _: False)
+    monkeypatch.setattr(fake_app, 'MAX_PENDING', 2)
+    assert submit(fake_app, 's0').status_code == 200
+    assert submit(fake_app, 's1').status_code == 200
+    # the parked backlog is bounded
+    resp = submit(fake_app, 's2')
+    assert resp.status_code == 500
+    assert resp.get_json() == fake_app.QUEUE_FULL_RESPONSE
+    assert fake_app.FETCHER.waiting == [('s0', 0), ('s1', 0)]
+
+
+def test_evicted_testdata_is_parked(fake_app, monkeypatch):
+
+    def accept(*args):
+        raise testdata.TestdataNotFound('evicted')
+
+    monkeypatch.setattr(fake_app, 'accept', accept)
+    assert submit(fake_app).status_code == 200
+    assert fake_app.FETCHER.waiting == [('s0', 0)]
+
+
+def test_released_submission_waits_for_queue(fake_app, monkeypatch, rejected):
+
+    def accept(submission_id, *args):
+        # extracted before the queue turned it away
+        (fake_app.SUBMISSION_DIR / submission_id).mkdir()
+        raise queue.Full
+
+    monkeypatch.setattr(fake_app, 'accept', accept)
+    monkeypatch.setattr(fake_app, 'RETRY_DELAY', 1)
+    monkeypatch.setattr(fake_app, 'MAX_RETRY_DELAY', 8)
+    pending = make_pending()
+    for _ in range(40):
+        fake_app.release_pending(pending)
+    delays = [delay for _, delay in fake_app.FETCHER.waiting]
+    assert delays[:5] == [1, 2, 4, 8, 8]
+    assert len(delays) == 40
+    # never given up on
+    assert rejected == []
+    assert not (fake_app.SUBMISSION_DIR / 's0').exists()
+
+
+def test_released_submission_waits_for_evicted_testdata(
+    fake_app,
+    monkeypatch,
+    rejected,
+):
+
+    def accept(*args):
+        raise testdata.TestdataNotFound('evicted')
+
+    monkeypatch.setattr(fake_app, 'accept', accept)
+    fake_app.release_pending(make_pending())
+    assert fake_app.FETCHER.waiting == [('s0', 0)]
+    assert rejected == []
+
+
+def test_released_submission_with_bad_source_is_je(
+    fake_app,
+    monkeypatch,
+    rejected,
+):
+
+    def accept(*args):
+        raise ValueError('none main')
+
+    monkeypatch.setattr(fake_app, 'accept', accept)
+    monkeypatch.setattr(fake_app, 'get_problem_meta', lambda *args: META)
+    fake_app.release_pending(make_pending())
+    assert fake_app.FETCHER.waiting == []
+    assert [r['submission_id'] for r in rejected] == ['s0']
+    assert rejected[0]['tasks'] == META.tasks
+
+
+def test_failed_sync_without_meta_is_je(fake_app, monkeypatch, rejected):
+
+    def get_problem_meta(*args):
+        raise ValueError('Problem not found')
+
+    monkeypatch.setattr(fake_app, 'get_problem_meta', get_problem_meta)
+    fake_app.reject_pending(make_pending(), RuntimeError('backend is down'))
+    assert rejected == [{
+        'job_id': 's0',
+        'submission_id': 's0',
+        'tasks': [],
+        'trace': None,
+    }]
+
+
+@pytest.fixture
+def arrival_sink():
+    sink = ListSink()
+    arrivals.set_sink(sink)
+    yield sink
+    arrivals.set_sink(None)
+
+
+def test_every_arrival_is_recorded(fake_app, monkeypatch, arrival_sink):
+    outcomes = iter([META, queue.Full, testdata.TestdataNotFound])
+
+    def accept(*args):
+        outcome = next(outcomes)
+        if isinstance(outcome, type):
+            raise outcome
+        return outcome
+
+    monkeypatch.setattr(fake_app, 'accept', accept)
+    # no testdata on disk, the case counts are unknown unless accepted
+    monkeypatch.setattr(testdata, 'TESTDATA_ROOT', fake_app.SUBMISSION_DIR)
+    for submission_id in ('s0', 's1', 's2'):
+        submit(fake_app, submission_id)
+    submit(fake_app, 's3', source=make_source('main.py'))
+    assert [(a['outcome'], a['caseCounts']) for a in arrival_sink.spans] == [
+        ('accepted', [2]),
+        ('queueFull', None),
+        ('parked', None),
+        ('rejected', None),
+    ]
+    assert all(a['sourceSize'] > 0 for a in arrival_sink.spans)
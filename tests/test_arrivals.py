@@ -0,0 +1,80 @@
+import pytest
+
+from telemetry import arrivals, tracing
+
+
+@pytest.fixture
+def arrival_file(tmp_path):
+    path = tmp_path / 'arrivals.jsonl'
+    arrivals.set_sink(tracing.JsonlSink(path))
+    yield path
+    arrivals.set_sink(None)
+
+
+def test_disabled_recording_does_nothing():
+    assert not arrivals.enabled()
+    arrivals.record(
+        problem_id=1,
+        language=0,
+        case_counts=[1],
+        source_size=10,
+        outcome=arrivals.ACCEPTED,
+    )
+
+
+def test_record_arrival(arrival_file):
+    arrivals.record(
+        problem_id=7,
+        language=2,
+        case_counts=(2, 3),
+        source_size=512,
+        outcome=arrivals.PARKED,
+        received_at=1000.5,
+    )
+    assert arrivals.load(arrival_file) == [{
+        'receivedAt': 1000.5,
+        'problemId': 7,
+        'language': 2,
+        'caseCounts': [2, 3],
+        'sourceSize': 512,
+        'outcome': 'parked',
+    }]
+
+
+def test_load_earliest_first(arrival_file):
+    for problem_id, received_at in ((1, 30.0), (2, 10.0), (3, 20.0)):
+        arrivals.record(
+            problem_id=problem_id,
+            language=0,
+            case_counts=[1],
+            source_size=100,
+            outcome=arrivals.ACCEPTED,
+            received_at=received_at,
+        )
+    # a trailing blank line is skipped
+    with open(arrival_file, 'a') as f:
+        f.write('\n')
+    loaded = arrivals.load(arrival_file)
+    assert [a['problemId'] for a in loaded] == [2, 3, 1]
+    assert [a['receivedAt'] for a in loaded] == [10.0, 20.0, 30.0]
+
+
+def test_unknown_case_counts_are_filled(arrival_file):
+    for problem_id, case_counts, outcome in (
+        (1, None, arrivals.PARKED),
+        (1, [2, 3], arrivals.ACCEPTED),
+        (2, None, arrivals.QUEUE_FULL),
+        (1, [2, 3], arrivals.REJECTED),
+    ):
+        arrivals.record(
+            problem_id=problem_id,
+            language=0,
+            case_counts=case_counts,
+            source_size=100,
+            outcome=outcome,
+        )
+    loaded = arrivals.load(arrival_file)
+    # problem 2 was never judged, its cases are unknown
+    assert [a['caseCounts'] for a in loaded] == [[2, 3], [2, 3], None, [2, 3]]
+    replayable = arrivals.replayable(loaded)
+    assert [a['outcome'] for a in replayable] == ['parked', 'accepted']
@@ -0,0 +1,69 @@
+import pytest
+
+from dispatcher.meta import Task
+from dispatcher.result import CaseResult, CaseResults
+
+
+def make_results(*case_counts):
+    return CaseResults([
+        Task(taskScore=0, memoryLimit=1024, timeLimit=1000, caseCount=n)
+        for n in case_counts
+    ])
+
+
+def case_result(status='AC'):
+    return CaseResult(
+        stdout='',
+        stderr='',
+        exit_code=0,
+        exec_time=1,
+        mem_usage=2,
+        status=status,
+    )
+
+
+def test_case_nos():
+    results = make_results(2, 1)
+    assert results.case_nos() == ['0000', '0001', '0100']
+    assert len(results) == 3
+    assert '0001' in results
+    assert '0101' not in results
+    assert '0200' not in results
+
+
+def test_last_case_completes_job_once():
+    results = make_results(2, 1)
+    assert not results.set('0100', case_result())
+    assert not results.set('0000', case_result())
+    assert results.remaining == 1
+    assert results.set('0001', case_result())
+    assert results.done
+    # a repeated result neither completes the job again nor breaks the count
+    assert not results.set('0001', case_result('WA'))
+    assert results.remaining == 0
+    assert results['0001'].status == 'WA'
+
+
+def test_unknown_case_raises():
+    results = make_results(1)
+    with pytest.raises(KeyError):
+        results.set('0001', case_result())
+
+
+def test_to_tasks_groups_cases_by_task():
+    results = make_results(2, 1)
+    for case_no, status in zip(results.case_nos(), ('AC', 'WA', 'TLE')):
+        results.set(case_no, case_result(status))
+    tasks = results.to_tasks()
+    assert [[case['status'] for case in task] for task in tasks] == [
+        ['AC', 'WA'],
+        ['TLE'],
+    ]
+    assert tasks[0][0] == {
+        'stdout': '',
+        'stderr': '',
+        'exitCode': 0,
+        'execTime': 1,
+        'memoryUsage': 2,
+        'status': 'AC',
+    }
@@ -0,0 +1,165 @@
+import random
+
+import pytest
+
+from executor.compare import (
+    decode,
+    normalize,
+    output_digest,
+    printable,
+    same_output,
+    split_text,
+)
+from executor.sandbox import Result
+from executor.submission import SubmissionExecutor
+
+# characters `strip` treats specially, plus some which it must not
+ALPHABET = [
+    'a', 'b', '1', ' ', ' ', '\t', '\n', '\n', '\r', '\r\n', '\v', '\f',
+    '\x1c', '\x1f', '\x85', '\xa0', '\u2028', '\u3000', '\xe9', '\u4e2d'
+]
+
+
+def random_text(rng: random.Random, length: int) -> str:
+    return ''.join(rng.choice(ALPHABET) for _ in range(length))
+
+
+def mutate(rng: random.Random, text: str) -> str:
+    '''
+    a change `strip` often ignores
+    '''
+    choice = rng.randrange(5)
+    if choice == 0:
+        return text + rng.choice(['\n', '\n\n', ' \n', '\r\n \t'])
+    if choice == 1:
+        return text.replace('\n', rng.choice([' \n', '\r\n', '\t\n']))
+    if choice == 2:
+        return text.rstrip()
+    if choice == 3 and text:
+        i = rng.randrange(len(text))
+        return text[:i] + rng.choice(ALPHABET) + text[i + 1:]
+    return text
+
+
+def random_chunks(rng: random.Random, data: bytes):
+    '''
+    split at random points, also inside multi-byte characters
+    '''
+    cuts = sorted(
+        rng.randrange(len(data) + 1) for _ in range(rng.randint(0, 6)))
+    return [data[i:j] for i, j in zip([0, *cuts], [*cuts, len(data)])]
+
+
+def same_by_strip(a: str, b: str) -> bool:
+    return SubmissionExecutor.strip(a) == SubmissionExecutor.strip(b)
+
+
+@pytest.mark.parametrize('seed', range(20))
+def test_normalize_matches_strip(seed):
+    rng = random.Random(seed)
+    for _ in range(100):
+        text = random_text(rng, rng.randint(0, 40))
+        chunks = random_chunks(rng, text.encode())
+        assert ''.join(normalize(decode(chunks))) == '\n'.join(
+            SubmissionExecutor.strip(text))
+
+
+@pytest.mark.parametrize('seed', range(20))
+def test_same_output_matches_strip(seed):
+    rng = random.Random(seed)
+    for _ in range(200):
+        a = random_text(rng, rng.randint(0, 30))
+        b = mutate(rng, a) if rng.random() < 0.8 else random_text(
+            rng, rng.randint(0, 30))
+        expected = same_by_strip(a, b)
+        assert same_output(
+            decode(random_chunks(rng, a.encode())),
+            decode(random_chunks(rng, b.encode())),
+        ) is expected, (a, b)
+        # stdout is compared as text
+        assert same_output(
+            split_text(a, rng.randint(1, 8)),
+            decode(random_chunks(rng, b.encode())),
+        ) is expected, (a, b)
+
+
+def test_invalid_bytes_are_compared():
+    assert same_output(decode([b'ab\xff', b'c\n']), decode([b'ab\xffc']))
+    assert not same_output(decode([b'ab\xff', b'c\n']), decode([b'ab\xfec']))
+    assert not same_output(decode([b'ab\xffc']), ['abc'])
+    assert output_digest(decode([b'\xff'])) != output_digest(decode([b'\xfe']))
+    # backend gets them dropped
+    assert printable(''.join(decode([b'ab\xff', b'c']))) == 'abc'
+
+
+def test_whitespace_is_held_as_line_breaks():
+    # blank lines split everywhere, `\r\n` across chunks too
+    chunks = ['a', ' \r', '\n', ' ', '\n\r', '\r\n', '  ', 'b', ' \n']
+    assert ''.join(normalize(chunks)) == 'a\n\n\n\n  b'
+    assert ''.join(normalize(['a', ' \n' * 100000])) == 'a'
+
+
+def test_stop_at_first_difference():
+
+    def endless():
+        yield 'b'
+        while True:
+            yield 'a'
+
+    assert not same_output(['a' * 10], endless())
+
+
+def test_long_line_is_streamed():
+    # no line break at all, compared piece by piece
+    line = '1 ' * 100000
+    assert same_output(split_text(line, 7), split_text(line.rstrip(), 11))
+    assert not same_output(split_text(line + '2', 7), split_text(line, 11))
+
+
+@pytest.mark.parametrize('seed', range(10))
+def test_digest_matches_same_output(seed):
+    rng = random.Random(seed)
+    for _ in range(200):
+        a = random_text(rng, rng.randint(0, 30))
+        b = mutate(rng, a)
+        assert (output_digest(split_text(a)) == output_digest(
+            decode(random_chunks(rng, b.encode())))) is same_by_strip(a, b)
+
+
+@pytest.mark.parametrize('stdout, status', [('3 \n', 'AC'), ('4\n', 'WA')])
+def test_judge_by_digest(TestSubmissionExecutor, tmp_path, stdout, status):
+    executor = TestSubmissionExecutor('job', 1000, 65536, '', '')
+    result = Result(
+        Status='Exited Normally',
+        Duration=1,
+        MemUsage=1,
+        Stdout=stdout,
+        Stderr='',
+        ExitMsg='',
+        DockerError='',
+        DockerExitCode=0,
+    )
+    # the answer file is never read
+    missing = tmp_path / 'missing.out'
+    res = executor.judge(result, missing, output_digest(['3\n']))
+    assert res['Status'] == status
+
+
+def test_judge_by_old_digest_reads_answer(TestSubmissionExecutor, tmp_path):
+    executor = TestSubmissionExecutor('job', 1000, 65536, '', '')
+    result = Result(
+        Status='Exited Normally',
+        Duration=1,
+        MemUsage=1,
+        Stdout='3\udcff\n',
+        Stderr='',
+        ExitMsg='',
+        DockerError='',
+        DockerExitCode=0,
+    )
+    answer = tmp_path / 'answer.out'
+    answer.write_bytes(b'3\xff')
+    stale = {**output_digest(['4']), 'version': 1}
+    res = executor.judge(result, answer, stale)
+    assert res['Status'] == 'AC'
+    assert res['Stdout'] == '3\n'
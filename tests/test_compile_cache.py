@@ -0,0 +1,128 @@
+import pytest
+
+from dispatcher.compile_cache import BINARY_NAME, CompileCache
+from dispatcher.constant import Language
+
+
+@pytest.fixture
+def src_dir(tmp_path):
+    src = tmp_path / 'src'
+    src.mkdir()
+    (src / 'main.c').write_text('int main() { return 0; }\n')
+    return src
+
+
+def compiled(src_dir, content=b'\x7fELF'):
+    (src_dir / BINARY_NAME).write_bytes(content)
+    return {
+        'Status': 'AC',
+        'SandboxStatus': 'Exited Normally',
+        'Stdout': '',
+        'Stderr': '',
+    }
+
+
+def test_key_depends_on_source_language_and_image(src_dir):
+    key = CompileCache.key(src_dir, Language.C, 'sha256:a')
+    assert key == CompileCache.key(src_dir, Language.C, 'sha256:a')
+    assert key != CompileCache.key(src_dir, Language.CPP, 'sha256:a')
+    assert key != CompileCache.key(src_dir, Language.C, 'sha256:b')
+    (src_dir / 'main.c').write_text('int main() { return 1; }\n')
+    assert key != CompileCache.key(src_dir, Language.C, 'sha256:a')
+
+
+def test_hit_restores_binary(tmp_path, src_dir):
+    cache = CompileCache(tmp_path / 'cache', max_size=1 << 20)
+    key = CompileCache.key(src_dir, Language.C, 'sha256:a')
+    assert cache.load(key, src_dir) is None
+    res = compiled(src_dir)
+    cache.store(key, res, src_dir)
+    (src_dir / BINARY_NAME).unlink()
+    assert cache.load(key, src_dir) == res
+    assert (src_dir / BINARY_NAME).read_bytes() == b'\x7fELF'
+    stats = cache.stats()
+    assert (stats['hits'], stats['misses']) == (1, 1)
+    assert stats['hitRate'] == 0.5
+
+
+def test_compile_error_is_cached(tmp_path, src_dir):
+    cache = CompileCache(tmp_path / 'cache', max_size=1 << 20)
+    res = {
+        'Status': 'CE',
+        'SandboxStatus': 'RE',
+        'Stdout': '',
+        'Stderr': 'main.c:1: error',
+    }
+    cache.store('k', res, src_dir)
+    assert cache.load('k', src_dir) == res
+    assert not (src_dir / BINARY_NAME).exists()
+
+
+@pytest.mark.parametrize(
+    'status, sandbox_status',
+    [
+        ('JE', None),
+        # the compiler hit a limit, it may pass on a less loaded host
+        ('CE', 'TLE'),
+        ('CE', 'MLE'),
+    ],
+)
+def test_transient_failure_is_not_cached(
+    tmp_path,
+    src_dir,
+    status,
+    sandbox_status,
+):
+    cache = CompileCache(tmp_path / 'cache', max_size=1 << 20)
+    res = {'Status': status, 'SandboxStatus': sandbox_status}
+    cache.store('k', res, src_dir)
+    assert cache.load('k', src_dir) is None
+
+
+def test_store_error_leaves_result_uncached(tmp_path, src_dir, monkeypatch):
+    cache = CompileCache(tmp_path / 'cache', max_size=1 << 20)
+
+    def disk_full(*args, **kwargs):
+        raise OSError(28, 'No space left on device')
+
+    monkeypatch.setattr('shutil.copy2', disk_full)
+    cache.store('k', compiled(src_dir), src_dir)
+    assert cache.load('k', src_dir) is None
+    # nothing is left half written
+    assert [*(tmp_path / 'cache').iterdir()] == []
+
+
+def test_broken_entry_is_a_miss(tmp_path, src_dir):
+    cache = CompileCache(tmp_path / 'cache', max_size=1 << 20)
+    cache.store('k', compiled(src_dir), src_dir)
+    (tmp_path / 'cache' / 'k' / 'result.json').write_text('{')
+    assert cache.load('k', src_dir) is None
+    # dropped, so the next compile is stored again
+    res = compiled(src_dir)
+    cache.store('k', res, src_dir)
+    assert cache.load('k', src_dir) == res
+
+
+def test_lru_eviction(tmp_path, src_dir):
+    cache = CompileCache(tmp_path / 'cache', max_size=2500)
+    for key in 'abc':
+        cache.store(key, compiled(src_dir, b'0' * 1000), src_dir)
+        # touch 'a' so 'b' is the least recently used
+        cache.load('a', src_dir)
+    assert [*cache.entries] == ['c', 'a']
+    assert cache.stats()['size'] <= 2500
+    assert not (tmp_path / 'cache' / 'b').exists()
+
+
+def test_entries_survive_restart(tmp_path, src_dir):
+    cache = CompileCache(tmp_path / 'cache', max_size=1 << 20)
+    res = compiled(src_dir)
+    cache.store('k', res, src_dir)
+    cache = CompileCache(tmp_path / 'cache', max_size=1 << 20)
+    assert cache.load('k', src_dir) == res
+
+
+def test_disabled_cache_touches_nothing(tmp_path):
+    cache = CompileCache(tmp_path / 'cache', max_size=0)
+    assert not cache.enabled
+    assert not (tmp_path / 'cache').exists()
@@ -0,0 +1,147 @@
+import time
+import itertools
+
+import pytest
+
+from executor.pool import RESET_SCRIPT, ContainerPool
+
+
+class StubClient:
+    '''
+    records the container lifecycle calls made by a pool
+    '''
+
+    def __init__(self):
+        self.ids = itertools.count()
+        self.created = []
+        self.removed = []
+        self.killed = []
+        # type: List[Tuple[container, cmd]]
+        self.execs = []
+        self.exit_code = 0
+
+    def create_host_config(self, **kwargs):
+        return kwargs
+
+    def create_container(self, **kwargs):
+        assert 'host_config' not in kwargs, 'nothing is mounted'
+        container_id = f'c{next(self.ids)}'
+        self.created.append(container_id)
+        return {'Id': container_id}
+
+    def start(self, container):
+        pass
+
+    def remove_container(self, container, v=False, force=False):
+        self.removed.append(container)
+
+    def kill(self, container):
+        self.killed.append(container)
+
+    def exec_create(self, container, cmd):
+        self.execs.append((container, cmd))
+        return {'Id': 'exec'}
+
+    def exec_start(self, exec_id):
+        return b''
+
+    def exec_inspect(self, exec_id):
+        return {'ExitCode': self.exit_code}
+
+
+def drain(pool: ContainerPool):
+    pool.background.submit(lambda: None).result()
+
+
+@pytest.fixture
+def pool():
+    pool = ContainerPool(
+        client=StubClient(),
+        image='noj-py3',
+        size=2,
+        max_uses=3,
+    )
+    yield pool
+    pool.close()
+
+
+def test_warm_up_fills_pool(pool):
+    pool.warm_up()
+    drain(pool)
+    assert pool.stats()['idle'] == 2
+    assert len(pool.client.created) == 2
+
+
+def test_hit_and_miss_counters(pool):
+    pool.warm_up()
+    drain(pool)
+    containers = [pool.acquire() for _ in range(3)]
+    stats = pool.stats()
+    assert stats['hits'] == 2
+    assert stats['misses'] == 1
+    assert stats['idle'] == 0
+    for c in containers:
+        pool.release(c)
+    drain(pool)
+    # only `size` containers stay idle, the extra one is removed
+    assert pool.stats()['idle'] == 2
+    assert len(pool.client.removed) == 1
+
+
+def test_recycle_after_max_uses(pool):
+    pool.warm_up()
+    drain(pool)
+    c = pool.acquire()
+    first_id = c.id
+    for _ in range(pool.max_uses):
+        pool.release(c)
+        c = pool.acquire()
+        if c.id != first_id:
+            break
+    drain(pool)
+    assert first_id in pool.client.removed
+    assert pool.stats()['recycled'] == 1
+
+
+def test_unhealthy_container_is_replaced(pool):
+    pool.warm_up()
+    drain(pool)
+    c = pool.acquire()
+    pool.release(c, healthy=False)
+    drain(pool)
+    assert pool.client.removed == [c.id]
+    # a replacement was created in the background
+    assert pool.stats()['idle'] == 2
+    assert len(pool.client.created) == 3
+
+
+def test_container_is_reset_before_reuse(pool):
+    c = pool.acquire()
+    pool.release(c)
+    assert pool.client.execs == [(c.id, ['sh', '-c', RESET_SCRIPT])]
+    assert pool.acquire() is c
+
+
+def test_failed_reset_recycles_container(pool):
+    c = pool.acquire()
+    pool.client.exit_code = 1
+    pool.release(c)
+    drain(pool)
+    assert pool.client.removed == [c.id]
+    assert pool.stats()['recycled'] == 1
+
+
+def test_exec_timeout_kills_container(pool):
+
+    class SlowClient(StubClient):
+
+        def exec_start(self, exec_id):
+            # returns once the container is killed
+            while not self.killed:
+                time.sleep(0.001)
+
+    pool.client = SlowClient()
+    c = pool.create()
+    with pytest.raises(TimeoutError):
+        pool.exec(c, 'true', timeout=0.01)
+    assert pool.client.killed == [c.id]
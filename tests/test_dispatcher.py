@@ -1,4 +1,10 @@
+import json
+import time
+import threading
+from dispatcher import job
 from dispatcher.dispatcher import Dispatcher
+from dispatcher.meta import Meta, Task
+from telemetry import tracing
 from tests.submission_generator import SubmissionGenerator
 
 
@@ -52,3 +58,313 @@ def test_same_submission_parallel_jobs(
 
     assert not docker_dispatcher.contains(job1)
     assert docker_dispatcher.contains(job2)
+
+
+def wait_for_judged(dispatcher: Dispatcher, job_id: str, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        _, results = dispatcher.result[job_id]
+        if results.done:
+            return True
+        time.sleep(0.001)
+    return False
+
+
+def test_idle_dispatcher_reacts_to_new_job(
+    docker_dispatcher: Dispatcher,
+    submission_generator,
+    fake_executor,
+):
+    docker_dispatcher.start()
+    # let the loop block on the empty queue
+    time.sleep(0.05)
+    job_id = next(_id
+                  for _id, prob in submission_generator.submission_ids.items()
+                  if prob == 'normal-submission')
+    started = time.monotonic()
+    docker_dispatcher.handle(job_id=job_id, submission_id=job_id)
+    assert wait_for_judged(docker_dispatcher, job_id)
+    # the old polling loop slept up to one second here
+    assert time.monotonic() - started < 0.5
+
+
+def test_freed_slot_dispatches_next_case(
+    submission_generator,
+    fake_executor,
+):
+    d = Dispatcher()
+    d.SUBMISSION_DIR = submission_generator.submission_path
+    d.testing = True
+    d.MAX_CONTAINER_SIZE = 1
+    d.container_slots = threading.BoundedSemaphore(1)
+    fake_executor.run_duration = 0.01
+    job_id = next(_id
+                  for _id, prob in submission_generator.submission_ids.items()
+                  if prob == 'normal-submission')
+    d.start()
+    try:
+        started = time.monotonic()
+        d.handle(job_id=job_id, submission_id=job_id)
+        assert wait_for_judged(d, job_id)
+        # two cases share one slot back to back
+        assert time.monotonic() - started < 0.5
+        assert d.container_count == 0
+    finally:
+        d.stop()
+
+
+def test_dropped_case_gives_slot_back(
+    submission_generator,
+    fake_executor,
+):
+    d = Dispatcher()
+    d.SUBMISSION_DIR = submission_generator.submission_path
+    d.testing = True
+    d.MAX_CONTAINER_SIZE = 1
+    d.container_slots = threading.BoundedSemaphore(1)
+    job_id = next(_id
+                  for _id, prob in submission_generator.submission_ids.items()
+                  if prob == 'normal-submission')
+    # the execute lane is gone, as after `stop`
+    d.execute_pool.shutdown()
+    d.start()
+    try:
+        d.handle(job_id=job_id, submission_id=job_id)
+        deadline = time.monotonic() + 2
+        while d.queue.qsize() and time.monotonic() < deadline:
+            time.sleep(0.001)
+        # let the loop take the last case
+        time.sleep(0.05)
+        # every case was dropped and none kept a slot
+        assert d.queue.qsize() == 0
+        assert d.container_count == 0
+        assert d.container_slots.acquire(blocking=False)
+    finally:
+        d.stop()
+
+
+def test_stop_wakes_idle_dispatcher(docker_dispatcher: Dispatcher):
+    docker_dispatcher.start()
+    time.sleep(0.05)
+    docker_dispatcher.stop()
+    docker_dispatcher.join(timeout=1)
+    assert not docker_dispatcher.is_alive()
+
+
+def test_work_runs_on_bounded_lanes(
+    tmp_path,
+    submission_generator,
+    fake_executor,
+):
+    config_path = tmp_path / 'dispatcher.json'
+    config_path.write_text(
+        json.dumps({
+            'MAX_CONTAINER_NUMBER': 2,
+            'MAX_COMPILE_NUMBER': 1,
+        }))
+    d = Dispatcher(str(config_path))
+    d.SUBMISSION_DIR = submission_generator.submission_path
+    d.testing = True
+    job_ids = []
+    for prob in ('c-TLE', 'normal-submission', 'normal-submission'):
+        job_id = submission_generator.gen_submission_id()
+        submission_generator.gen_submission(prob, job_id)
+        job_ids.append(job_id)
+    d.start()
+    try:
+        for job_id in job_ids:
+            d.handle(job_id=job_id, submission_id=job_id)
+        for job_id in job_ids:
+            assert wait_for_judged(d, job_id)
+    finally:
+        d.stop()
+    assert len(fake_executor.compile_threads) == 1
+    assert fake_executor.compile_threads[0].startswith('compile')
+    # 2 + 2 + 2 cases on at most 2 reused workers
+    assert len(fake_executor.run_threads) == 6
+    assert all(
+        name.startswith('execute') for name in fake_executor.run_threads)
+    assert len(set(fake_executor.run_threads)) <= 2
+
+
+def gen_c_submission(submission_generator):
+    job_id = submission_generator.gen_submission_id()
+    submission_generator.gen_submission('c-TLE', job_id)
+    return job_id
+
+
+def test_execute_jobs_wait_for_compile(
+    docker_dispatcher: Dispatcher,
+    submission_generator,
+    fake_executor,
+):
+    fake_executor.compile_gate = threading.Event()
+    job_id = gen_c_submission(submission_generator)
+    docker_dispatcher.start()
+    docker_dispatcher.handle(job_id=job_id, submission_id=job_id)
+    deadline = time.monotonic() + 2
+    while len(docker_dispatcher.parked.get(job_id, [])) < 2:
+        assert time.monotonic() < deadline
+        time.sleep(0.001)
+    # parked jobs are not spinning through the queue
+    assert docker_dispatcher.queue.empty()
+    assert fake_executor.run_threads == []
+    fake_executor.compile_gate.set()
+    assert wait_for_judged(docker_dispatcher, job_id)
+    assert job_id not in docker_dispatcher.parked
+    assert len(fake_executor.run_threads) == 2
+
+
+def test_compile_error_skips_containers(
+    docker_dispatcher: Dispatcher,
+    submission_generator,
+    fake_executor,
+):
+    fake_executor.compile_status = 'CE'
+    job_id = gen_c_submission(submission_generator)
+    docker_dispatcher.start()
+    docker_dispatcher.handle(job_id=job_id, submission_id=job_id)
+    assert wait_for_judged(docker_dispatcher, job_id)
+    _, results = docker_dispatcher.result[job_id]
+    assert [r.status for r in results] == ['CE', 'CE']
+    assert fake_executor.run_threads == []
+    assert docker_dispatcher.container_count == 0
+
+
+def test_failed_compile_releases_parked_jobs(
+    docker_dispatcher: Dispatcher,
+    submission_generator,
+    fake_executor,
+    monkeypatch,
+):
+
+    def fail(self):
+        raise RuntimeError('docker is gone')
+
+    monkeypatch.setattr(fake_executor, 'compile', fail)
+    job_id = gen_c_submission(submission_generator)
+    docker_dispatcher.start()
+    docker_dispatcher.handle(job_id=job_id, submission_id=job_id)
+    assert wait_for_judged(docker_dispatcher, job_id)
+    _, results = docker_dispatcher.result[job_id]
+    assert [r.status for r in results] == ['JE', 'JE']
+    assert job_id not in docker_dispatcher.parked
+    assert fake_executor.run_threads == []
+
+
+def test_reject_reports_every_case_as_je(
+    docker_dispatcher: Dispatcher,
+    monkeypatch,
+):
+    reports = []
+    monkeypatch.setattr(docker_dispatcher.reporter, 'report', reports.append)
+    tasks = [
+        Task(caseCount=2, taskScore=50, memoryLimit=1024, timeLimit=1000),
+        Task(caseCount=1, taskScore=50, memoryLimit=1024, timeLimit=1000),
+    ]
+    docker_dispatcher.reject('job', 'sub', tasks)
+    docker_dispatcher.reject('unknown', 'sub-2', [])
+    assert [(r.job_id, r.submission_id) for r in reports] == [
+        ('job', 'sub'),
+        ('unknown', 'sub-2'),
+    ]
+    assert [[case['status'] for case in task]
+            for task in reports[0].tasks] == [['JE', 'JE'], ['JE']]
+    assert reports[1].tasks == []
+    assert not docker_dispatcher.contains('job')
+
+
+def test_batch_execution_uses_one_container(
+    tmp_path,
+    submission_generator,
+    fake_executor,
+):
+    config_path = tmp_path / 'dispatcher.json'
+    config_path.write_text(json.dumps({'BATCH_EXECUTION': True}))
+    d = Dispatcher(str(config_path))
+    d.SUBMISSION_DIR = submission_generator.submission_path
+    d.testing = True
+    job_id = gen_c_submission(submission_generator)
+    d.handle(job_id=job_id, submission_id=job_id)
+    # the compile and a single batch
+    assert [type(j) for j in d.queue.queue] == [job.Compile, job.ExecuteBatch]
+    d.start()
+    try:
+        assert wait_for_judged(d, job_id)
+    finally:
+        d.stop()
+    _, results = d.result[job_id]
+    assert [r.status for r in results] == ['AC', 'AC']
+    assert len(fake_executor.run_threads) == 1
+    assert d.container_count == 0
+
+
+def test_identical_source_hits_compile_cache(
+    docker_dispatcher: Dispatcher,
+    submission_generator,
+    fake_executor,
+):
+    fake_executor.compile_status = 'CE'
+    docker_dispatcher.start()
+    for _ in range(2):
+        job_id = gen_c_submission(submission_generator)
+        docker_dispatcher.handle(job_id=job_id, submission_id=job_id)
+        assert wait_for_judged(docker_dispatcher, job_id)
+    assert len(fake_executor.compile_threads) == 1
+    stats = docker_dispatcher.compile_cache.stats()
+    assert (stats['hits'], stats['misses']) == (1, 1)
+
+
+def test_digests_loaded_per_job(
+    docker_dispatcher: Dispatcher,
+    submission_generator,
+):
+    with_digest = gen_c_submission(submission_generator)
+    cases = {'0000': {'sha256': 'ab', 'length': 2}}
+    (docker_dispatcher.SUBMISSION_DIR / with_digest / 'digest.json') \
+        .write_text(json.dumps({'checksum': 'x', 'cases': cases}))
+    without_digest = gen_c_submission(submission_generator)
+    for job_id in (with_digest, without_digest):
+        docker_dispatcher.handle(job_id=job_id, submission_id=job_id)
+    assert docker_dispatcher.digests[with_digest] == cases
+    assert docker_dispatcher.digests[without_digest] == {}
+    docker_dispatcher.release(with_digest)
+    assert with_digest not in docker_dispatcher.digests
+
+
+def test_handle_takes_parsed_meta(
+    docker_dispatcher: Dispatcher,
+    submission_generator,
+):
+    job_id = gen_c_submission(submission_generator)
+    meta_path = docker_dispatcher.SUBMISSION_DIR / job_id / 'meta.json'
+    meta = Meta.parse_raw(meta_path.read_text())
+    meta_path.unlink()
+    docker_dispatcher.handle(job_id=job_id, submission_id=job_id, meta=meta)
+    submission_config, _ = docker_dispatcher.result[job_id]
+    assert submission_config is meta
+
+
+def test_job_spans_share_the_request_trace(
+    docker_dispatcher: Dispatcher,
+    submission_generator,
+    fake_executor,
+    trace_sink,
+):
+    job_id = gen_c_submission(submission_generator)
+    docker_dispatcher.start()
+    with tracing.span('submit'):
+        docker_dispatcher.handle(job_id=job_id, submission_id=job_id)
+    assert wait_for_judged(docker_dispatcher, job_id)
+    deadline = time.monotonic() + 2
+    while trace_sink.names().count('execute') < 2:
+        assert time.monotonic() < deadline
+        time.sleep(0.001)
+    names = trace_sink.names()
+    assert names.count('compile') == 1
+    # the compile and both cases
+    assert names.count('queue.wait') == 3
+    submit = next(s for s in trace_sink.spans if s['name'] == 'submit')
+    assert {s['traceId'] for s in trace_sink.spans} == {submit['traceId']}
+    assert all(s['parentId'] == submit['spanId'] for s in trace_sink.spans
+               if s['name'] != 'submit')
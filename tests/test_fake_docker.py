@@ -0,0 +1,179 @@
+import json
+import pathlib
+import time
+
+import pytest
+
+from dispatcher.dispatcher import Dispatcher
+from executor.pool import ContainerPool
+from executor.sandbox import BatchCase, Sandbox
+from tests.fake_docker import FakeAPIClient, patch_client
+
+
+@pytest.fixture
+def client():
+    client = FakeAPIClient()
+    with patch_client(client):
+        yield client
+
+
+def submission_of(submission_generator, prob_name):
+    job_id = next(_id
+                  for _id, pn in submission_generator.submission_ids.items()
+                  if pn == prob_name)
+    return job_id, submission_generator.get_submission_path(job_id)
+
+
+def test_compile_and_run(
+    client,
+    submission_generator,
+    TestSubmissionExecutor,
+):
+    job_id, submission_path = submission_of(submission_generator, 'c-TLE')
+    executor = TestSubmissionExecutor(
+        job_id=job_id,
+        time_limit=1000,
+        mem_limit=32768,
+        testdata_input_path=submission_path + '/testcase/0000.in',
+        testdata_output_path=submission_path + '/testcase/0000.out',
+        lang='c11',
+    )
+
+    res = executor.compile()
+    assert res['Status'] == 'AC', json.dumps(res)
+    res = executor.run()
+    assert res['Status'] == 'AC', json.dumps(res)
+    # every container is removed after its run
+    assert client.created == client.removed == 2
+
+
+def test_wrong_output(submission_generator, TestSubmissionExecutor):
+    client = FakeAPIClient(output=lambda stdin_path: 'wrong\n')
+    job_id, submission_path = submission_of(
+        submission_generator,
+        'normal-submission',
+    )
+    executor = TestSubmissionExecutor(
+        job_id=job_id,
+        time_limit=1000,
+        mem_limit=32768,
+        testdata_input_path=submission_path + '/testcase/0000.in',
+        testdata_output_path=submission_path + '/testcase/0000.out',
+        lang='python3',
+    )
+
+    with patch_client(client):
+        res = executor.run()
+    assert res['Status'] == 'WA', json.dumps(res)
+    assert res['Stdout'] == 'wrong\n'
+
+
+def test_run_batch(client, submission_generator, TestSubmissionExecutor):
+    job_id, submission_path = submission_of(
+        submission_generator,
+        'normal-submission',
+    )
+    executor = TestSubmissionExecutor(
+        job_id=job_id,
+        time_limit=1000,
+        mem_limit=32768,
+        testdata_input_path=submission_path + '/testcase',
+        testdata_output_path=submission_path + '/testcase',
+        lang='python3',
+    )
+
+    res = executor.run_batch([
+        BatchCase(case_no='0000', time_limit=1000, mem_limit=32768),
+        BatchCase(case_no='0100', time_limit=1000, mem_limit=32768),
+    ])
+    assert {
+        case_no: r['Status']
+        for case_no, r in res.items()
+    } == {
+        '0000': 'AC',
+        '0100': 'AC',
+    }
+    # both cases share a container
+    assert client.created == 1
+
+
+@pytest.mark.parametrize('batch', [False, True])
+def test_dispatcher_end_to_end(client, tmp_path, submission_generator, batch):
+    config_path = tmp_path / 'dispatcher.json'
+    config_path.write_text(
+        json.dumps({
+            'MAX_CONTAINER_NUMBER': 4,
+            'BATCH_EXECUTION': batch,
+        }))
+    # the fake reads inputs from the host paths mounted in a container
+    submission_config_path = tmp_path / 'submission.json'
+    submission_config = json.loads(
+        pathlib.Path('.config/submission.json').read_text())
+    submission_config['working_dir'] = str(
+        submission_generator.submission_path.absolute())
+    submission_config_path.write_text(json.dumps(submission_config))
+    d = Dispatcher(str(config_path), str(submission_config_path))
+    d.SUBMISSION_DIR = submission_generator.submission_path
+    d.testing = True
+    job_ids = [*submission_generator.submission_ids]
+    d.start()
+    try:
+        for job_id in job_ids:
+            d.handle(job_id=job_id, submission_id=job_id)
+        deadline = time.monotonic() + 5
+        while not all(d.result[job_id][1].done for job_id in job_ids):
+            assert time.monotonic() < deadline
+            time.sleep(0.01)
+        statuses = {
+            job_id: [case.status for case in d.result[job_id][1]]
+            for job_id in job_ids
+        }
+    finally:
+        d.stop()
+    # nothing runs for real, even the misnamed source is accepted
+    for job_id, prob in submission_generator.submission_ids.items():
+        assert set(statuses[job_id]) == {'AC'}, prob
+    assert client.peak_containers <= 4
+
+
+def test_pooled_run_copies_inputs(submission_generator):
+    # echo the input, the answers are never copied into the container
+    client = FakeAPIClient(output=lambda stdin_path: stdin_path.read_text())
+    job_id, submission_path = submission_of(
+        submission_generator,
+        'normal-submission',
+    )
+    with patch_client(client):
+        sandbox = Sandbox(
+            time_limit=1000,
+            mem_limit=32768,
+            image='noj-py3',
+            # host paths, read from `local_dir` here
+            src_dir=f'/host/{job_id}/src',
+            lang_id=2,
+            compile_need=False,
+            stdin_path=f'/host/{job_id}/testcase/0000.in',
+            local_dir=submission_path,
+        )
+        pool = sandbox.pool = ContainerPool(
+            client=client,
+            image='noj-py3',
+            size=1,
+            max_uses=5,
+        )
+        try:
+            result = sandbox.run()
+            [container] = client.containers.values()
+            copied = sorted(
+                path.relative_to(container.root).as_posix()
+                for path in container.root.rglob('*'))
+        finally:
+            pool.close()
+    assert result.Stdout == pathlib.Path(
+        submission_path,
+        'testcase',
+        '0000.in',
+    ).read_text()
+    # nothing is shared with the host
+    assert container.binds == {}
+    assert copied == ['src', 'src/main.py', 'testdata', 'testdata/in']
@@ -0,0 +1,172 @@
+import threading
+from contextlib import contextmanager, nullcontext
+
+from dispatcher.constant import Language
+from dispatcher import fetcher as testdata_fetcher
+from dispatcher.fetcher import PendingSubmission
+from dispatcher import testdata
+
+
+def make_pending(submission_id, problem_id=1):
+    return PendingSubmission(
+        submission_id=submission_id,
+        problem_id=problem_id,
+        language=Language.C,
+        source=b'',
+    )
+
+
+class Recorder:
+
+    def __init__(self):
+        self.ready = []
+        self.failed = []
+        self.done = threading.Semaphore(0)
+
+    def on_ready(self, pending):
+        self.ready.append(pending.submission_id)
+        self.done.release()
+
+    def on_failed(self, pending, error):
+        self.failed.append((pending.submission_id, str(error)))
+        self.done.release()
+
+    def wait(self, n):
+        for _ in range(n):
+            assert self.done.acquire(timeout=5)
+
+
+def test_waiting_submissions_share_one_sync():
+    recorder = Recorder()
+    gate = threading.Event()
+    synced = []
+
+    def ensure(problem_id):
+        synced.append(problem_id)
+        gate.wait()
+
+    fetcher = testdata_fetcher.TestdataFetcher(
+        on_ready=recorder.on_ready,
+        on_failed=recorder.on_failed,
+        pin=lambda problem_id: nullcontext(),
+        ensure=ensure,
+    )
+    for i in range(5):
+        fetcher.wait_for(make_pending(f's{i}'))
+    fetcher.wait_for(make_pending('other', problem_id=2))
+    assert fetcher.waiting_count() == 6
+    gate.set()
+    recorder.wait(6)
+    assert sorted(synced) == [1, 2]
+    assert sorted(recorder.ready) == ['other', 's0', 's1', 's2', 's3', 's4']
+    assert fetcher.waiting_count() == 0
+    # a later submission syncs again
+    fetcher.wait_for(make_pending('late'))
+    recorder.wait(1)
+    assert synced.count(1) == 2
+    fetcher.shutdown()
+
+
+def test_failed_sync_releases_waiting_submissions():
+    recorder = Recorder()
+
+    def ensure(problem_id):
+        raise ValueError('Problem not found')
+
+    fetcher = testdata_fetcher.TestdataFetcher(
+        on_ready=recorder.on_ready,
+        on_failed=recorder.on_failed,
+        pin=lambda problem_id: nullcontext(),
+        ensure=ensure,
+    )
+    fetcher.wait_for(make_pending('s0'))
+    recorder.wait(1)
+    assert recorder.failed == [('s0', 'Problem not found')]
+    assert recorder.ready == []
+    fetcher.shutdown()
+
+
+def test_delayed_wait_syncs_later():
+    recorder = Recorder()
+    synced = []
+    fetcher = testdata_fetcher.TestdataFetcher(
+        on_ready=recorder.on_ready,
+        on_failed=recorder.on_failed,
+        pin=lambda problem_id: nullcontext(),
+        ensure=synced.append,
+    )
+    fetcher.wait_for(make_pending('s0'), delay=0.2)
+    # counted as waiting before its sync starts
+    assert fetcher.waiting_count() == 1
+    assert synced == []
+    recorder.wait(1)
+    assert synced == [1]
+    assert recorder.ready == ['s0']
+    assert fetcher.waiting_count() == 0
+    fetcher.shutdown()
+
+
+def test_shutdown_cancels_delayed_waits():
+    recorder = Recorder()
+    fetcher = testdata_fetcher.TestdataFetcher(
+        on_ready=recorder.on_ready,
+        on_failed=recorder.on_failed,
+        pin=lambda problem_id: nullcontext(),
+        ensure=lambda problem_id: None,
+    )
+    fetcher.wait_for(make_pending('s0'), delay=0.1)
+    fetcher.shutdown()
+    assert not recorder.done.acquire(timeout=0.3)
+    assert recorder.ready == []
+
+
+def test_testdata_is_pinned_while_released():
+    recorder = Recorder()
+    pinned = []
+
+    unpinned = threading.Event()
+
+    @contextmanager
+    def pin(problem_id):
+        pinned.append(problem_id)
+        yield
+        pinned.remove(problem_id)
+        unpinned.set()
+
+    def on_ready(pending):
+        # not evictable while the submission is extracted
+        assert pinned == [1]
+        recorder.on_ready(pending)
+
+    fetcher = testdata_fetcher.TestdataFetcher(
+        on_ready=on_ready,
+        on_failed=recorder.on_failed,
+        ensure=lambda problem_id: None,
+        pin=pin,
+    )
+    fetcher.wait_for(make_pending('s0'))
+    fetcher.wait_for(make_pending('s1'))
+    recorder.wait(2)
+    assert sorted(recorder.ready) == ['s0', 's1']
+    assert unpinned.wait(timeout=5)
+    assert pinned == []
+    fetcher.shutdown()
+
+
+def test_evicted_testdata_is_still_released():
+    recorder = Recorder()
+
+    def pin(problem_id):
+        raise testdata.TestdataNotFound(f'no testdata of problem {problem_id}')
+
+    fetcher = testdata_fetcher.TestdataFetcher(
+        on_ready=recorder.on_ready,
+        on_failed=recorder.on_failed,
+        ensure=lambda problem_id: None,
+        pin=pin,
+    )
+    fetcher.wait_for(make_pending('s0'))
+    recorder.wait(1)
+    # it finds the testdata gone and waits again
+    assert recorder.ready == ['s0']
+    fetcher.shutdown()
@@ -0,0 +1,142 @@
+import io
+import os
+from zipfile import ZipFile
+
+import pytest
+
+from dispatcher import file_manager
+from dispatcher.constant import Language
+from dispatcher.meta import Meta
+
+
+def make_source() -> io.BytesIO:
+    buf = io.BytesIO()
+    with ZipFile(buf, 'w') as zf:
+        zf.writestr('main.c', 'int main() {}')
+    buf.seek(0)
+    return buf
+
+
+def make_meta() -> Meta:
+    return Meta(
+        language=Language.C,
+        tasks=[{
+            'taskScore': 100,
+            'memoryLimit': 65536,
+            'timeLimit': 1000,
+            'caseCount': 1,
+        }],
+    )
+
+
+@pytest.fixture
+def problem_root(tmp_path):
+    root = tmp_path / 'problem'
+    (root / 'chaos').mkdir(parents=True)
+    (root / '0000.in').write_text('1 2\n')
+    (root / '0000.out').write_text('3\n')
+    (root / 'chaos' / 'data.txt').write_text('chaos')
+    return root
+
+
+@pytest.mark.parametrize('mode', file_manager.WORKSPACE_MODES)
+def test_extract_modes(tmp_path, problem_root, mode):
+    root_dir = tmp_path / 'submissions'
+    root_dir.mkdir()
+    file_manager.extract(
+        root_dir=root_dir,
+        job_id='job',
+        meta=make_meta(),
+        source=make_source(),
+        testdata=problem_root,
+        mode=mode,
+    )
+    testcase_dir = root_dir / 'job' / 'testcase'
+    assert sorted(p.name for p in testcase_dir.iterdir()) == [
+        '0000.in',
+        '0000.out',
+    ]
+    assert (testcase_dir / '0000.out').read_text() == '3\n'
+    shared = os.path.samefile(testcase_dir / '0000.in',
+                              problem_root / '0000.in')
+    assert shared is (mode == 'hardlink')
+    # chaos files are copies, the submission may write to them
+    chaos_file = root_dir / 'job' / 'src' / 'data.txt'
+    assert chaos_file.read_text() == 'chaos'
+    assert not os.path.samefile(chaos_file,
+                                problem_root / 'chaos' / 'data.txt')
+    assert (problem_root / 'chaos' / 'data.txt').exists()
+
+
+def test_hardlink_falls_back_to_copy(tmp_path, problem_root, monkeypatch):
+
+    def cross_device(src, dst):
+        raise OSError(18, 'Invalid cross-device link')
+
+    monkeypatch.setattr('os.link', cross_device)
+    dst = tmp_path / 'copied'
+    file_manager.link_function('hardlink')(problem_root / '0000.out', dst)
+    assert dst.read_text() == '3\n'
+
+
+def test_link_inputs(tmp_path, problem_root):
+    root_dir = tmp_path / 'submissions'
+    root_dir.mkdir()
+    file_manager.extract(
+        root_dir=root_dir,
+        job_id='job',
+        meta=make_meta(),
+        source=make_source(),
+        testdata=problem_root,
+        mode='copy',
+    )
+    job_dir = root_dir / 'job'
+    input_dir = file_manager.link_inputs(job_dir)
+    # the answers are left out
+    assert [p.name for p in input_dir.iterdir()] == ['0000.in']
+    assert os.path.samefile(input_dir / '0000.in',
+                            job_dir / 'testcase' / '0000.in')
+    # linking again keeps the same directory
+    assert file_manager.link_inputs(job_dir) == input_dir
+
+
+def test_unknown_mode():
+    with pytest.raises(ValueError):
+        file_manager.link_function('symlink')
+
+
+@pytest.mark.parametrize('names, error', [
+    (['main.c'], None),
+    ([], 'no file'),
+    (['other.c'], 'none main'),
+    (['main.py'], 'not match'),
+    (['dir/main.c'], 'none main'),
+])
+def test_check_source(names, error):
+    buf = io.BytesIO()
+    with ZipFile(buf, 'w') as zf:
+        for name in names:
+            zf.writestr(name, '')
+    buf.seek(0)
+    if error is None:
+        file_manager.check_source(buf, Language.C)
+        # still readable by `extract`
+        assert buf.tell() == 0
+    else:
+        with pytest.raises(ValueError, match=error):
+            file_manager.check_source(buf, Language.C)
+
+
+def test_prune_backups(tmp_path, monkeypatch):
+    monkeypatch.setattr(file_manager.config, 'SUBMISSION_BACKUP_DIR', tmp_path)
+    for i in range(4):
+        backup = tmp_path / f'job-{i}'
+        backup.mkdir()
+        # backed up at 100, 200, 300 and 400
+        os.utime(backup, (100 * (i + 1), 100 * (i + 1)))
+    assert file_manager.prune_backups(max_age=0, max_count=0) == []
+    removed = file_manager.prune_backups(max_age=250, max_count=0, now=500)
+    assert sorted(p.name for p in removed) == ['job-0', 'job-1']
+    removed = file_manager.prune_backups(max_age=0, max_count=1, now=500)
+    assert [p.name for p in removed] == ['job-2']
+    assert [p.name for p in tmp_path.iterdir()] == ['job-3']
@@ -0,0 +1,75 @@
+import threading
+
+import pytest
+
+from telemetry import metrics
+
+
+def test_histogram_renders_cumulative_buckets():
+    registry = metrics.Registry()
+    histogram = registry.register(
+        metrics.Histogram(
+            'phase_seconds',
+            'Phase time.',
+            ('phase', ),
+            buckets=(0.1, 1),
+        ))
+    histogram.observe(0.05, phase='create')
+    histogram.observe(0.1, phase='create')
+    histogram.observe(5, phase='create')
+    assert registry.render() == '\n'.join([
+        '# HELP phase_seconds Phase time.',
+        '# TYPE phase_seconds histogram',
+        'phase_seconds_bucket{phase="create",le="0.1"} 2',
+        'phase_seconds_bucket{phase="create",le="1"} 2',
+        'phase_seconds_bucket{phase="create",le="+Inf"} 3',
+        'phase_seconds_sum{phase="create"} 5.15',
+        'phase_seconds_count{phase="create"} 3',
+        '',
+    ])
+
+
+def test_counter_sums_every_thread():
+    counter = metrics.Counter('cases', 'Cases.', ('status', ))
+
+    def work():
+        for _ in range(1000):
+            counter.inc(status='AC')
+
+    threads = [threading.Thread(target=work) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert counter.value(status='AC') == 8000
+    assert counter.value(status='WA') == 0
+    assert counter.render() == '\n'.join([
+        '# HELP cases_total Cases.',
+        '# TYPE cases_total counter',
+        'cases_total{status="AC"} 8000',
+    ])
+
+
+def test_time_observes_failed_blocks():
+    histogram = metrics.Histogram('refresh_seconds', 'Refresh time.')
+    with pytest.raises(RuntimeError):
+        with histogram.time():
+            raise RuntimeError
+    assert histogram.count() == 1
+
+
+def test_labels_are_checked():
+    counter = metrics.Counter('cases', 'Cases.', ('status', ))
+    with pytest.raises(ValueError):
+        counter.inc(result='AC')
+    registry = metrics.Registry()
+    registry.register(counter)
+    with pytest.raises(ValueError):
+        registry.register(metrics.Counter('cases', 'Again.'))
+
+
+def test_label_values_are_escaped():
+    counter = metrics.Counter('errors', 'Errors.', ('message', ))
+    counter.inc(message='a "quoted"\nline\\')
+    assert 'errors_total{message="a \\"quoted\\"\\nline\\\\"} 1' \
+        in counter.render()
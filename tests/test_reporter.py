@@ -0,0 +1,250 @@
+import gzip
+import json
+import time
+
+import pytest
+import requests
+
+from dispatcher.reporter import Report, ResultReporter
+from tests.backend_stub import BackendStub
+
+
+class StubResponse:
+
+    def __init__(self, status_code):
+        self.status_code = status_code
+        self.text = ''
+
+    @property
+    def ok(self):
+        return self.status_code < 400
+
+
+class RecordingSession:
+    '''
+    put() plays back scripted outcomes and records the requests
+    '''
+
+    def __init__(self, outcomes):
+        self._outcomes = list(outcomes)
+        self.calls = []
+
+    def put(self, url, data=None, headers=None, timeout=None):
+        # a file would be written to disk by requests asking its `fileno`
+        assert isinstance(data, bytes)
+        self.calls.append({
+            'url': url,
+            'body': data,
+            'headers': headers,
+            'timeout': timeout,
+        })
+        outcome = self._outcomes.pop(0)
+        if isinstance(outcome, Exception):
+            raise outcome
+        return StubResponse(outcome)
+
+
+@pytest.fixture
+def cleaned(monkeypatch):
+    calls = []
+    monkeypatch.setattr(
+        'dispatcher.file_manager.clean_data',
+        lambda job_id: calls.append(('clean', job_id)),
+    )
+    monkeypatch.setattr(
+        'dispatcher.file_manager.backup_data',
+        lambda job_id: calls.append(('backup', job_id)),
+    )
+    return calls
+
+
+def make_reporter(outcomes, **kwargs):
+    sleeps = []
+    reporter = ResultReporter(
+        base_url='http://web:8080/',
+        session=RecordingSession(outcomes),
+        sleep=sleeps.append,
+        **kwargs,
+    )
+    return reporter, sleeps
+
+
+def make_report():
+    return Report(job_id='job', submission_id='sub', tasks=[[{'a': 1}]])
+
+
+def test_send_payload():
+    reporter, sleeps = make_reporter([200], timeout=3)
+    assert reporter.send(make_report())
+    [call] = reporter.session.calls
+    assert call['url'] == 'http://web:8080/submission/sub/complete'
+    assert json.loads(call['body'])['tasks'] == [[{'a': 1}]]
+    assert call['headers'] == {'Content-Type': 'application/json'}
+    assert call['timeout'] == 3
+    assert sleeps == []
+
+
+def test_gzip_payload():
+    reporter, _ = make_reporter([200], gzip_payload=True)
+    assert reporter.send(make_report())
+    [call] = reporter.session.calls
+    assert call['headers']['Content-Encoding'] == 'gzip'
+    body = json.loads(gzip.decompress(call['body']))
+    assert body['tasks'] == [[{'a': 1}]]
+
+
+def test_retry_with_backoff():
+    reporter, sleeps = make_reporter([
+        requests.ConnectionError('down'),
+        503,
+        429,
+        200,
+    ])
+    assert reporter.send(make_report())
+    assert sleeps == [1, 2, 4]
+    # every attempt sends the whole body
+    bodies = {call['body'] for call in reporter.session.calls}
+    assert len(bodies) == 1
+
+
+def test_client_error_is_not_retried():
+    reporter, sleeps = make_reporter([400])
+    assert not reporter.send(make_report())
+    assert sleeps == []
+
+
+def test_give_up_after_max_retries():
+    reporter, sleeps = make_reporter([500] * 3, max_retries=2)
+    assert not reporter.send(make_report())
+    assert len(reporter.session.calls) == 3
+    assert sleeps == [1, 2]
+
+
+def test_thread_cleans_or_backs_up(cleaned):
+    reporter, _ = make_reporter([200, 400])
+    reporter.start()
+    reporter.report(make_report())
+    reporter.report(Report(job_id='job2', submission_id='sub2', tasks=[]))
+    reporter.stop()
+    reporter.join(timeout=1)
+    assert not reporter.is_alive()
+    assert cleaned == [('clean', 'job'), ('backup', 'job2')]
+
+
+def make_reports(n):
+    return [
+        Report(job_id=f'job{i}', submission_id=f'sub{i}', tasks=[[{
+            'i': i
+        }]]) for i in range(n)
+    ]
+
+
+def run_reporter(reporter, reports):
+    reporter.start()
+    for report in reports:
+        reporter.report(report)
+    reporter.stop()
+    reporter.join(timeout=5)
+    assert not reporter.is_alive()
+
+
+def test_coalesce_into_bulk_request(cleaned):
+    with BackendStub() as backend:
+        reporter = ResultReporter(
+            base_url=backend.url,
+            batch_size=3,
+            flush_interval=1,
+        )
+        run_reporter(reporter, make_reports(5))
+    paths = [path for _, path, _ in backend.requests]
+    assert paths == ['/submission/complete'] * 2
+    assert [len(body['submissions'])
+            for *_, body in backend.requests] == [3, 2]
+    assert backend.completed == {f'sub{i}': [[{'i': i}]] for i in range(5)}
+    assert sorted(cleaned) == [('clean', f'job{i}') for i in range(5)]
+
+
+def test_flush_interval_bounds_delay(cleaned):
+    with BackendStub() as backend:
+        reporter = ResultReporter(
+            base_url=backend.url,
+            batch_size=100,
+            flush_interval=0.05,
+        )
+        reporter.start()
+        reporter.report(make_report())
+        # the lone report is sent once the window closes
+        for _ in range(100):
+            if 'sub' in backend.completed:
+                break
+            time.sleep(0.02)
+        assert backend.completed == {'sub': [[{'a': 1}]]}
+        assert backend.requests[0][1] == '/submission/sub/complete'
+        reporter.stop()
+        reporter.join(timeout=5)
+
+
+def test_fall_back_without_bulk_endpoint(cleaned):
+    with BackendStub(bulk=False) as backend:
+        reporter = ResultReporter(
+            base_url=backend.url,
+            batch_size=2,
+            flush_interval=1,
+        )
+        run_reporter(reporter, make_reports(4))
+    paths = [path for _, path, _ in backend.requests]
+    # only the first batch probes the bulk endpoint
+    assert paths == [
+        '/submission/complete',
+        '/submission/sub0/complete',
+        '/submission/sub1/complete',
+        '/submission/sub2/complete',
+        '/submission/sub3/complete',
+    ]
+    assert not reporter.bulk_supported
+    assert len(backend.completed) == 4
+    assert sorted(cleaned) == [('clean', f'job{i}') for i in range(4)]
+
+
+def test_rejected_bulk_falls_back_per_job(cleaned):
+    with BackendStub() as backend:
+        # the bulk request, then the first job on its own
+        backend.failures += [400, 400]
+        reporter = ResultReporter(
+            base_url=backend.url,
+            batch_size=2,
+            flush_interval=1,
+        )
+        run_reporter(reporter, make_reports(2))
+    assert reporter.bulk_supported
+    paths = [path for _, path, _ in backend.requests]
+    assert paths == [
+        '/submission/complete',
+        '/submission/sub0/complete',
+        '/submission/sub1/complete',
+    ]
+    # only the rejected job is lost
+    assert backend.completed == {'sub1': [[{'i': 1}]]}
+    assert sorted(cleaned) == [('backup', 'job0'), ('clean', 'job1')]
+
+
+def test_unreachable_backend_backs_up_every_job(cleaned):
+    reporter, _ = make_reporter(
+        [requests.ConnectionError('down')] * 2,
+        batch_size=2,
+        flush_interval=1,
+        max_retries=1,
+    )
+    run_reporter(reporter, make_reports(2))
+    # no upload one by one after the bulk one never got through
+    assert len(reporter.session.calls) == 2
+    assert sorted(cleaned) == [('backup', 'job0'), ('backup', 'job1')]
+
+
+def test_job_without_directory_is_reported(tmp_path, monkeypatch, caplog):
+    # a submission rejected before it was extracted
+    monkeypatch.setattr('dispatcher.config.SUBMISSION_DIR', tmp_path)
+    reporter, _ = make_reporter([200])
+    reporter.flush([make_report()])
+    assert len(reporter.session.calls) == 1
+    assert 'fail to clean' not in caplog.text
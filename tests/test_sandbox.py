@@ -0,0 +1,204 @@
+import io
+import tarfile
+
+import pytest
+
+from executor.sandbox import CONTAINER_SECONDS, BatchCase, Sandbox
+
+
+def make_archive(files: dict) -> bytes:
+    buf = io.BytesIO()
+    with tarfile.open(fileobj=buf, mode='w') as tar:
+        for name, content in files.items():
+            data = content.encode()
+            info = tarfile.TarInfo(f'result/{name}')
+            info.size = len(data)
+            tar.addfile(info, io.BytesIO(data))
+    return buf.getvalue()
+
+
+class ArchiveClient:
+    '''
+    docker client whose containers exit at once and leave `files` in
+    `/result`
+    '''
+    files = {}
+
+    def __init__(self):
+        self.commands = []
+        self.removed = []
+
+    def create_host_config(self, **kwargs):
+        return kwargs
+
+    def create_container(self, **kwargs):
+        self.commands.append(kwargs['command'])
+        return {'Id': 'c0'}
+
+    def start(self, container):
+        pass
+
+    def wait(self, container, timeout=None):
+        return {'StatusCode': 0}
+
+    def get_archive(self, container, path):
+        data = make_archive(self.files)
+        # docker streams the archive in chunks
+        return (data[i:i + 512] for i in range(0, len(data), 512)), {}
+
+    def remove_container(self, container, v=False, force=False):
+        self.removed.append(container)
+
+
+@pytest.fixture
+def archive_client(monkeypatch):
+
+    class Client(ArchiveClient):
+        files = {}
+
+    monkeypatch.setattr('executor.sandbox.get_client', lambda url: Client())
+    return Client
+
+
+def make_sandbox(**kwargs):
+    params = dict(
+        time_limit=1000,
+        mem_limit=65536,
+        image='noj-py3',
+        src_dir='/work/job/src',
+        lang_id=2,
+        compile_need=False,
+        stdin_path='/work/job/testcase/0000.in',
+    )
+    params.update(kwargs)
+    return Sandbox(**params)
+
+
+def test_run_reads_result(archive_client):
+    archive_client.files = {
+        'result': 'AC\nExited Normally\n12\n345\n',
+        'stdout': 'hello\n',
+        'stderr': '',
+    }
+    sandbox = make_sandbox()
+    result = sandbox.run()
+    assert result.Status == 'AC'
+    assert result.Duration == 12
+    assert result.MemUsage == 345
+    assert result.Stdout == 'hello\n'
+    assert sandbox.client.removed == [{'Id': 'c0'}]
+
+
+def test_run_batch_drives_every_case(archive_client):
+    archive_client.files = {
+        '0000/result': 'AC\nExited Normally\n1\n2\n',
+        '0000/stdout': 'a\n',
+        '0000/stderr': '',
+        # 0100 left no result file
+        '0100/stdout': '',
+        '0100/stderr': '',
+    }
+    sandbox = make_sandbox(stdin_path='/work/job/testcase')
+    results = sandbox.run_batch([
+        BatchCase('0000', time_limit=1000, mem_limit=1024),
+        BatchCase('0100', time_limit=2000, mem_limit=2048),
+    ])
+    assert results['0000'].Stdout == 'a\n'
+    assert results['0100'] is None
+    # a single container with per case limits
+    [command] = sandbox.client.commands
+    script = command[-1]
+    assert '/testcase/0000.in /result/0000/stdout' in script
+    assert ' 1000 1024 ' in script
+    assert ' 2000 2048 ' in script
+
+
+def test_result_files_are_capped(archive_client):
+    archive_client.files = {
+        'result': 'AC\nExited Normally\n1\n2\n',
+        'stdout': 'x' * 5000,
+        'stderr': 'err\r\n',
+        # not asked for, never kept
+        'other': 'y' * 5000,
+    }
+    sandbox = make_sandbox()
+    sandbox.result_max_bytes = 1000
+    (result, stdout, stderr, other), truncated = sandbox.get_result(
+        'c0',
+        ['result', 'stdout', 'stderr', 'missing'],
+    )
+    assert result.startswith('AC\n')
+    assert stdout == 'x' * 1000
+    # same newline handling as reading the file in text mode
+    assert stderr == 'err\n'
+    assert other is None
+    assert truncated == {'stdout'}
+
+
+@pytest.mark.parametrize(
+    'status, judged',
+    [
+        ('AC', 'OLE'),
+        # stopped by a limit, the output is not judged anyway
+        ('TLE', 'TLE'),
+    ],
+)
+def test_truncated_stdout_is_not_judged(archive_client, status, judged):
+    archive_client.files = {
+        'result': f'{status}\nExited Normally\n1\n2\n',
+        'stdout': 'x' * 5000,
+        'stderr': 'e' * 5000,
+    }
+    sandbox = make_sandbox()
+    sandbox.result_max_bytes = 1000
+    result = sandbox.run()
+    assert result.Status == judged
+    # stderr is only cut
+    assert result.Stderr == 'e' * 1000
+
+
+def test_truncated_stdout_of_batch_case(archive_client):
+    archive_client.files = {
+        '0000/result': 'AC\nExited Normally\n1\n2\n',
+        '0000/stdout': 'x' * 5000,
+        '0000/stderr': '',
+        '0001/result': 'AC\nExited Normally\n1\n2\n',
+        '0001/stdout': 'x' * 10,
+        '0001/stderr': '',
+    }
+    sandbox = make_sandbox(stdin_path='/work/job/testcase-in')
+    sandbox.result_max_bytes = 1000
+    results = sandbox.run_batch([
+        BatchCase('0000', time_limit=1000, mem_limit=1024),
+        BatchCase('0001', time_limit=1000, mem_limit=1024),
+    ])
+    assert results['0000'].Status == 'OLE'
+    assert results['0001'].Status == 'AC'
+
+
+def test_result_never_touches_disk(archive_client, monkeypatch):
+
+    def fail(*args, **kwargs):
+        raise AssertionError('result written to disk')
+
+    monkeypatch.setattr('tempfile.NamedTemporaryFile', fail)
+    monkeypatch.setattr('tempfile.TemporaryDirectory', fail)
+    archive_client.files = {
+        'result': 'AC\nExited Normally\n1\n2\n',
+        'stdout': 'out',
+        'stderr': '',
+    }
+    assert make_sandbox().run().Stdout == 'out'
+
+
+def test_container_phases_are_timed(archive_client):
+    archive_client.files = {
+        'result': 'AC\nExited Normally\n1\n1\n',
+        'stdout': '',
+        'stderr': '',
+    }
+    phases = ('create', 'start', 'wait', 'get_archive', 'remove')
+    before = {phase: CONTAINER_SECONDS.count(phase=phase) for phase in phases}
+    make_sandbox().run()
+    for phase in phases:
+        assert CONTAINER_SECONDS.count(phase=phase) == before[phase] + 1
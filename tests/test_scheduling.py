@@ -0,0 +1,143 @@
+import json
+import random
+
+import pytest
+
+from benchmarks import scheduling
+from benchmarks.scheduling import Config, Durations, Simulation, Submission
+
+DURATIONS = Durations(
+    compile=scheduling.Exponential(1),
+    setup=scheduling.Exponential(0),
+    run=scheduling.Exponential(1),
+)
+
+
+def submission(cases=1, arrival=0.0, compile_time=None, compile_ok=True):
+    return Submission(
+        arrival=arrival,
+        compiled=compile_time is not None,
+        cases=cases,
+        compile_time=compile_time or 0.0,
+        compile_ok=compile_ok,
+        setups=[0.0] * cases,
+        runs=[1.0] * cases,
+    )
+
+
+def simulate(submissions, **config):
+    config.setdefault('queue_size', 0)
+    config.setdefault('containers', 1)
+    return Simulation(Config(**config), submissions, DURATIONS).run()
+
+
+def test_cases_share_slots_in_order():
+    stats = simulate([submission(), submission()])
+    assert stats['latencies'] == [1.0, 2.0]
+    assert stats['waits'] == [0.0, 1.0]
+    assert stats['utilization'] == 1.0
+
+
+def test_full_queue_rejects_submission():
+    # the loop runs the first case and holds the second one
+    stats = simulate(
+        [submission(), submission(cases=2),
+         submission(cases=2)],
+        queue_size=2,
+    )
+    assert stats['rejected'] == 1
+    assert stats['completed'] == 2
+    # the case queued before the queue was full is discarded
+    assert stats['makespan'] == 3.0
+
+
+def test_blocked_loop_delays_compile():
+    # the loop holds the second case until the first frees the slot, the
+    # compile queued behind it only starts then
+    stats = simulate([
+        submission(cases=2),
+        submission(compile_time=0.5),
+    ])
+    assert stats['latencies'] == [2.0, 3.0]
+
+
+def test_compile_error_takes_no_container():
+    stats = simulate([submission(cases=3, compile_time=1, compile_ok=False)])
+    assert stats['latencies'] == [1.0]
+    assert stats['waits'] == []
+
+
+def test_batch_runs_cases_in_one_container():
+    stats = simulate([submission(cases=3), submission()], batch=True)
+    assert stats['latencies'] == [3.0, 4.0]
+    assert stats['waits'] == [0.0, 0.0, 0.0, 3.0]
+
+
+@pytest.mark.parametrize(
+    'policy, latency',
+    [
+        ('fifo', 4.0),
+        # the short submission goes before the last case of the long one,
+        # the second case is held by the loop already
+        ('fair', 3.0),
+        ('sjf', 3.0),
+    ],
+)
+def test_policy_picks_next_job(policy, latency):
+    stats = simulate([submission(cases=3), submission()], policy=policy)
+    assert stats['latencies'][1] == latency
+
+
+def test_stale_job_is_dropped():
+    stats = Simulation(
+        Config(queue_size=0, containers=1),
+        [submission(cases=3)],
+        DURATIONS,
+        timeout=0.5,
+    ).run()
+    assert stats['timedOut'] == 1
+    assert stats['completed'] == 0
+
+
+def test_fit_metrics(tmp_path):
+    path = tmp_path / 'metrics'
+    path.write_text('\n'.join([
+        '# TYPE sandbox_compile_seconds histogram',
+        'sandbox_compile_seconds_bucket{cache="miss",le="1"} 0',
+        'sandbox_compile_seconds_bucket{cache="miss",le="2"} 4',
+        'sandbox_compile_seconds_bucket{cache="miss",le="+Inf"} 4',
+        'sandbox_container_phase_seconds_bucket{phase="wait",le="0.5"} 2',
+        'sandbox_container_phase_seconds_bucket{phase="wait",le="+Inf"} 2',
+    ]))
+    durations = scheduling.durations_from_metrics(path, DURATIONS)
+    rng = random.Random(0)
+    assert all(1 <= durations.compile.sample(rng) <= 2 for _ in range(20))
+    assert durations.compile.mean == 1.5
+    assert durations.run.mean == 0.25
+    # no container step around the cases was observed
+    assert durations.setup is DURATIONS.setup
+
+
+def test_fit_trace(tmp_path):
+    path = tmp_path / 'trace.jsonl'
+    spans = [
+        ('c', None, 'compile', 0, 2),
+        ('e', None, 'execute', 0, 1),
+        ('w', 'e', 'container.wait', 0.2, 0.7),
+        ('x', 'e', 'compare', 0.8, 0.9),
+        ('b', None, 'execute_batch', 0, 3),
+        ('v', 'b', 'container.wait', 0.5, 2.5),
+    ]
+    path.write_text(''.join(
+        json.dumps({
+            'spanId': span_id,
+            'parentId': parent_id,
+            'name': name,
+            'start': start,
+            'end': end,
+        }) + '\n' for span_id, parent_id, name, start, end in spans))
+    durations = scheduling.durations_from_trace(path, DURATIONS)
+    assert durations.compile.values == [2]
+    assert durations.setup.values == pytest.approx([0.4, 1.0])
+    # the run of a single case only
+    assert durations.run.values == pytest.approx([0.6])
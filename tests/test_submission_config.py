@@ -0,0 +1,101 @@
+import json
+import threading
+
+import pytest
+
+from executor import client as docker_client
+from executor.config import (
+    OUTPUT_LIMIT,
+    SubmissionConfig,
+    clear_config_cache,
+    load_config,
+)
+
+
+def make_config(**kwargs):
+    data = {
+        'working_dir': '/work',
+        'docker_url': 'unix://var/run/docker.sock',
+        'lang_id': {
+            'c11': 0,
+            'python3': 2
+        },
+        'image': {
+            'c11': 'noj-c-cpp',
+            'python3': 'noj-py3'
+        },
+    }
+    data.update(kwargs)
+    return data
+
+
+@pytest.fixture
+def config_path(tmp_path):
+    path = tmp_path / 'submission.json'
+    path.write_text(json.dumps(make_config()))
+    clear_config_cache()
+    yield path
+    clear_config_cache()
+
+
+def test_load_once(config_path):
+    config = load_config(config_path)
+    assert config.image['python3'] == 'noj-py3'
+    assert config.container_pool == {}
+    # later edits are not read until the cache is cleared
+    config_path.write_text(json.dumps(make_config(working_dir='/other')))
+    assert load_config(config_path) is config
+    clear_config_cache()
+    assert load_config(config_path).working_dir == '/other'
+
+
+@pytest.mark.parametrize('data', [
+    make_config(working_dir=None),
+    make_config(docker_url=1),
+    make_config(image={'c11': 'noj-c-cpp'}),
+    make_config(lang_id={
+        'c11': '0',
+        'python3': 2
+    }),
+    make_config(container_pool=[]),
+    make_config(result_max_bytes='1'),
+])
+def test_invalid_config(data):
+    with pytest.raises(ValueError):
+        SubmissionConfig.from_dict(data)
+
+
+def test_client_shared_between_threads(monkeypatch):
+
+    class Client:
+
+        def __init__(self, base_url, max_pool_size):
+            self.base_url = base_url
+
+        def close(self):
+            pass
+
+    monkeypatch.setattr('executor.client.docker.APIClient', Client)
+    monkeypatch.setattr('executor.client._clients', {})
+    clients = []
+    threads = [
+        threading.Thread(
+            target=lambda: clients.append(docker_client.get_client('a')))
+        for _ in range(8)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len({id(client) for client in clients}) == 1
+    assert docker_client.get_client('b') is not clients[0]
+
+
+def test_result_max_bytes():
+    # any output the sandbox allows is read in full
+    config = SubmissionConfig.from_dict(make_config())
+    assert config.result_max_bytes == OUTPUT_LIMIT
+    config = SubmissionConfig.from_dict(make_config(result_max_bytes=10))
+    assert config.result_max_bytes == 10
+    with pytest.raises(ValueError):
+        SubmissionConfig.from_dict(make_config(result_max_bytes=0))
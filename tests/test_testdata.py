@@ -0,0 +1,387 @@
+import io
+import json
+import threading
+from zipfile import ZipFile
+
+import fakeredis
+import pytest
+
+from dispatcher import testdata
+from dispatcher.constant import Language
+from dispatcher import testdata_store
+from executor.compare import decode, output_digest, read_chunks
+from tests.backend_stub import BackendStub
+
+
+@pytest.fixture
+def testdata_root(tmp_path, monkeypatch):
+    monkeypatch.setattr(testdata, 'TESTDATA_ROOT', tmp_path)
+    monkeypatch.setattr(testdata, 'META_DIR', tmp_path / 'meta')
+    monkeypatch.setattr(testdata, 'VERSION_DIR', tmp_path / '.versions')
+    monkeypatch.setattr(
+        testdata,
+        'TESTDATA_STORE',
+        testdata_store.TestdataStore(0, evict=testdata.remove_problem),
+    )
+    (tmp_path / 'meta').mkdir()
+    (tmp_path / '.versions').mkdir()
+    return tmp_path
+
+
+def make_zip(files: dict) -> bytes:
+    buf = io.BytesIO()
+    with ZipFile(buf, 'w') as zf:
+        for name, content in files.items():
+            zf.writestr(name, content)
+    return buf.getvalue()
+
+
+META = {
+    'tasks': [{
+        'taskScore': 100,
+        'memoryLimit': 65536,
+        'timeLimit': 1000,
+        'caseCount': 1,
+    }],
+}
+
+
+@pytest.fixture
+def backend_stub(testdata_root, monkeypatch):
+    with BackendStub() as backend:
+        monkeypatch.setattr(testdata, 'BACKEND_API', backend.url)
+        yield backend
+
+
+def test_build_digest_index(tmp_path):
+    problem_root = tmp_path / '7'
+    problem_root.mkdir()
+    (problem_root / '0000.in').write_text('1 2\n')
+    (problem_root / '0000.out').write_text('3  \n\n')
+    (problem_root / '0001.out').write_text('')
+    index_path = tmp_path / 'digest.json'
+    testdata.build_digest_index(problem_root, index_path, 'checksum')
+    index = json.loads(index_path.read_text())
+    assert index['checksum'] == 'checksum'
+    assert index['cases'] == {
+        '0000': output_digest(['3']),
+        '0001': output_digest([]),
+    }
+    assert index['cases']['0000'] == output_digest(
+        decode(read_chunks(problem_root / '0000.out')))
+    # written atomically, no temporary file left
+    assert sorted(p.name for p in tmp_path.iterdir()) == ['7', 'digest.json']
+
+
+def test_refresh_switches_version(backend_stub):
+    backend_stub.add_problem(1, make_zip({'0000.out': '1\n'}), META)
+    checksum = testdata.refresh_testdata(1)
+    assert checksum == backend_stub.problems[1]['checksum']
+    root = testdata.get_problem_root(1)
+    assert root.is_symlink()
+    assert (root / '0000.out').read_text() == '1\n'
+    with testdata.pin_testdata(1) as old:
+        index = json.loads(old.digest.read_text())
+        assert index['cases'] == {'0000': output_digest(['1'])}
+        backend_stub.add_problem(1, make_zip({'0000.out': '2\n'}), META)
+        testdata.refresh_testdata(1)
+        assert (root / '0000.out').read_text() == '2\n'
+        # a pinned version stays until it is released
+        assert (old.root / '0000.out').read_text() == '1\n'
+    assert not old.root.exists()
+    versions = [*(testdata.VERSION_DIR / '1').iterdir()]
+    assert versions == [root.resolve().parent]
+
+
+def test_meta_cache_evicts_least_recently_used():
+    cache = testdata.MetaCache(max_size=2)
+    loads = []
+
+    def load(meta):
+        return lambda: loads.append(meta) or meta
+
+    a, b, c = (object() for _ in range(3))
+    assert cache.get(1, 'x', load(a)) is a
+    assert cache.get(2, 'x', load(b)) is b
+    assert cache.get(1, 'x', load(None)) is a
+    assert cache.get(3, 'x', load(c)) is c
+    # 2 was the least recently used
+    assert cache.get(2, 'x', load(b)) is b
+    assert loads == [a, b, c, b]
+    assert (cache.hits, cache.misses) == (1, 4)
+    # a new checksum is a new entry
+    assert cache.get(3, 'y', load(a)) is a
+
+
+def test_meta_of_pinned_version_is_parsed_once(backend_stub, monkeypatch):
+    monkeypatch.setattr(testdata, 'META_CACHE', testdata.MetaCache(8))
+    backend_stub.add_problem(1, make_zip({'0000.out': '1\n'}), META)
+    checksum = testdata.refresh_testdata(1)
+    with testdata.pin_testdata(1) as pinned:
+        assert pinned.checksum == checksum
+        c = testdata.get_problem_meta(1, Language.C, pinned)
+        # served from memory, even if the file is gone
+        pinned.meta.unlink()
+        assert testdata.get_problem_meta(1, Language.C, pinned) is c
+        py = testdata.get_problem_meta(1, Language.PY, pinned)
+    assert c.language == Language.C
+    assert py.language == Language.PY
+    assert py.tasks == c.tasks
+    assert testdata.META_CACHE.misses == 1
+
+
+def test_refresh_only_writes_changed_files(backend_stub):
+    backend_stub.add_problem(
+        1,
+        make_zip({
+            '0000.in': '1\n',
+            '0000.out': '1\n',
+            '0001.in': '2\n',
+            '0001.out': '2\n',
+        }),
+        META,
+    )
+    testdata.refresh_testdata(1)
+    old = testdata.get_problem_root(1).resolve()
+    old_index = json.loads((old.parent / 'digest.json').read_text())
+    backend_stub.add_problem(
+        1,
+        make_zip({
+            '0000.in': '1\n',
+            '0000.out': '1\n',
+            '0001.in': '3\n',
+            '0001.out': '3\n',
+        }),
+        META,
+    )
+    with testdata.pin_testdata(1) as pinned:
+        testdata.refresh_testdata(1)
+        new = testdata.get_problem_root(1).resolve()
+        # unchanged files are shared with the old version
+        for name in ('0000.in', '0000.out'):
+            assert (new / name).samefile(pinned.root / name)
+        for name in ('0001.in', '0001.out'):
+            assert not (new / name).samefile(pinned.root / name)
+    assert (new / '0001.out').read_text() == '3\n'
+    manifest = testdata.read_manifest(new.parent)
+    assert sorted(manifest) == ['0000.in', '0000.out', '0001.in', '0001.out']
+    index = json.loads((new.parent / 'digest.json').read_text())
+    assert index['cases'] == {
+        '0000': old_index['cases']['0000'],
+        '0001': output_digest(['3']),
+    }
+
+
+def test_refresh_drops_removed_files(backend_stub):
+    backend_stub.add_problem(
+        1,
+        make_zip({
+            '0000.out': '1\n',
+            '0001.out': '2\n',
+        }),
+        META,
+    )
+    testdata.refresh_testdata(1)
+    backend_stub.add_problem(1, make_zip({'0000.out': '1\n'}), META)
+    testdata.refresh_testdata(1)
+    root = testdata.get_problem_root(1)
+    assert sorted(p.name for p in root.iterdir()) == ['0000.out']
+    index = json.loads((root.resolve().parent / 'digest.json').read_text())
+    assert sorted(index['cases']) == ['0000']
+
+
+def test_cold_problems_are_evicted(backend_stub):
+    for problem_id in (1, 2, 3):
+        backend_stub.add_problem(
+            problem_id,
+            make_zip({'0000.out': '1234\n'}),
+            META,
+        )
+    testdata.TESTDATA_STORE.max_size = 1 << 20
+    testdata.refresh_testdata(1)
+    # room for two problems
+    size = testdata.TESTDATA_STORE.stats()['size']
+    testdata.TESTDATA_STORE.max_size = 2 * size
+    testdata.refresh_testdata(2)
+    with testdata.pin_testdata(1):
+        # 1 is in use, 2 goes instead
+        testdata.refresh_testdata(3)
+    assert not testdata.get_problem_root(2).exists()
+    assert not (testdata.VERSION_DIR / '2').exists()
+    with pytest.raises(testdata.TestdataNotFound):
+        with testdata.pin_testdata(2):
+            pass
+    assert testdata.get_problem_root(1).is_symlink()
+    usage = testdata.TESTDATA_STORE.usage()
+    assert [u['problemId'] for u in usage] == [1, 3]
+    # 1 is the coldest now
+    testdata.refresh_testdata(2)
+    assert not testdata.get_problem_root(1).exists()
+    assert testdata.TESTDATA_STORE.stats()['evictions'] == 2
+
+
+def test_store_is_rebuilt_from_disk(backend_stub):
+    testdata.TESTDATA_STORE.max_size = 1 << 20
+    backend_stub.add_problem(1, make_zip({'0000.out': '1\n'}), META)
+    testdata.refresh_testdata(1)
+    size = testdata.TESTDATA_STORE.stats()['size']
+    store = testdata_store.TestdataStore(1 << 20,
+                                         evict=testdata.remove_problem)
+    testdata.scan_store(store)
+    assert [u['problemId'] for u in store.usage()] == [1]
+    assert store.stats()['size'] == size > 0
+
+
+def test_disabled_store_skips_size(backend_stub, monkeypatch):
+    backend_stub.add_problem(1, make_zip({'0000.out': '1\n'}), META)
+
+    def dir_size(path):
+        raise AssertionError('walked without a budget')
+
+    monkeypatch.setattr(testdata, 'dir_size', dir_size)
+    testdata.refresh_testdata(1)
+    assert testdata.TESTDATA_STORE.stats()['problems'] == 0
+
+
+def test_refresh_replaces_legacy_directory(backend_stub):
+    legacy = testdata.get_problem_root(1)
+    legacy.mkdir()
+    (legacy / '0000.out').write_text('old\n')
+    backend_stub.add_problem(1, make_zip({'0000.out': 'new\n'}), META)
+    testdata.refresh_testdata(1)
+    assert legacy.is_symlink()
+    assert (legacy / '0000.out').read_text() == 'new\n'
+
+
+def test_refresh_of_missing_problem(backend_stub):
+    with pytest.raises(ValueError):
+        testdata.refresh_testdata(404)
+    assert not testdata.get_problem_root(404).exists()
+
+
+class Clock:
+
+    def __init__(self):
+        self.now = 0
+
+    def __call__(self):
+        return self.now
+
+
+def test_cache_skips_checks_within_ttl():
+    clock = Clock()
+    cache = testdata.ChecksumCache(ttl=10, clock=clock)
+    checks = []
+    for _ in range(3):
+        cache.ensure(1, lambda: checks.append(1))
+    assert len(checks) == 1
+    clock.now = 11
+    cache.ensure(1, lambda: checks.append(1))
+    cache.ensure(2, lambda: checks.append(2))
+    assert checks == [1, 1, 2]
+    cache.forget(2)
+    cache.ensure(2, lambda: checks.append(2))
+    assert checks == [1, 1, 2, 2]
+
+
+def test_concurrent_calls_share_one_check():
+    cache = testdata.ChecksumCache(ttl=10)
+    started = threading.Event()
+    release = threading.Event()
+    checks = []
+
+    def check():
+        checks.append(threading.current_thread().name)
+        started.set()
+        release.wait()
+
+    threads = [
+        threading.Thread(target=cache.ensure, args=(1, check))
+        for _ in range(8)
+    ]
+    threads[0].start()
+    started.wait()
+    for thread in threads[1:]:
+        thread.start()
+    release.set()
+    for thread in threads:
+        thread.join(timeout=5)
+    assert len(checks) == 1
+
+
+def test_failed_check_is_shared_but_not_cached():
+    cache = testdata.ChecksumCache(ttl=10)
+    started = threading.Event()
+    release = threading.Event()
+    errors = []
+
+    def check():
+        started.set()
+        release.wait()
+        raise ValueError('Problem not found')
+
+    def ensure():
+        try:
+            cache.ensure(1, check)
+        except ValueError as e:
+            errors.append(e)
+
+    leader = threading.Thread(target=ensure)
+    leader.start()
+    started.wait()
+    follower = threading.Thread(target=ensure)
+    follower.start()
+    release.set()
+    leader.join(timeout=5)
+    follower.join(timeout=5)
+    assert len(errors) == 2
+    # the next call checks again
+    cache.ensure(1, lambda: None)
+
+
+@pytest.fixture
+def backend(testdata_root, monkeypatch):
+    client = fakeredis.FakeStrictRedis()
+    calls = {'checksum': 0, 'refresh': 0, 'locks': 0}
+    # redis locks of fakeredis need lua
+    lock = threading.Lock()
+
+    def counted_lock(*args, **kwargs):
+        calls['locks'] += 1
+        return lock
+
+    def get_checksum(problem_id):
+        calls['checksum'] += 1
+        return 'v2'
+
+    def refresh_testdata(problem_id):
+        calls['refresh'] += 1
+        return 'v2'
+
+    monkeypatch.setattr(client, 'lock', counted_lock)
+    monkeypatch.setattr(testdata, 'get_redis_client', lambda: client)
+    monkeypatch.setattr(testdata, 'get_checksum', get_checksum)
+    monkeypatch.setattr(testdata, 'refresh_testdata', refresh_testdata)
+    monkeypatch.setattr(testdata, 'CHECKSUM_CACHE',
+                        testdata.ChecksumCache(ttl=10))
+    # an extracted version
+    version = testdata_root / '.versions' / '1' / 'v'
+    (version / 'testdata').mkdir(parents=True)
+    testdata.switch_version(1, version)
+    return client, calls
+
+
+def test_up_to_date_testdata_takes_no_lock(backend):
+    client, calls = backend
+    client.set('problem-1-checksum', 'v2')
+    for _ in range(5):
+        testdata.ensure_testdata(1)
+    assert calls == {'checksum': 1, 'refresh': 0, 'locks': 0}
+
+
+def test_stale_testdata_is_refreshed_under_lock(backend):
+    client, calls = backend
+    client.set('problem-1-checksum', 'v1')
+    testdata.ensure_testdata(1)
+    assert calls == {'checksum': 1, 'refresh': 1, 'locks': 1}
+    assert client.get('problem-1-checksum') == b'v2'
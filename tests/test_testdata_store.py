@@ -0,0 +1,63 @@
+from dispatcher import testdata_store
+
+
+class Clock:
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        self.now += 1
+        return self.now
+
+
+def make_store(max_size: int, busy=()):
+    removed = []
+
+    def evict(problem_id):
+        if problem_id in busy:
+            return False
+        removed.append(problem_id)
+        return True
+
+    return testdata_store.TestdataStore(max_size, evict=evict,
+                                        clock=Clock()), removed
+
+
+def test_evicts_least_recently_used():
+    store, removed = make_store(max_size=25)
+    for problem_id in (1, 2, 3):
+        store.add(problem_id, 10)
+    store.touch(1)
+    assert store.evict() == [2]
+    assert removed == [2]
+    assert [u['problemId'] for u in store.usage()] == [3, 1]
+    stats = store.stats()
+    assert (stats['problems'], stats['size']) == (2, 20)
+    assert stats['evictions'] == 1
+
+
+def test_keeps_busy_and_kept_problems():
+    store, removed = make_store(max_size=10, busy={1})
+    for problem_id in (1, 2, 3):
+        store.add(problem_id, 10)
+    assert store.evict(keep=2) == [3]
+    assert removed == [3]
+    # still over budget, but nothing else may go
+    assert store.stats()['size'] == 20
+
+
+def test_replaced_version_updates_size():
+    store, removed = make_store(max_size=15)
+    store.add(1, 10)
+    store.add(1, 5)
+    store.add(2, 10)
+    assert store.evict() == []
+    assert store.stats()['size'] == 15
+
+
+def test_disabled_store_keeps_everything():
+    store, removed = make_store(max_size=0)
+    store.add(1, 1 << 40)
+    assert store.evict() == []
+    assert removed == []
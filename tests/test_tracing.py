@@ -0,0 +1,84 @@
+import json
+import threading
+
+import pytest
+
+from telemetry import tracing
+
+
+def test_disabled_tracing_records_nothing():
+    with tracing.span('submit') as span:
+        assert span is None
+        assert tracing.current() is None
+
+
+def test_spans_nest_in_one_trace(trace_sink):
+    with tracing.span('submit', submission_id='s') as root:
+        with tracing.span('extract'):
+            pass
+        context = tracing.current()
+    # finished children come first
+    extract, submit = trace_sink.spans
+    assert submit['parentId'] is None
+    assert submit['attributes'] == {'submission_id': 's'}
+    assert extract['traceId'] == submit['traceId'] == root.context.trace_id
+    assert extract['parentId'] == submit['spanId'] == context.span_id
+    assert submit['start'] <= extract['start'] <= extract['end'] \
+        <= submit['end']
+    assert tracing.current() is None
+
+
+def test_context_is_passed_to_other_threads(trace_sink):
+    with tracing.span('submit'):
+        context = tracing.current()
+
+    def work():
+        with tracing.span('compile', parent=context):
+            with tracing.span('container.create'):
+                pass
+
+    thread = threading.Thread(target=work)
+    thread.start()
+    thread.join()
+    submit, create, compile_ = trace_sink.spans
+    assert create['parentId'] == compile_['spanId']
+    assert compile_['parentId'] == submit['spanId']
+    assert {s['traceId'] for s in trace_sink.spans} == {submit['traceId']}
+
+
+def test_failed_span_is_recorded(trace_sink):
+    with pytest.raises(RuntimeError):
+        with tracing.span('compile'):
+            raise RuntimeError('boom')
+    span, = trace_sink.spans
+    assert span['status'] == 'error'
+    assert span['error'] == "RuntimeError('boom')"
+
+
+def test_record_needs_a_parent(trace_sink):
+    tracing.record('queue.wait', 1.0, 2.0, None)
+    assert trace_sink.spans == []
+    with tracing.activate(tracing.SpanContext('t', 'p')):
+        with tracing.span('extract'):
+            pass
+        tracing.record('queue.wait', 1.0, 2.0, tracing.current(), kind='x')
+    extract, wait = trace_sink.spans
+    assert extract['traceId'] == wait['traceId'] == 't'
+    assert wait['parentId'] == 'p'
+    assert (wait['start'], wait['end']) == (1.0, 2.0)
+
+
+def test_jsonl_sink(tmp_path):
+    path = tmp_path / 'trace.jsonl'
+    tracing.set_sink(tracing.JsonlSink(path))
+    try:
+        for name in ('submit', 'extract'):
+            with tracing.span(name):
+                pass
+    finally:
+        tracing.set_sink(None)
+    lines = path.read_text().splitlines()
+    assert [json.loads(line)['name'] for line in lines] == [
+        'submit',
+        'extract',
+    ]